@@ -67,79 +67,111 @@ document.addEventListener('DOMContentLoaded', () => {
     };
 
     // --- API 调用封装 ---
+    // 配置版本 (ETag)：修改类请求带上 If-Match，服务端发现配置已被其他标签页/脚本修改时返回 412
+    let configEtag = null;
+
+    const rememberEtag = (response) => {
+        const etag = response.headers.get('ETag');
+        if (etag) configEtag = etag;
+    };
+
+    const jsonHeaders = () => {
+        const headers = { 'Content-Type': 'application/json' };
+        if (configEtag) headers['If-Match'] = configEtag;
+        return headers;
+    };
+
+    const ifMatchHeaders = () => (configEtag ? { 'If-Match': configEtag } : {});
+
+    const checkResponse = async (response, fallbackMessage) => {
+        if (response.status === 412) {
+            const error = new Error('配置已被其他页面或脚本修改，请刷新后重试');
+            error.conflict = true;
+            throw error;
+        }
+        if (!response.ok) {
+            const err = await response.json();
+            throw new Error(err.detail || fallbackMessage);
+        }
+        rememberEtag(response);
+        return await response.json();
+    };
+
     const api = {
-        getConfig: async () => {
-            const response = await fetch(`${API_BASE_URL}/config`);
+        // onlyIfChanged: 带上 If-None-Match，配置未变化时返回 null (304)
+        getConfig: async ({ onlyIfChanged = false } = {}) => {
+            const headers = (onlyIfChanged && configEtag) ? { 'If-None-Match': configEtag } : {};
+            const response = await fetch(`${API_BASE_URL}/config`, { headers, cache: 'no-store' });
+            if (response.status === 304) return null;
             if (!response.ok) throw new Error(`无法加载配置: ${response.statusText}`);
+            rememberEtag(response);
             return await response.json();
         },
         updateConfig: async (configData) => {
              const response = await fetch(`${API_BASE_URL}/config`, {
                 method: 'PUT',
-                headers: { 'Content-Type': 'application/json' },
+                headers: jsonHeaders(),
                 body: JSON.stringify(configData),
             });
-            if (!response.ok) {
-                const err = await response.json();
-                throw new Error(err.detail || '保存排序失败');
-            }
-            return await response.json();
+            return await checkResponse(response, '保存排序失败');
         },
         addHost: async (hostData) => {
             const response = await fetch(`${API_BASE_URL}/hosts`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: jsonHeaders(),
                 body: JSON.stringify(hostData),
             });
-            if (!response.ok) {
-                const err = await response.json();
-                throw new Error(err.detail || '添加主机失败');
-            }
-            return await response.json();
+            return await checkResponse(response, '添加主机失败');
         },
         deleteHost: async (hostName) => {
             const response = await fetch(`${API_BASE_URL}/hosts/${encodeURIComponent(hostName)}`, {
                 method: 'DELETE',
+                headers: ifMatchHeaders(),
             });
-            if (!response.ok) {
-                const err = await response.json();
-                throw new Error(err.detail || '删除主机失败');
-            }
-            return await response.json();
+            return await checkResponse(response, '删除主机失败');
         },
         addService: async (hostName, serviceData) => {
             const response = await fetch(`${API_BASE_URL}/hosts/${encodeURIComponent(hostName)}/services`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: jsonHeaders(),
                 body: JSON.stringify(serviceData),
             });
-            if (!response.ok) {
-                const err = await response.json();
-                throw new Error(err.detail || '添加服务失败');
-            }
-            return await response.json();
+            return await checkResponse(response, '添加服务失败');
         },
         deleteService: async (hostName, serviceName) => {
             const response = await fetch(`${API_BASE_URL}/hosts/${encodeURIComponent(hostName)}/services/${encodeURIComponent(serviceName)}`, {
                 method: 'DELETE',
+                headers: ifMatchHeaders(),
             });
-            if (!response.ok) {
-                const err = await response.json();
-                throw new Error(err.detail || '删除服务失败');
-            }
-            return await response.json();
+            return await checkResponse(response, '删除服务失败');
         },
         updateService: async (hostName, originalServiceName, serviceData) => {
             const response = await fetch(`${API_BASE_URL}/hosts/${encodeURIComponent(hostName)}/services/${encodeURIComponent(originalServiceName)}`, {
                 method: 'PUT',
-                headers: { 'Content-Type': 'application/json' },
+                headers: jsonHeaders(),
                 body: JSON.stringify(serviceData),
             });
-            if (!response.ok) {
-                const err = await response.json();
-                throw new Error(err.detail || '更新服务失败');
-            }
-            return await response.json();
+            return await checkResponse(response, '更新服务失败');
+        },
+        // refresh: 忽略服务端的缓存，强制重新探测
+        getHostStatus: async ({ refresh = false } = {}) => {
+            const response = await fetch(`${API_BASE_URL}/hosts/status${refresh ? '?refresh=true' : ''}`, { cache: 'no-store' });
+            return await checkResponse(response, '获取主机状态失败');
+        },
+        batchServices: async (operations) => {
+            const response = await fetch(`${API_BASE_URL}/services/batch`, {
+                method: 'POST',
+                headers: jsonHeaders(),
+                body: JSON.stringify(operations),
+            });
+            return await checkResponse(response, '批量添加服务失败');
+        },
+        // 每台主机一次 ssh 列出监听端口；refresh: 忽略服务端的缓存
+        discoverServices: async (hostNames, { refresh = false } = {}) => {
+            const params = new URLSearchParams(hostNames.map(name => ['host', name]));
+            if (refresh) params.set('refresh', 'true');
+            const response = await fetch(`${API_BASE_URL}/hosts/discover?${params}`, { cache: 'no-store' });
+            return await checkResponse(response, '发现远程服务失败');
         }
     };
 
@@ -240,8 +272,10 @@ document.addEventListener('DOMContentLoaded', () => {
             form.querySelector('.serviceName').value = serviceData.serviceName;
             form.querySelector('.remotePort').value = serviceData.remotePort;
             form.querySelector('.localPort').value = serviceData.localPort;
+            form.querySelector('.idleTimeout').value = serviceData.idleTimeout || '';
             form.querySelector('.urlTemplate').value = serviceData.urlTemplate;
             form.querySelector('.autoOpenUrl').checked = serviceData.autoOpenUrl;
+            form.querySelector('.onDemand').checked = !!serviceData.onDemand;
             
             populateKvBuilder(form.querySelector('.login-info-builder'), serviceData.loginInfo);
             
@@ -256,8 +290,10 @@ document.addEventListener('DOMContentLoaded', () => {
                 form.querySelector('.serviceName').value = serviceData.serviceName + " (复制)"; // 预填充复制
                 form.querySelector('.remotePort').value = serviceData.remotePort;
                 form.querySelector('.localPort').value = serviceData.localPort;
+                form.querySelector('.idleTimeout').value = serviceData.idleTimeout || '';
                 form.querySelector('.urlTemplate').value = serviceData.urlTemplate;
                 form.querySelector('.autoOpenUrl').checked = serviceData.autoOpenUrl;
+                form.querySelector('.onDemand').checked = !!serviceData.onDemand;
                 populateKvBuilder(form.querySelector('.login-info-builder'), serviceData.loginInfo);
             }
             
@@ -293,7 +329,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 <div class="service-content">
                     <div class="service-details">
                         <strong>${service.serviceName}</strong>
-                        (L: ${service.localPort} -> R: ${service.remotePort})
+                        (L: ${service.localPort} -> R: ${service.remotePort})${service.idleTimeout ? ` [空闲 ${service.idleTimeout}s 后关闭]` : ''}${service.onDemand ? ' [按需启动]' : ''}
                         <div class="service-url">URL: ${service.urlTemplate || 'N/A'} (AutoOpen: ${service.autoOpenUrl})</div>
                         ${renderLoginInfo(service.loginInfo)}
                     </div>
@@ -307,6 +343,15 @@ document.addEventListener('DOMContentLoaded', () => {
         `;
     };
 
+    const EMPTY_SERVICES_HTML = '<p>暂无服务。请添加一个。</p>';
+    const EMPTY_HOSTS_HTML = '<p>暂无主机配置，请在下方添加一个新主机。</p>';
+
+    const htmlToElement = (html) => {
+        const template = document.createElement('template');
+        template.innerHTML = html.trim();
+        return template.content.firstElementChild;
+    };
+
     // 【修改】渲染单个主机 (添加折叠按钮和默认折叠类)
     const renderHost = (host) => {
         const hostCard = document.createElement('div');
@@ -316,7 +361,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         let servicesHtml = host.services.map(service => renderService(host.hostName, service)).join('');
         if (!host.services || host.services.length === 0) {
-            servicesHtml = '<p>暂无服务。请添加一个。</p>';
+            servicesHtml = EMPTY_SERVICES_HTML;
         }
 
         // 修改：更新 innerHTML 结构，添加折叠按钮
@@ -324,11 +369,12 @@ document.addEventListener('DOMContentLoaded', () => {
             <div class="host-header">
                 <div>
                     <button class="btn btn-icon btn-toggle-host-collapse"></button> 
-                    <h3>${host.hostName}</h3>
-                    <div class="host-meta">${host.sshUser}@${host.serverIP}</div>
+                    <h3>${host.hostName}<span class="host-status" data-state="pending" title="正在探测...">…</span></h3>
+                    <div class="host-meta">${host.sshUser}@${host.serverIP}${host.sshPort && host.sshPort !== 22 ? ':' + host.sshPort : ''}${host.proxyJump ? ` (via ${host.proxyJump})` : ''}${host.transport && host.transport.cipher ? ` [${host.transport.cipher}${host.transport.compression ? ' + 压缩' : ''}]` : ''}</div>
                 </div>
                 <div>
                     <button class="btn btn-primary btn-show-add-service">添加服务</button>
+                    <button class="btn btn-secondary btn-discover-services">发现服务</button>
                     <button class="btn btn-danger btn-delete-host">删除主机</button>
                 </div>
             </div>
@@ -340,24 +386,34 @@ document.addEventListener('DOMContentLoaded', () => {
     };
 
     // 加载并渲染所有配置
-    const loadAndRenderConfig = async () => {
+    // onlyIfChanged: 配置版本未变化 (304) 时保留当前页面，不重新渲染
+    const loadAndRenderConfig = async ({ onlyIfChanged = false } = {}) => {
         showLoading(true);
-        configContent.innerHTML = ''; // 清空
         try {
-            const config = await api.getConfig();
+            const config = await api.getConfig({ onlyIfChanged });
+            if (config === null) return;
             currentConfig = config; // 保存到全局
-            
+            // 整体重新渲染时保留已展开的主机卡片
+            const expandedHosts = new Set(
+                Array.from(configContent.querySelectorAll('.host-card:not(.collapsed)'), card => card.dataset.host)
+            );
+            configContent.innerHTML = ''; // 清空
+
             if (!config.hosts || config.hosts.length === 0) {
-                configContent.innerHTML = '<p>暂无主机配置，请在下方添加一个新主机。</p>';
+                configContent.innerHTML = EMPTY_HOSTS_HTML;
             } else {
+                const fragment = document.createDocumentFragment();
                 config.hosts.forEach(host => {
                     const hostEl = renderHost(host);
-                    configContent.appendChild(hostEl);
+                    if (expandedHosts.has(host.hostName)) hostEl.classList.remove('collapsed');
+                    fragment.appendChild(hostEl);
                 });
+                configContent.appendChild(fragment);
             }
-            
+
             // 渲染完成后初始化拖拽
             initSortables();
+            refreshHostStatus();
             
         } catch (error) {
             showAlert(`加载失败: ${error.message}`, true);
@@ -366,28 +422,224 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
-    // --- 拖拽排序逻辑 ---
-    
+    // --- 主机可达性标记 ---
+
+    const HOST_STATUS_INTERVAL = 60000; // 与服务端缓存的 TTL 一致
+
+    // cards: 只更新这些卡片 (默认全部)
+    const applyHostStatus = (statuses, cards = configContent.querySelectorAll('.host-card')) => {
+        cards.forEach(card => {
+            const badge = card.querySelector('.host-status');
+            if (!badge) return;
+            const status = statuses[card.dataset.host];
+            if (!status) {
+                badge.dataset.state = 'pending';
+                badge.textContent = '…';
+                badge.title = '未探测';
+                return;
+            }
+            const via = status.via ? ` (经由跳板机 ${status.via})` : '';
+            badge.dataset.state = status.ok ? (status.latencyMs > 200 ? 'slow' : 'ok') : 'down';
+            badge.textContent = status.ok ? `${Math.round(status.latencyMs)}ms` : status.error;
+            badge.title = `${status.target}${via}，探测于 ${new Date(status.checkedAt * 1000).toLocaleTimeString()}`;
+        });
+    };
+
+    const refreshHostStatus = async ({ refresh = false, cards } = {}) => {
+        try {
+            applyHostStatus(await api.getHostStatus({ refresh }), cards);
+        } catch (error) {
+            console.warn('主机状态探测失败:', error);
+        }
+    };
+
+    setInterval(() => {
+        if (document.visibilityState === 'visible') refreshHostStatus();
+    }, HOST_STATUS_INTERVAL);
+
+    // --- 修改请求的串行队列 ---
+    // 所有写请求依次发出：每个请求都带着上一个请求返回的 ETag，
+    // 后台同步排序时紧接着的添加/删除操作不会因版本不一致而被误判为冲突 (412)。
+    let writeQueue = Promise.resolve();
+
+    const enqueueWrite = (task) => {
+        const run = writeQueue.then(task);
+        writeQueue = run.catch(() => {});
+        return run;
+    };
+
+    // --- 局部更新 (按主机名/服务名定位卡片，只改动受影响的部分) ---
+
     // 查找数据对象
     const findHostInConfig = (hostName) => currentConfig.hosts.find(h => h.hostName === hostName);
     const findServiceInHost = (host, serviceName) => host.services.find(s => s.serviceName === serviceName);
 
-    const handleHostReorder = async (evt) => {
-        const hostCards = Array.from(evt.target.children);
-        const newHostOrder = hostCards.map(card => card.dataset.host).filter(Boolean);
-        
-        const newHosts = newHostOrder.map(hostName => findHostInConfig(hostName));
-        currentConfig.hosts = newHosts;
-        
+    const findHostCard = (hostName) =>
+        configContent.querySelector(`.host-card[data-host="${CSS.escape(hostName)}"]`);
+    const findServiceItem = (hostCard, serviceName) =>
+        hostCard.querySelector(`.service-item[data-service="${CSS.escape(serviceName)}"]`);
+
+    // 与服务端一致：主机/服务删除或改名后同步更新隧道组成员
+    const updateGroupMembers = (predicate, update) => {
+        (currentConfig.groups || []).forEach(group => {
+            group.members = group.members.flatMap(m => (predicate(m) ? update(m) : [m]));
+        });
+    };
+
+    const insertHost = (host) => {
+        currentConfig.hosts.push(host);
+        if (!configContent.querySelector('.host-card')) configContent.innerHTML = '';
+        const hostCard = renderHost(host);
+        configContent.appendChild(hostCard);
+        initServiceSortable(hostCard.querySelector('.service-list'));
+        refreshHostStatus({ cards: [hostCard] });
+    };
+
+    const removeHost = (hostName) => {
+        currentConfig.hosts = currentConfig.hosts.filter(h => h.hostName !== hostName);
+        updateGroupMembers(m => m.hostName === hostName, () => []);
+        findHostCard(hostName)?.remove();
+        if (!configContent.querySelector('.host-card')) configContent.innerHTML = EMPTY_HOSTS_HTML;
+    };
+
+    // originalServiceName 为空时添加到末尾，否则原位替换 (可能改名)
+    const upsertService = (hostName, service, originalServiceName = null) => {
+        const host = findHostInConfig(hostName);
+        const hostCard = findHostCard(hostName);
+        if (!host || !hostCard) return;
+
+        const serviceEl = htmlToElement(renderService(hostName, service));
+        const index = originalServiceName === null
+            ? -1
+            : host.services.findIndex(s => s.serviceName === originalServiceName);
+        const oldItem = originalServiceName === null ? null : findServiceItem(hostCard, originalServiceName);
+
+        if (index === -1) {
+            host.services.push(service);
+        } else {
+            host.services[index] = service;
+            if (service.serviceName !== originalServiceName) {
+                updateGroupMembers(
+                    m => m.hostName === hostName && m.serviceName === originalServiceName,
+                    m => [{ ...m, serviceName: service.serviceName }]
+                );
+            }
+        }
+
+        if (oldItem) {
+            oldItem.replaceWith(serviceEl);
+        } else {
+            const list = hostCard.querySelector('.service-list');
+            if (!list.querySelector('.service-item')) list.innerHTML = '';
+            list.appendChild(serviceEl);
+        }
+    };
+
+    const removeService = (hostName, serviceName) => {
+        const host = findHostInConfig(hostName);
+        if (host) host.services = host.services.filter(s => s.serviceName !== serviceName);
+        updateGroupMembers(m => m.hostName === hostName && m.serviceName === serviceName, () => []);
+
+        const hostCard = findHostCard(hostName);
+        if (!hostCard) return;
+        findServiceItem(hostCard, serviceName)?.remove();
+        const list = hostCard.querySelector('.service-list');
+        if (!list.querySelector('.service-item')) list.innerHTML = EMPTY_SERVICES_HTML;
+    };
+
+    // --- 远程服务发现 ---
+    // 结果面板放在主机卡片的服务列表上方；建议项为尚未配置的监听端口
+
+    const suggestionToService = ({ addresses, ...service }) => service;
+
+    // 发现结果来自远程主机 (ssh / ss 的输出、监听地址)，只能作为文本插入，不能成为标记
+    const escapeHtml = (value) => String(value).replace(/[&<>"']/g, c => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;',
+    })[c]);
+
+    const renderDiscoveryPanel = (hostName, result) => {
+        if (!result.ok) {
+            return `<p class="discovery-error">发现失败: ${escapeHtml(result.error)}</p>`;
+        }
+        const checkedAt = new Date(result.checkedAt * 1000).toLocaleTimeString();
+        const summary = `${result.ports.length} 个监听端口，${result.suggestions.length} 个未配置 (${checkedAt})`;
+        const items = result.suggestions.map(s => `
+            <li class="discovery-item" data-port="${escapeHtml(s.remotePort)}">
+                <span><strong>${escapeHtml(s.serviceName)}</strong> R: ${escapeHtml(s.remotePort)} <small>${escapeHtml(s.addresses.join(', '))}</small></span>
+                <button class="btn btn-primary btn-add-discovered">添加</button>
+            </li>
+        `).join('');
+        return `
+            <div class="discovery-summary">${summary}</div>
+            <ul class="discovery-list">${items}</ul>
+            <div class="discovery-actions">
+                ${result.suggestions.length ? '<button class="btn btn-primary btn-add-all-discovered">全部添加</button>' : ''}
+                <button class="btn btn-secondary btn-refresh-discovery">重新发现</button>
+                <button class="btn btn-secondary btn-close-discovery">关闭</button>
+            </div>
+        `;
+    };
+
+    // 最近一次发现的结果 (主机名 -> 结果)，添加建议项时从这里取服务数据
+    const discoveryResults = new Map();
+
+    const showDiscovery = async (hostCard, { refresh = false } = {}) => {
+        const hostName = hostCard.dataset.host;
+        let panel = hostCard.querySelector('.discovery-panel');
+        if (!panel) {
+            panel = document.createElement('div');
+            panel.className = 'discovery-panel';
+            hostCard.querySelector('.service-list').before(panel);
+        }
+        hostCard.classList.remove('collapsed');
+        panel.innerHTML = '<p>正在列出远程监听端口…</p>';
         try {
-            await api.updateConfig(currentConfig);
+            const result = (await api.discoverServices([hostName], { refresh }))[hostName];
+            discoveryResults.set(hostName, result);
+            panel.innerHTML = renderDiscoveryPanel(hostName, result);
         } catch (error) {
-            showAlert(`主机排序保存失败: ${error.message}，将刷新页面。`, true);
-            await loadAndRenderConfig(); // 失败时回滚
+            panel.innerHTML = `<p class="discovery-error">${escapeHtml(error.message)}</p>`;
         }
     };
+
+    const removeDiscoveryItem = (hostCard, port) => {
+        const hostName = hostCard.dataset.host;
+        const result = discoveryResults.get(hostName);
+        if (result) result.suggestions = result.suggestions.filter(s => s.remotePort !== port);
+        const panel = hostCard.querySelector('.discovery-panel');
+        if (panel && result) panel.innerHTML = renderDiscoveryPanel(hostName, result);
+    };
+
+    // --- 拖拽排序逻辑 ---
+    // 拖拽后页面已经是新的顺序：只更新 currentConfig，再在后台保存。
+    // 连续多次拖拽只会排队一次保存，发出时读取最新的顺序。
+
+    let orderSyncQueued = false;
+
+    const syncOrder = () => {
+        if (orderSyncQueued) return;
+        orderSyncQueued = true;
+        enqueueWrite(async () => {
+            orderSyncQueued = false;
+            // 只提交主机列表；隧道组等其他字段由服务端保留
+            await api.updateConfig({ hosts: currentConfig.hosts });
+        }).catch(async (error) => {
+            showAlert(`排序保存失败: ${error.message}，将刷新页面。`, true);
+            await loadAndRenderConfig(); // 失败时回滚
+        });
+    };
+
+    const handleHostReorder = (evt) => {
+        if (evt.oldIndex === evt.newIndex) return;
+        const hostCards = Array.from(evt.target.children);
+        const newHostOrder = hostCards.map(card => card.dataset.host).filter(Boolean);
+        
+        currentConfig.hosts = newHostOrder.map(hostName => findHostInConfig(hostName));
+        syncOrder();
+    };
     
-    const handleServiceReorder = async (evt) => {
+    const handleServiceReorder = (evt) => {
+        if (evt.oldIndex === evt.newIndex) return;
         const hostCard = evt.from.closest('.host-card');
         const hostName = hostCard.dataset.host;
         const host = findHostInConfig(hostName);
@@ -399,42 +651,39 @@ document.addEventListener('DOMContentLoaded', () => {
             .map(item => item.dataset ? item.dataset.service : null)
             .filter(Boolean);
 
-        const newServices = newServiceOrder.map(serviceName => findServiceInHost(host, serviceName));
-        host.services = newServices;
-        
-        try {
-            await api.updateConfig(currentConfig);
-        } catch (error) {
-            showAlert(`服务排序保存失败: ${error.message}，将刷新页面。`, true);
-            await loadAndRenderConfig(); // 失败时回滚
-        }
+        host.services = newServiceOrder.map(serviceName => findServiceInHost(host, serviceName));
+        syncOrder();
     };
 
-    // 【修改】初始化拖拽 (更新 handle 和 filter)
-    const initSortables = () => {
-        // 1. 初始化主机卡片排序
-        new Sortable(configContent, {
+    const initServiceSortable = (list) => {
+        new Sortable(list, {
             animation: 150,
-            handle: '.host-header', // 修改：使用 header 作为拖拽句柄
-            filter: '.btn', // 修改：忽略句柄内的 .btn 元素，使其可点击
-            preventOnFilter: true, // 修改：确保 filter 生效
+            handle: '.service-item',
+            filter: '.btn', // 同样过滤服务项中的按钮
+            preventOnFilter: true,
             ghostClass: 'sortable-ghost',
             chosenClass: 'sortable-chosen',
-            onEnd: handleHostReorder
+            onEnd: handleServiceReorder
         });
-        
-        // 2. 初始化每个主机内部的服务列表排序
-        document.querySelectorAll('.service-list').forEach(list => {
-            new Sortable(list, {
+    };
+
+    // 【修改】初始化拖拽 (更新 handle 和 filter)
+    const initSortables = () => {
+        // 1. 初始化主机卡片排序 (configContent 本身不会被替换，只需初始化一次)
+        if (!Sortable.get(configContent)) {
+            new Sortable(configContent, {
                 animation: 150,
-                handle: '.service-item',
-                filter: '.btn', // 同样过滤服务项中的按钮
-                preventOnFilter: true,
+                handle: '.host-header', // 修改：使用 header 作为拖拽句柄
+                filter: '.btn', // 修改：忽略句柄内的 .btn 元素，使其可点击
+                preventOnFilter: true, // 修改：确保 filter 生效
                 ghostClass: 'sortable-ghost',
                 chosenClass: 'sortable-chosen',
-                onEnd: handleServiceReorder
+                onEnd: handleHostReorder
             });
-        });
+        }
+        
+        // 2. 初始化每个主机内部的服务列表排序
+        configContent.querySelectorAll('.service-list').forEach(initServiceSortable);
     };
 
     // --- 事件监听 ---
@@ -446,6 +695,8 @@ document.addEventListener('DOMContentLoaded', () => {
             hostName: document.getElementById('hostName').value.trim(),
             serverIP: document.getElementById('serverIP').value.trim(),
             sshUser: document.getElementById('sshUser').value.trim(),
+            // 留空时为 null (直连)
+            proxyJump: document.getElementById('proxyJump').value.trim() || null,
             services: []
         };
 
@@ -455,14 +706,13 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         try {
-            await api.addHost(hostData);
+            const host = await enqueueWrite(() => api.addHost(hostData));
+            insertHost(host);
             showAlert('主机添加成功！');
             formAddHost.reset();
-            // 优化：如果添加表单是折叠的，在成功后保持折叠
-            // (目前不需要，刷新就好)
-            await loadAndRenderConfig();
         } catch (error) {
             showAlert(`添加主机失败: ${error.message}`, true);
+            if (error.conflict) await loadAndRenderConfig();
         }
     });
 
@@ -487,11 +737,12 @@ document.addEventListener('DOMContentLoaded', () => {
             const hostName = hostCard.dataset.host;
             if (confirm(`确定要删除主机 "${hostName}" 及其所有服务吗？`)) {
                 try {
-                    await api.deleteHost(hostName);
+                    await enqueueWrite(() => api.deleteHost(hostName));
+                    removeHost(hostName);
                     showAlert('主机删除成功');
-                    await loadAndRenderConfig();
                 } catch (error) {
                     showAlert(`删除主机失败: ${error.message}`, true);
+                    if (error.conflict) await loadAndRenderConfig();
                 }
             }
         }
@@ -502,11 +753,12 @@ document.addEventListener('DOMContentLoaded', () => {
             const serviceName = serviceItem.dataset.service;
             if (confirm(`确定要删除主机 "${hostName}" 下的服务 "${serviceName}" 吗？`)) {
                 try {
-                    await api.deleteService(hostName, serviceName);
+                    await enqueueWrite(() => api.deleteService(hostName, serviceName));
+                    removeService(hostName, serviceName);
                     showAlert('服务删除成功');
-                    await loadAndRenderConfig();
                 } catch (error) {
                     showAlert(`删除服务失败: ${error.message}`, true);
+                    if (error.conflict) await loadAndRenderConfig();
                 }
             }
         }
@@ -546,7 +798,49 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
 
-        // 2f. 取消“添加/修改服务”
+        // 2f. 发现远程服务
+        if (target.classList.contains('btn-discover-services')) {
+            await showDiscovery(hostCard);
+        }
+        if (target.classList.contains('btn-refresh-discovery')) {
+            await showDiscovery(hostCard, { refresh: true });
+        }
+        if (target.classList.contains('btn-close-discovery')) {
+            target.closest('.discovery-panel').remove();
+        }
+
+        if (target.classList.contains('btn-add-discovered')) {
+            const hostName = hostCard.dataset.host;
+            const port = parseInt(target.closest('.discovery-item').dataset.port, 10);
+            const suggestion = discoveryResults.get(hostName)?.suggestions.find(s => s.remotePort === port);
+            if (!suggestion) return;
+            try {
+                const service = await enqueueWrite(() => api.addService(hostName, suggestionToService(suggestion)));
+                upsertService(hostName, service);
+                removeDiscoveryItem(hostCard, port);
+            } catch (error) {
+                showAlert(`添加服务失败: ${error.message}`, true);
+                if (error.conflict) await loadAndRenderConfig();
+            }
+        }
+
+        if (target.classList.contains('btn-add-all-discovered')) {
+            const hostName = hostCard.dataset.host;
+            const suggestions = discoveryResults.get(hostName)?.suggestions || [];
+            const operations = suggestions.map(s => ({ op: 'create', hostName, service: suggestionToService(s) }));
+            try {
+                await enqueueWrite(() => api.batchServices(operations));
+                discoveryResults.delete(hostName);
+                // 批量接口不返回分配后的本地端口，重新加载配置
+                await loadAndRenderConfig();
+                showAlert(`已添加 ${operations.length} 个服务`);
+            } catch (error) {
+                showAlert(`添加服务失败: ${error.message}`, true);
+                if (error.conflict) await loadAndRenderConfig();
+            }
+        }
+
+        // 2g. 取消“添加/修改服务”
         if (target.classList.contains('btn-cancel-service')) {
             const formContainer = target.closest('.service-form-container');
             if (serviceItem) { // 'edit' 模式
@@ -557,13 +851,13 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
         
-        // 2g. K-V 构建器：添加行
+        // 2h. K-V 构建器：添加行
         if (target.classList.contains('btn-add-kv-pair')) {
             const builder = target.closest('.full-width').querySelector('.login-info-builder');
             addKvRow(builder);
         }
         
-        // 2h. K-V 构建器：删除行
+        // 2i. K-V 构建器：删除行
         if (target.classList.contains('btn-remove-kv-pair')) {
             target.closest('.kv-row').remove();
         }
@@ -595,32 +889,47 @@ document.addEventListener('DOMContentLoaded', () => {
             const serviceData = {
                 serviceName: form.querySelector('.serviceName').value.trim(),
                 remotePort: parseInt(form.querySelector('.remotePort').value, 10),
-                localPort: parseInt(form.querySelector('.localPort').value, 10),
+                // 留空时为 0，由服务端从主机端口范围内自动分配
+                localPort: parseInt(form.querySelector('.localPort').value, 10) || 0,
+                // 留空时为 null，隧道不会因空闲被关闭
+                idleTimeout: parseInt(form.querySelector('.idleTimeout').value, 10) || null,
                 autoOpenUrl: form.querySelector('.autoOpenUrl').checked,
+                onDemand: form.querySelector('.onDemand').checked,
                 urlTemplate: form.querySelector('.urlTemplate').value,
                 loginInfo: loginInfo
             };
             
-            if (!serviceData.serviceName || isNaN(serviceData.remotePort) || isNaN(serviceData.localPort)) {
-                showAlert('服务名和端口不能为空且必须是数字', true);
+            if (!serviceData.serviceName || isNaN(serviceData.remotePort)) {
+                showAlert('服务名和远程端口不能为空且必须是数字', true);
                 return;
             }
             
             try {
+                // 使用接口返回的服务 (其中包含服务端自动分配的本地端口)，只更新这一项
                 if (mode === 'add') {
-                    await api.addService(hostName, serviceData);
+                    const service = await enqueueWrite(() => api.addService(hostName, serviceData));
+                    form.closest('.service-form-container').remove();
+                    upsertService(hostName, service);
                     showAlert('服务添加成功');
                 } else if (mode === 'edit') {
-                    await api.updateService(hostName, originalServiceName, serviceData);
+                    const service = await enqueueWrite(() => api.updateService(hostName, originalServiceName, serviceData));
+                    upsertService(hostName, service, originalServiceName);
                     showAlert('服务修改成功');
                 }
-                await loadAndRenderConfig(); // 统一重新加载
             } catch (error) {
                 showAlert(`操作失败: ${error.message}`, true);
+                if (error.conflict) await loadAndRenderConfig();
             }
         }
     });
 
+    // 5. 切回页面时检查配置是否被其他页面/脚本修改 (未变化时服务端返回 304，不重新渲染)
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') {
+            loadAndRenderConfig({ onlyIfChanged: true });
+        }
+    });
+
     // --- 初始加载 ---
     loadAndRenderConfig();
 });
\ No newline at end of file
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+REST API 的进程内压力测试。
+
+用 httpx 的 ASGITransport 直接驱动 sshtf_web.app (不经过网络和 uvicorn)，
+多个虚拟客户端 (相当于多个浏览器标签页 / 脚本) 并发地读取和修改配置，
+配置为临时目录中合成的 10 / 1k / 10k 台主机，不会碰到真正的 config.json。
+
+    python bench_api.py                          # 默认 10,1000,10000 台主机，16 个客户端，各 5 秒
+    python bench_api.py --hosts 1000 --clients 64 --duration 10
+    python bench_api.py --no-if-match            # 模拟不带 If-Match 的脚本，观察丢失的更新
+
+输出每种操作的 p50 / p99 延迟、总吞吐量、412 冲突次数和丢失的更新数。
+丢失的更新：服务端已返回成功、但最终配置中看不到效果的修改
+(添加的服务不存在、删除的服务仍在、修改的端口被覆盖)。
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+import sshtf_web
+
+# 各操作的权重：以读为主，夹杂修改和整份配置的排序保存 (拖拽)
+OPERATION_WEIGHTS = {
+    'get_config': 50,
+    'get_config_304': 15,
+    'port_conflicts': 5,
+    'add_service': 12,
+    'update_service': 8,
+    'delete_service': 5,
+    'reorder': 5,
+}
+MAX_RETRIES = 5            # 412 后重新读取配置并重试的次数
+SERVICES_PER_HOST = 3
+SYNTHETIC_PORT_BASE = 30000  # 合成配置中已有服务的本地端口起点
+
+
+def synthetic_config(host_count: int) -> dict:
+    hosts = []
+    for i in range(host_count):
+        hosts.append({
+            'hostName': f"host-{i:05d}",
+            'serverIP': f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            'sshUser': 'bench',
+            'services': [
+                {
+                    'serviceName': f"svc-{j}",
+                    'remotePort': 8000 + j,
+                    'localPort': SYNTHETIC_PORT_BASE + i * SERVICES_PER_HOST + j,
+                    'autoOpenUrl': False,
+                    'urlTemplate': "http://localhost:{localPort}",
+                }
+                for j in range(SERVICES_PER_HOST)
+            ],
+        })
+    return {'hosts': hosts, 'version': 0}
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class VirtualClient:
+    """一个标签页 / 脚本：记住自己的 ETag，只修改自己添加的服务，便于事后核对"""
+
+    def __init__(self, client_id: int, http: httpx.AsyncClient, host_names: list, use_if_match: bool, stats: dict):
+        self.id = client_id
+        self.http = http
+        self.host_names = host_names
+        self.use_if_match = use_if_match
+        self.stats = stats
+        self.etag = None
+        self.config = None
+        self.config_etag = None  # self.config 对应的版本
+        self.counter = 0
+        self.owned = {}       # (主机名, 服务名) -> 最后一次成功写入的 remotePort
+        self.deleted = set()  # 已成功删除的 (主机名, 服务名)
+
+    def _headers(self) -> dict:
+        return {'If-Match': self.etag} if self.use_if_match and self.etag else {}
+
+    async def _timed(self, op: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.http.request(method, url, **kwargs)
+        self.stats['latency'].setdefault(op, []).append((time.perf_counter() - started) * 1000)
+        if response.status_code == 412:
+            self.stats['conflicts'] += 1
+        elif response.status_code >= 400 and response.status_code != 304:
+            self.stats['errors'][f"{op} {response.status_code}"] = \
+                self.stats['errors'].get(f"{op} {response.status_code}", 0) + 1
+        if response.headers.get('ETag'):
+            self.etag = response.headers['ETag']
+        return response
+
+    async def refresh(self, op: str = 'get_config'):
+        response = await self._timed(op, 'GET', '/api/config')
+        self.config = response.json()
+        self.config_etag = self.etag
+
+    async def _mutate(self, op: str, method: str, url: str, body_factory=None) -> bool:
+        for _ in range(MAX_RETRIES):
+            kwargs = {'headers': self._headers()}
+            if body_factory is not None:
+                kwargs['json'] = body_factory()
+            response = await self._timed(op, method, url, **kwargs)
+            if response.status_code != 412:
+                return response.is_success
+            await self.refresh()
+        return False
+
+    async def step(self, op: str):
+        if op == 'get_config':
+            await self.refresh()
+        elif op == 'get_config_304':
+            headers = {'If-None-Match': self.etag} if self.etag else {}
+            await self._timed(op, 'GET', '/api/config', headers=headers)
+        elif op == 'port_conflicts':
+            await self._timed(op, 'GET', '/api/ports/conflicts')
+        elif op == 'add_service':
+            self.counter += 1
+            key = (random.choice(self.host_names), f"bench-{self.id}-{self.counter}")
+            remote_port = random.randint(1, 65535)
+            body = {'serviceName': key[1], 'remotePort': remote_port, 'localPort': 0,
+                    'autoOpenUrl': False, 'urlTemplate': ""}
+            if await self._mutate(op, 'POST', f"/api/hosts/{key[0]}/services", lambda: body):
+                self.owned[key] = remote_port
+        elif op == 'update_service' and self.owned:
+            key = random.choice(list(self.owned))
+            remote_port = random.randint(1, 65535)
+            # localPort 保持为 0 会触发重新分配；修改只改远程端口
+            body = {'serviceName': key[1], 'remotePort': remote_port, 'localPort': 0,
+                    'autoOpenUrl': False, 'urlTemplate': ""}
+            if await self._mutate(op, 'PUT', f"/api/hosts/{key[0]}/services/{key[1]}", lambda: body):
+                self.owned[key] = remote_port
+        elif op == 'delete_service' and self.owned:
+            key = random.choice(list(self.owned))
+            if await self._mutate(op, 'DELETE', f"/api/hosts/{key[0]}/services/{key[1]}"):
+                del self.owned[key]
+                self.deleted.add(key)
+        elif op == 'reorder':
+            if self.use_if_match and self.config_etag != self.etag:
+                # 本地配置比最近一次修改旧：先重新读取，否则会用旧的主机列表覆盖自己的修改
+                await self.refresh()
+
+            def reordered():
+                # 和 Web UI 的拖拽一样：基于本地持有的配置交换两台主机的位置后整体提交
+                hosts = list(self.config['hosts'])
+                if len(hosts) > 1:
+                    i, j = random.sample(range(len(hosts)), 2)
+                    hosts[i], hosts[j] = hosts[j], hosts[i]
+                return {'hosts': hosts}
+
+            await self._mutate(op, 'PUT', '/api/config', reordered)
+
+
+async def run_scenario(host_count: int, clients: int, duration: float, use_if_match: bool, work_dir: Path) -> dict:
+    config_path = work_dir / f"config-{host_count}.json"
+    config_path.write_text(json.dumps(synthetic_config(host_count)), encoding='utf-8')
+    sshtf_web.CONFIG_PATH = config_path
+    sshtf_web._config_cache = None
+    sshtf_web._config_response_cache = None
+    sshtf_web.file_lock = asyncio.Lock()  # 每个场景运行在新的事件循环中
+
+    stats = {'latency': {}, 'conflicts': 0, 'errors': {}}
+    host_names = [f"host-{i:05d}" for i in range(host_count)]
+    operations, weights = zip(*OPERATION_WEIGHTS.items())
+    transport = httpx.ASGITransport(app=sshtf_web.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        workers = [VirtualClient(i, http, host_names, use_if_match, stats) for i in range(clients)]
+        deadline = time.perf_counter() + duration
+
+        async def loop(worker: VirtualClient):
+            await worker.refresh()
+            while time.perf_counter() < deadline:
+                await worker.step(random.choices(operations, weights)[0])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(loop(w) for w in workers))
+        elapsed = time.perf_counter() - started
+
+        final = (await http.get('/api/config')).json()
+
+    present = {(h['hostName'], s['serviceName']): s['remotePort'] for h in final['hosts'] for s in h['services']}
+    lost = 0
+    for worker in workers:
+        lost += sum(1 for key, port in worker.owned.items() if present.get(key) != port)
+        lost += sum(1 for key in worker.deleted if key in present)
+
+    requests = sum(len(v) for v in stats['latency'].values())
+    return {
+        'hosts': host_count,
+        'requests': requests,
+        'throughput': requests / elapsed,
+        'latency': stats['latency'],
+        'conflicts': stats['conflicts'],
+        'errors': stats['errors'],
+        'lost': lost,
+        'configBytes': config_path.stat().st_size,
+    }
+
+
+def print_report(result: dict):
+    print(f"\n=== {result['hosts']} 台主机 (config.json {result['configBytes'] / 1024:.0f} KB) ===")
+    print(f"{'操作':<16}{'次数':>8}{'p50':>10}{'p99':>10}")
+    for op in OPERATION_WEIGHTS:
+        values = result['latency'].get(op, [])
+        if values:
+            print(f"{op:<16}{len(values):>8}{percentile(values, 0.5):>8.1f}ms{percentile(values, 0.99):>8.1f}ms")
+    all_values = [v for values in result['latency'].values() for v in values]
+    print(f"{'全部':<16}{len(all_values):>8}{statistics.median(all_values):>8.1f}ms{percentile(all_values, 0.99):>8.1f}ms")
+    print(f"吞吐量: {result['throughput']:.0f} 请求/秒   412 冲突: {result['conflicts']}   "
+          f"丢失的更新: {result['lost']}")
+    for error, count in sorted(result['errors'].items()):
+        print(f"  ⚠️ {error}: {count} 次")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="REST API 的进程内压力测试")
+    parser.add_argument('--hosts', default="10,1000,10000", help="合成配置的主机数，逗号分隔 (默认: 10,1000,10000)")
+    parser.add_argument('--clients', type=int, default=16, help="并发的虚拟客户端数 (默认: 16)")
+    parser.add_argument('--duration', type=float, default=5.0, help="每个场景运行的秒数 (默认: 5)")
+    parser.add_argument('--no-if-match', action='store_true', help="修改请求不带 If-Match (模拟不做并发控制的脚本)")
+    parser.add_argument('--seed', type=int, default=0, help="随机数种子 (默认: 0)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    lost = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        for host_count in (int(n) for n in args.hosts.split(',')):
+            result = asyncio.run(run_scenario(host_count, args.clients, args.duration,
+                                              not args.no_if_match, Path(work_dir)))
+            print_report(result)
+            lost += result['lost']
+    return 1 if lost and not args.no_if_match else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
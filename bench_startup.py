@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+测量 main.py 命令行子命令的启动耗时，并检查它们没有加载 Web 框架等重量级依赖。
+
+    python bench_startup.py              # 测量并检查，超出预算时退出码为 1
+    python bench_startup.py -n 20 --budget-ms 40
+
+对每个子命令运行 `python -X importtime main.py ...`，只统计解释器自身启动
+(`python -c pass` 也会导入的模块，如 site) 之外的导入耗时，因此结果与机器上的 .pth 等环境无关。
+子命令在临时目录中的配置副本上运行，不会修改真正的 config.json。
+"""
+
+import argparse
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+
+# 子命令 -> 不允许出现的模块 (validate 需要 Pydantic，但仍不应加载 Web 框架)
+WEB_STACK = {'fastapi', 'starlette', 'uvicorn', 'aiofiles', 'psutil'}
+COMMANDS = {
+    ('list',): WEB_STACK | {'pydantic', 'asyncio'},
+    ('list', '--json'): WEB_STACK | {'pydantic', 'asyncio'},
+    ('export',): WEB_STACK | {'pydantic', 'asyncio'},
+    ('validate',): WEB_STACK,
+}
+DEFAULT_BUDGET_MS = 30.0   # list/export 的导入耗时预算 (中位数)
+
+
+def _import_times(argv, cwd):
+    """运行一次，返回 ({顶层模块名: 累计导入耗时 (微秒)}, 导入过的所有顶层包名)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *argv],
+        cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    times, packages = {}, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        packages.add(name.strip().split('.')[0])
+        if not name.startswith('  '):  # 子模块已计入所在顶层导入的累计耗时
+            times[name.strip()] = int(cumulative)
+    return times, packages
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量 main.py 子命令的启动耗时")
+    parser.add_argument('-n', '--runs', type=int, default=10, help="每个子命令运行的次数 (默认: 10)")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"list/export 的导入耗时预算，毫秒 (默认: {DEFAULT_BUDGET_MS:g})")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for path in SCRIPT_DIR.glob('*.py'):
+            shutil.copy(path, work_dir)
+        if (SCRIPT_DIR / 'config.json').exists():
+            shutil.copy(SCRIPT_DIR / 'config.json', work_dir)
+        env_baseline = set(_import_times(['-c', 'pass'], work_dir)[0])
+
+        failed = False
+        print(f"{'子命令':<16}{'导入耗时':>10}{'总耗时':>10}  最慢的导入")
+        for command, forbidden in COMMANDS.items():
+            argv = ['main.py', *command]
+            import_ms, wall_ms, slowest, loaded = [], [], {}, set()
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                times, packages = _import_times(argv, work_dir)
+                loaded |= forbidden & packages
+                wall_ms.append((time.perf_counter() - started) * 1000)
+                own = {name: us for name, us in times.items() if name not in env_baseline}
+                import_ms.append(sum(own.values()) / 1000)
+                for name, us in own.items():
+                    slowest[name] = slowest.get(name, 0) + us / args.runs
+
+            median = statistics.median(import_ms)
+            top = ', '.join(f"{name} {us / 1000:.1f}ms" for name, us in
+                            sorted(slowest.items(), key=lambda item: -item[1])[:3])
+            print(f"{' '.join(command):<16}{median:>8.1f}ms{statistics.median(wall_ms):>8.1f}ms  {top}")
+
+            if loaded:
+                print(f"  ❌ 加载了不应加载的模块: {', '.join(sorted(loaded))}")
+                failed = True
+            if 'validate' not in command and median > args.budget_ms:
+                print(f"  ❌ 导入耗时超出预算 {args.budget_ms:g}ms")
+                failed = True
+
+    print("❌ 检查未通过" if failed else "✅ 检查通过")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,329 +1,317 @@
-import json
-import os
-import asyncio
-import aiofiles
-import argparse
-import pathlib 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
-from pydantic import BaseModel
-from typing import List, Optional, Union, Any, Dict
-SCRIPT_DIR = pathlib.Path(__file__).parent.resolve()
-# --- 配置 ---
-CONFIG_PATH = SCRIPT_DIR / "config.json"
-file_lock = asyncio.Lock()
-
-# --- Pydantic 模型 ---
-
-class Service(BaseModel):
-    serviceName: str
-    remotePort: int
-    localPort: int
-    autoOpenUrl: bool
-    urlTemplate: str
-    loginInfo: Optional[Dict[str, Any]] = None 
-
-class Host(BaseModel):
-    hostName: str
-    serverIP: str
-    sshUser: str
-    services: List[Service] = []
-
-class Config(BaseModel):
-    hosts: List[Host]
-
-# --- FastAPI 应用实例 ---
-app = FastAPI(title="端口转发配置管理器 API (V3)")
-
-# --- 辅助函数：异步读写 config.json ---
-
-async def get_config() -> Config:
-    """异步读取、解析并校验 config.json"""
-    async with file_lock:
-        if not os.path.exists(CONFIG_PATH):
-            return Config(hosts=[])
-        
-        async with aiofiles.open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-            content = await f.read()
-            if not content:
-                 return Config(hosts=[])
-            try:
-                data = json.loads(content)
-                return Config.model_validate(data)
-            except json.JSONDecodeError:
-                raise HTTPException(status_code=500, detail="config.json 文件格式错误 (非 JSON)")
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"解析 config.json 出错: {e}")
-
-async def save_config(config: Config):
-    """异步将配置对象写回 config.json"""
-    async with file_lock:
-        async with aiofiles.open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-            await f.write(config.model_dump_json(indent=2))
-
-# --- 【新增】SSH Config 导入逻辑 ---
-async def import_ssh_config(ssh_config_path_str: str):
-    """
-    从 .ssh/config 文件解析主机信息并导入到 config.json
-    """
-    ssh_config_path = pathlib.Path(ssh_config_path_str)
-    if not ssh_config_path.is_file():
-        print(f"❌ 错误: 路径 '{ssh_config_path_str}' 不是一个有效文件。")
-        return
-    
-    print(f"ℹ️ 正在从 '{ssh_config_path_str}' 读取 SSH 配置...")
-    
-    parsed_hosts = []
-    current_host_data = {}
+# -*- coding: utf-8 -*-
+"""
+端口转发配置管理器的入口。
 
-    try:
-        # 使用 aiofiles 异步读取
-        async with aiofiles.open(ssh_config_path, 'r', encoding='utf-8') as f:
-            async for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue # 跳过空行和注释
-
-                parts = line.split(maxsplit=1)
-                if len(parts) < 2:
-                    continue
-                
-                key = parts[0].lower()
-                value = parts[1]
-
-                if key == 'host':
-                    # 遇到新的 Host 块
-                    if current_host_data.get('hostName') and current_host_data.get('serverIP') and current_host_data.get('sshUser'):
-                        # 保存上一个有效的主机
-                        parsed_hosts.append(Host(**current_host_data, services=[]))
-                    
-                    # 开始新的主机 (我们使用 'Host' 字段作为 Pydantic 模型中的 'hostName')
-                    current_host_data = {'hostName': value}
-                    
-                elif key == 'hostname' and current_host_data:
-                    # 'HostName' 字段作为 Pydantic 模型中的 'serverIP' (实际IP/域名)
-                    current_host_data['serverIP'] = value
-                    
-                elif key == 'user' and current_host_data:
-                    current_host_data['sshUser'] = value
-                
-                # (忽略 Port 和其他字段)
-    
-        # 保存文件读取后的最后一个主机
-        if current_host_data.get('hostName') and current_host_data.get('serverIP') and current_host_data.get('sshUser'):
-            parsed_hosts.append(Host(**current_host_data, services=[]))
-            
-    except Exception as e:
-        print(f"❌ 解析 SSH 配置文件时出错: {e}")
-        return
-
-    if not parsed_hosts:
-        print("ℹ️ 未在 SSH 配置文件中找到任何(完整 Host/HostName/User)的主机条目。")
-        return
-
-    print(f"✅ 成功解析到 {len(parsed_hosts)} 个主机。正在合并到 config.json...")
-
-    # --- 合并逻辑 ---
-    try:
-        config = await get_config()
-        existing_hostnames = {h.hostName for h in config.hosts}
-        new_hosts_added = 0
-        
-        for new_host in parsed_hosts:
-            if new_host.hostName not in existing_hostnames:
-                config.hosts.append(new_host)
-                existing_hostnames.add(new_host.hostName)
-                new_hosts_added += 1
-            else:
-                print(f"ℹ️ 跳过已存在的主机: {new_host.hostName}")
-
-        if new_hosts_added > 0:
-            await save_config(config)
-            print(f"✅ 成功导入 {new_hosts_added} 个新主机到 {CONFIG_PATH}。")
-        else:
-            print("ℹ️ 没有新主机被导入（可能都已存在）。")
-            
-    except Exception as e:
-        print(f"❌ 写入 config.json 时出错: {e}")
+    python main.py                 启动 Web UI (等同于 main.py serve)
+    python main.py list|add|remove|import|export|validate|discover|bench-transport ...
+                                   不启动服务器，直接读写 config.json
+
+除 serve 之外的子命令只导入少量标准库 (validate 额外加载 Pydantic，discover / bench-transport 额外加载隧道核心逻辑)，
+FastAPI / uvicorn 只在启动 Web UI 时才加载，脚本调用的启动时间保持在几十毫秒。
+导入耗时可用 bench_startup.py 测量。
+"""
 
+import argparse
+import json
+import sys
+
+from sshtf_config import (
+    CONFIG_PATH, ConfigError, load_config, save_config, find_host, add_host, add_service, remove_host, remove_service,
+    assign_local_ports, validate_config,
+)
+
+
+def __getattr__(name):
+    # 兼容 `uvicorn main:app`：访问 main.app 时才加载 Web 应用
+    if name == 'app':
+        from sshtf_web import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# --- 子命令 ---
+
+def cmd_serve(args) -> int:
+    from sshtf_web import serve
+    print("--- 启动端口转发配置管理器 Web UI (V3) ---")
+    print("--- 拖拽排序 + 复制功能 ---")
+    print("--- 按 CTRL+C 停止 ---")
+    serve(args.host, args.port, uds=args.uds, idle_timeout=args.idle_timeout)
+    return 0
+
+
+def cmd_list(args) -> int:
+    config = load_config()
+    if args.json:
+        print(json.dumps(config['hosts'], ensure_ascii=False, indent=2))
+        return 0
+    if not config['hosts']:
+        print("ℹ️ 没有配置任何主机。")
+        return 0
+    for host in config['hosts']:
+        port = f":{host['sshPort']}" if host.get('sshPort', 22) != 22 else ""
+        via = f" (via {host['proxyJump']})" if host.get('proxyJump') else ""
+        print(f"{host['hostName']}\t{host['sshUser']}@{host['serverIP']}{port}{via}")
+        for service in host.get('services', []):
+            print(f"    {service['serviceName']}\tL:{service.get('localPort', 0)} -> R:{service['remotePort']}")
+    return 0
+
+
+def cmd_add(args) -> int:
+    config = load_config()
+    add_host(config, {
+        'hostName': args.name,
+        'serverIP': args.ip,
+        'sshUser': args.user,
+        'sshPort': args.ssh_port,
+        'proxyJump': args.proxy_jump,
+        'identityFile': args.identity_file,
+        'services': [],
+    })
+    save_config(config)
+    print(f"✅ 已添加主机 '{args.name}'")
+    return 0
+
+
+def cmd_remove(args) -> int:
+    config = load_config()
+    if args.service:
+        remove_service(config, args.name, args.service)
+        message = f"✅ 已从 '{args.name}' 删除服务 '{args.service}'"
+    else:
+        remove_host(config, args.name)
+        message = f"✅ 已删除主机 '{args.name}' 及其所有服务"
+    save_config(config)
+    print(message)
+    return 0
+
+
+def cmd_import(args) -> int:
+    from sshtf_sshconfig import import_ssh_config
+    print("--- 正在执行 SSH Config 导入任务 ---")
+    ok = import_ssh_config(args.ssh_config_path, args.on_conflict)
+    print("--- 导入任务完成 ---")
+    return 0 if ok else 1
+
+
+def cmd_export(args) -> int:
+    config = load_config()
+    if args.format == 'ssh':
+        from sshtf_sshconfig import export_ssh_config
+        output = export_ssh_config(config)
+    else:
+        output = json.dumps(config, ensure_ascii=False, indent=2) + "\n"
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"✅ 已导出 {len(config['hosts'])} 个主机 -> {args.output}", file=sys.stderr)
+    else:
+        sys.stdout.write(output)
+    return 0
+
+
+def cmd_validate(args) -> int:
+    from pathlib import Path
+    path = Path(args.file) if args.file else CONFIG_PATH
+    problems = validate_config(load_config(path))
+    if problems:
+        print(f"❌ {path} 有 {len(problems)} 个问题:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    print(f"✅ {path} 校验通过")
+    return 0
+
+
+def cmd_discover(args) -> int:
+    from sshtf_discovery import discover_hosts_sync, suggest_services
+    config = load_config()
+    hosts = [find_host(config, name) for name in args.hosts] if args.hosts else config['hosts']
+    results = discover_hosts_sync(hosts, refresh=args.refresh)
+    suggestions = {h['hostName']: suggest_services(h, results.get(h['hostName'])) for h in hosts}
+
+    if args.json:
+        print(json.dumps({name: {**results[name], 'suggestions': suggestions[name]} for name in results},
+                         ensure_ascii=False, indent=2))
+    else:
+        for host in hosts:
+            name = host['hostName']
+            result = results[name]
+            if not result['ok']:
+                print(f"❌ {name}: {result['error']}")
+                continue
+            print(f"🔎 {name}: {len(result['ports'])} 个监听端口，{len(suggestions[name])} 个未配置")
+            for service in suggestions[name]:
+                print(f"    {service['serviceName']}\tR:{service['remotePort']}\t({', '.join(service['addresses'])})")
+
+    if args.add:
+        added = 0
+        for name, services in suggestions.items():
+            for service in services:
+                service.pop('addresses')
+                add_service(config, name, service)
+                added += 1
+        if added:
+            assign_local_ports(config)
+            save_config(config)
+        print(f"✅ 已添加 {added} 个服务", file=sys.stderr if args.json else sys.stdout)
+    return 0 if all(r['ok'] for r in results.values()) else 1
+
+
+def cmd_bench_transport(args) -> int:
+    from sshtf_transport import bench_transports, best_transport, format_transport
+    config = load_config()
+    host = find_host(config, args.name)
+    candidates = None
+    if args.cipher:
+        candidates = [{'cipher': cipher} for cipher in args.cipher]
+
+    print(f"🚀 正在测试 {args.name} 的传输参数 (每组 {args.size} MB，{args.payload} 数据，逐组进行)...")
+    print(f"{'加密算法':<34}{'MAC':<32}{'压缩':<6}{'连接':>9}{'延迟':>9}{'吞吐量':>12}")
+
+    def progress(r):
+        compression = "是" if r['compression'] else "否"
+        if r['ok']:
+            print(f"{r['cipher'] or '-':<34}{r['mac'] or '-':<32}{compression:<6}"
+                  f"{r['connectMs']:>7.0f}ms{r['latencyMs']:>7.2f}ms{r['throughputMBps']:>8.1f}MB/s")
+        else:
+            print(f"{r['cipher'] or '-':<34}{r['mac'] or '-':<32}{compression:<6}  ❌ {r['error']}")
+
+    results = bench_transports(host, candidates, size=args.size * 1024 * 1024, payload=args.payload,
+                               rounds=args.rounds, timeout=args.timeout, compression=not args.no_compression,
+                               progress=None if args.json else progress)
+    best = best_transport(results)
+    if args.json:
+        print(json.dumps({'results': results, 'best': best}, ensure_ascii=False, indent=2))
+    if best is None:
+        print("❌ 所有参数都测试失败", file=sys.stderr if args.json else sys.stdout)
+        return 1
+    out = sys.stderr if args.json else sys.stdout
+    print(f"✅ 最快: {format_transport(best)} (当前: {format_transport(host.get('transport'))})", file=out)
+    if args.save:
+        host['transport'] = best
+        save_config(config)
+        print(f"✅ 已保存为 '{args.name}' 的传输参数，之后启动的隧道会自动使用", file=out)
+    return 0
+
+
+# --- 参数解析 ---
+
+def _add_serve_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1", help="Web 服务器监听的地址 (默认: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Web 服务器监听的端口 (默认: 8000)")
+    parser.add_argument(
+        "--uds",
+        metavar="PATH",
+        help="改为监听 Unix domain socket (忽略 --host/--port)。\n以 systemd socket 激活方式启动时自动使用 systemd 传入的套接字。"
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=0,
+        metavar="SECONDS",
+        help="没有请求超过这么多秒后退出 (默认: 0，不退出)。\n通常与 systemd socket 激活一起使用。"
+    )
 
-# --- API Endpoints ---
 
-# 1. 获取所有配置
-@app.get("/api/config", response_model=Config, tags=["Config"])
-async def api_get_config():
-    """获取完整的配置信息"""
-    return await get_config()
+def _add_import_arguments(parser):
+    parser.add_argument(
+        "--on-conflict",
+        choices=["skip", "update"],
+        default="skip",
+        help="导入时遇到已存在的主机名的处理方式 (默认: skip)。\nupdate 会用 ssh 配置覆盖其地址/用户/端口等连接字段，保留已有服务。"
+    )
 
-# 2. 【新增】保存完整配置 (用于拖拽排序)
-@app.put("/api/config", response_model=Config, tags=["Config"])
-async def api_update_config(config: Config):
-    """接收一个完整的配置对象并覆盖保存"""
-    try:
-        await save_config(config)
-        return config
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"保存配置失败: {e}")
-
-# 3. 添加新主机
-@app.post("/api/hosts", response_model=Host, tags=["Hosts"])
-async def api_add_host(host: Host):
-    """添加一个新主机"""
-    config = await get_config()
-    if any(h.hostName == host.hostName for h in config.hosts):
-        raise HTTPException(status_code=400, detail="主机名已存在")
-    
-    config.hosts.append(host)
-    await save_config(config)
-    return host
-
-# 4. 删除主机
-@app.delete("/api/hosts/{host_name}", response_model=dict, tags=["Hosts"])
-async def api_delete_host(host_name: str):
-    """根据主机名删除一个主机"""
-    config = await get_config()
-    original_count = len(config.hosts)
-    config.hosts = [h for h in config.hosts if h.hostName != host_name]
-    
-    if len(config.hosts) == original_count:
-        raise HTTPException(status_code=404, detail="未找到指定的主机名")
-        
-    await save_config(config)
-    return {"message": f"主机 '{host_name}' 已删除"}
-
-# 5. 添加新服务
-@app.post("/api/hosts/{host_name}/services", response_model=Service, tags=["Services"])
-async def api_add_service(host_name: str, service: Service):
-    """为指定的主机添加一个新服务"""
-    config = await get_config()
-    host_found = next((h for h in config.hosts if h.hostName == host_name), None)
-            
-    if not host_found:
-        raise HTTPException(status_code=404, detail="未找到指定的主机名")
-        
-    if any(s.serviceName == service.serviceName for s in host_found.services):
-         raise HTTPException(status_code=400, detail=f"主机 '{host_name}' 下已存在同名服务")
-         
-    host_found.services.append(service)
-    await save_config(config)
-    return service
-
-# 6. 删除服务
-@app.delete("/api/hosts/{host_name}/services/{service_name}", response_model=dict, tags=["Services"])
-async def api_delete_service(host_name: str, service_name: str):
-    """删除指定主机下的指定服务"""
-    config = await get_config()
-    host_found = next((h for h in config.hosts if h.hostName == host_name), None)
-            
-    if not host_found:
-        raise HTTPException(status_code=404, detail="未找到指定的主机名")
-
-    original_service_count = len(host_found.services)
-    host_found.services = [s for s in host_found.services if s.serviceName != service_name]
-    
-    if len(host_found.services) == original_service_count:
-         raise HTTPException(status_code=404, detail="未找到指定的服务名")
-         
-    await save_config(config)
-    return {"message": f"服务 '{service_name}' 已从 '{host_name}' 删除"}
-
-# 7. 修改服务
-@app.put("/api/hosts/{host_name}/services/{original_service_name}", response_model=Service, tags=["Services"])
-async def api_update_service(host_name: str, original_service_name: str, updated_service: Service):
-    """修改指定主机下的指定服务"""
-    config = await get_config()
-    host_found = next((h for h in config.hosts if h.hostName == host_name), None)
-            
-    if not host_found:
-        raise HTTPException(status_code=404, detail="未找到指定的主机名")
-
-    service_index = -1
-    for i, s in enumerate(host_found.services):
-        if s.serviceName == original_service_name:
-            service_index = i
-            break
-            
-    if service_index == -1:
-        raise HTTPException(status_code=404, detail="未找到要修改的原始服务名")
-
-    new_name = updated_service.serviceName
-    if new_name != original_service_name and any(s.serviceName == new_name for s in host_found.services):
-        raise HTTPException(status_code=400, detail=f"服务名 '{new_name}' 已在当前主机下存在")
-
-    host_found.services[service_index] = updated_service
-    await save_config(config)
-    return updated_service
-
-
-# --- 静态文件服务 (前端 UI) ---
-@app.get("/", response_class=HTMLResponse, include_in_schema=False)
-@app.get("/index.html", response_class=HTMLResponse, include_in_schema=False)
-async def get_index():
-    """提供 index.html 前端页面"""
-    file_path = SCRIPT_DIR / "index.html" # 【修改】
-    if not file_path.exists(): # 【修改】
-        return HTMLResponse(content=f"<h1>错误：未找到 {file_path.name}</h1>", status_code=500)
-    async with aiofiles.open(file_path, 'r', encoding='utf-8') as f: # 【修改】
-        return HTMLResponse(content=await f.read())
-
-@app.get("/app.js", include_in_schema=False)
-async def get_js():
-    """提供 app.js 前端逻辑"""
-    file_path = SCRIPT_DIR / "app.js" # 【修改】
-    if not file_path.exists(): # 【修改】
-        return JSONResponse(content={"error": f"未找到 {file_path.name}"}, status_code=500)
-    async with aiofiles.open(file_path, 'r', encoding='utf-8') as f: # 【修改】
-        content = await f.read()
-        return HTMLResponse(content=content, media_type="application/javascript")
-
-
-@app.get("/style.css", include_in_schema=False)
-async def get_style_css(): # 【修改】函数名
-    """提供独立的 style.css 文件"""
-    css_path = SCRIPT_DIR / "style.css" # 【修改】
-    if not css_path.exists(): # 【修改】
-        # 提供一个兜底，以防文件丢失
-        return HTMLResponse(content="/* 错误: 未找到 style.css */", media_type="text/css", status_code=404)
-    return FileResponse(css_path)
-
-@app.get("/button.css", include_in_schema=False)
-async def get_button_css(): # 【修改】函数名
-    """提供独立的 button.css 文件"""
-    css_path = SCRIPT_DIR / "button.css" # 【修改】
-    if not css_path.exists(): # 【修改】
-        return HTMLResponse(content="/* 错误: 未找到 button.css */", media_type="text/css", status_code=404)
-    return FileResponse(css_path)
 
-# --- 用于直接运行 (python main.py) ---
-if __name__ == "__main__":
-    
-    # --- 【修改】添加命令行参数解析 ---
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
-        description="SSH 隧道转发管理器 Web UI.",
+        description="SSH 隧道转发管理器 Web UI 与配置命令行。",
         formatter_class=argparse.RawTextHelpFormatter
     )
+    # 旧用法：python main.py -p ~/.ssh/config，等同于 main.py import ~/.ssh/config
     parser.add_argument(
         "-p", "--path",
         dest="ssh_config_path",
         type=str,
         help="指定 .ssh/config 文件的路径以导入主机。\n如果提供此参数，将只执行导入任务，不会启动 Web 服务器。"
     )
-    args = parser.parse_args()
-
-    if args.ssh_config_path:
-        # --- 执行导入任务 ---
-        print("--- 正在执行 SSH Config 导入任务 ---")
-        try:
-            # 因为 import_ssh_config 是 async, 我们需要用 asyncio.run()
-            asyncio.run(import_ssh_config(args.ssh_config_path))
-        except Exception as e:
-            print(f"❌ 导入过程中发生意外错误: {e}")
-        print("--- 导入任务完成 ---")
-    else:
-        # --- 正常启动 Web 服务器 ---
-        import uvicorn
-        print("--- 启动端口转发配置管理器 Web UI (V3) ---")
-        print("--- 拖拽排序 + 复制功能 ---")
-        print("--- 服务器运行在 http://127.0.0.1:8000 ---")
-        print("--- 按 CTRL+C 停止 ---")
-        uvicorn.run(app, host="127.0.0.1", port=8000)
+    _add_import_arguments(parser)
+    _add_serve_arguments(parser)
+    parser.set_defaults(func=cmd_serve)
+
+    subparsers = parser.add_subparsers(title="子命令", metavar="COMMAND")
+
+    p = subparsers.add_parser("serve", help="启动 Web UI (默认)", formatter_class=argparse.RawTextHelpFormatter)
+    _add_serve_arguments(p)
+    p.set_defaults(func=cmd_serve)
+
+    p = subparsers.add_parser("list", help="列出主机和服务")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出")
+    p.set_defaults(func=cmd_list)
+
+    p = subparsers.add_parser("add", help="添加主机")
+    p.add_argument("name", help="主机名 (别名)")
+    p.add_argument("--ip", required=True, help="服务器地址")
+    p.add_argument("--user", required=True, help="SSH 用户")
+    p.add_argument("--ssh-port", type=int, default=22, help="SSH 端口 (默认: 22)")
+    p.add_argument("--proxy-jump", help="跳板机 (ssh -J 的参数)")
+    p.add_argument("--identity-file", help="私钥文件")
+    p.set_defaults(func=cmd_add)
+
+    p = subparsers.add_parser("remove", help="删除主机，或给出服务名时只删除该服务")
+    p.add_argument("name", help="主机名")
+    p.add_argument("service", nargs="?", help="服务名 (可选)")
+    p.set_defaults(func=cmd_remove)
+
+    p = subparsers.add_parser("import", help="从 ssh_config 导入主机", formatter_class=argparse.RawTextHelpFormatter)
+    p.add_argument("ssh_config_path", metavar="PATH", help="ssh_config 文件，如 ~/.ssh/config")
+    _add_import_arguments(p)
+    p.set_defaults(func=cmd_import)
+
+    p = subparsers.add_parser("export", help="导出配置")
+    p.add_argument("--format", choices=["json", "ssh"], default="json",
+                   help="json: 完整的 config.json；ssh: ssh_config 格式的 Host 块 (默认: json)")
+    p.add_argument("-o", "--output", help="写入文件 (默认输出到标准输出)")
+    p.set_defaults(func=cmd_export)
+
+    p = subparsers.add_parser("discover", help="列出远程主机上监听中的端口，给出尚未配置的服务")
+    p.add_argument("hosts", nargs="*", metavar="HOST", help="主机名 (默认: 全部主机)，每台主机只连接一次，并发执行")
+    p.add_argument("--refresh", action="store_true", help="忽略缓存的结果，重新连接")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出")
+    p.add_argument("--add", action="store_true", help="把未配置的端口作为服务加入配置 (本地端口自动分配)")
+    p.set_defaults(func=cmd_discover)
+
+    p = subparsers.add_parser("bench-transport", help="测试加密算法/压缩设置的吞吐量和延迟，可保存最快的一组")
+    p.add_argument("name", help="主机名 (可以是指向本机测试用 sshd 的主机)")
+    p.add_argument("--cipher", action="append", help="只测试这些加密算法 (可重复，默认: 常见的 AEAD 与 CTR 算法)")
+    p.add_argument("--size", type=int, default=16, help="吞吐量测试的数据量，MB (默认: 16)")
+    p.add_argument("--payload", choices=["random", "text"], default="random",
+                   help="random: 不可压缩的数据；text: 可压缩约一半的文本 (默认: random)")
+    p.add_argument("--rounds", type=int, default=20, help="往返延迟测试的次数 (默认: 20)")
+    p.add_argument("--timeout", type=float, default=60.0, help="每组参数的超时，秒 (默认: 60)")
+    p.add_argument("--no-compression", action="store_true", help="不测试开启压缩的组合")
+    p.add_argument("--save", action="store_true", help="把最快的一组保存为主机的 transport 字段")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出")
+    p.set_defaults(func=cmd_bench_transport)
+
+    p = subparsers.add_parser("validate", help="校验 config.json")
+    p.add_argument("file", nargs="?", help=f"要校验的文件 (默认: {CONFIG_PATH.name})")
+    p.set_defaults(func=cmd_validate)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.func is cmd_serve and args.ssh_config_path:
+        return cmd_import(args)
+    try:
+        return args.func(args)
+    except ConfigError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+# --- 用于直接运行 (python main.py) ---
+if __name__ == "__main__":
+    sys.exit(main())
@@ -36,10 +36,23 @@ show_custom_forward_menu() {
     fi
 }
 
+# 菜单: 主机上尚未配置的监听端口，选择后以相同端口启动转发
+show_discovered_menu() {
+    local host_name="$1"
+    local prompt="󰍉  $host_name"
+    local options=$("$PYTHON_SCRIPT" --list-discovered "$host_name")
+    local choice=$(run_rofi "$options" "$prompt")
+    local remote_port=$(echo "$choice" | sed -n 's/.*(R:\([0-9]*\)).*/\1/p')
+
+    if [ -n "$remote_port" ]; then
+        "$PYTHON_SCRIPT" --start-custom-tunnel "$host_name" "$remote_port" &
+    fi
+}
+
 # 菜单: 服务列表
 show_service_menu() {
     local host_name_full="$1"
-    local host_name=$(echo "$host_name_full" | sed 's/󰪥  //')
+    local host_name=$(echo "$host_name_full" | sed 's/󰪥  //; s/  <span.*//')
     
     local prompt="  $host_name"
     local options=$("$PYTHON_SCRIPT" --list-services "$host_name")
@@ -54,10 +67,18 @@ show_service_menu() {
             "$PYTHON_SCRIPT" --kill-all &
             main_menu
             ;;
+        "󰅙  关闭此主机隧道")
+            "$PYTHON_SCRIPT" --stop-host "$host_name" &
+            show_service_menu "$host_name_full"
+            ;;
         "󰌖  自定义转发")
             show_custom_forward_menu "$host_name"
             show_service_menu "$host_name_full" # 动作完成后返回服务菜单
             ;;
+        "󰍉  发现远程服务")
+            show_discovered_menu "$host_name"
+            show_service_menu "$host_name_full"
+            ;;
         "") # Esc
             exit 0
             ;;
@@ -68,6 +89,51 @@ show_service_menu() {
     esac
 }
 
+# 菜单: 单个隧道组的操作
+show_group_action_menu() {
+    local group_full="$1"
+    local group_name=$(echo "$group_full" | sed 's/󰆧  //; s/  <span.*//')
+    
+    local prompt="󰆧  $group_name"
+    local choice=$(run_rofi "󰐊  启动整组\n󰅙  关闭整组\n󰌍  返回上一级" "$prompt")
+    
+    case "$choice" in
+        "󰐊  启动整组")
+            "$PYTHON_SCRIPT" --start-group "$group_name" &
+            show_group_menu
+            ;;
+        "󰅙  关闭整组")
+            "$PYTHON_SCRIPT" --stop-group "$group_name" &
+            show_group_menu
+            ;;
+        "󰌍  返回上一级")
+            show_group_menu
+            ;;
+        "") # Esc
+            exit 0
+            ;;
+    esac
+}
+
+# 菜单: 隧道组列表
+show_group_menu() {
+    local prompt="󰆧  隧道组"
+    local options=$("$PYTHON_SCRIPT" --list-groups)
+    local choice=$(run_rofi "$options" "$prompt")
+    
+    case "$choice" in
+        "󰌍  返回上一级")
+            main_menu
+            ;;
+        "") # Esc
+            exit 0
+            ;;
+        *)  # 这是一个隧道组
+            show_group_action_menu "$choice"
+            ;;
+    esac
+}
+
 # 菜单: 主机列表 (主入口)
 main_menu() {
     local tunnel_count=$("$PYTHON_SCRIPT" --get-tunnel-count)
@@ -77,6 +143,17 @@ main_menu() {
     local choice=$(run_rofi "$options" "$prompt")
     
     case "$choice" in
+        "󰆧  隧道组")
+            show_group_menu
+            ;;
+        "󰑓  恢复上次的隧道")
+            "$PYTHON_SCRIPT" --restore &
+            main_menu
+            ;;
+        "󰒲  恢复空闲关闭的隧道")
+            "$PYTHON_SCRIPT" --revive &
+            main_menu
+            ;;
         "󰔰  清理所有隧道")
             "$PYTHON_SCRIPT" --kill-all &
             main_menu
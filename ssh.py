@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
 import json
 import os
-import subprocess
 import sys
 import time
 import webbrowser
+import argparse
 from pathlib import Path
 
 try:
@@ -17,6 +18,17 @@ except ImportError:
     print("请先运行: pip install psutil colorama")
     sys.exit(1)
 
+from sshtf_core import (launch_tunnel, scan_tunnels, find_tunnels, stop_tunnels, listening_ports,
+                        start_group, stop_group, prewarm, prewarm_supported, reap_idle_masters,
+                        wait_tunnel_ready, snapshot_tunnels, load_snapshot, restore_snapshot,
+                        reap_idle_tunnels, load_reaped, revive_reaped, reconcile, find_group)
+from sshtf_log import read_events
+from sshtf_usage import record_use, rank_hosts, rank_services, use_frecency_order
+from sshtf_probe import probe_hosts_sync, probe_hosts_nowait, format_badge
+from sshtf_discovery import discover_hosts_sync, suggest_services
+from sshtf_ondemand import serve_on_demand, ONDEMAND_POLL_INTERVAL
+from sshtf_failover import watch_failover, failover_status, FAILOVER_POLL_INTERVAL
+
 
 # --- 配置 ---
 
@@ -38,51 +50,33 @@ CONFIG = {}
 def get_matching_ssh_processes():
     """
     扫描系统，查找所有由该脚本启动的 ssh.exe 隧道进程。
-    这是通过匹配命令行参数的特定组合来实现的。
+    这是通过匹配命令行参数的特定组合来实现的 (见 sshtf_core.is_tunnel_cmdline)。
     """
-    matching_processes = []
     try:
-        # 迭代所有进程，请求 cmdline 信息
-        all_processes = list(psutil.process_iter(['pid', 'name', 'cmdline']))
+        return [t['proc'] for t in scan_tunnels()]
     except Exception as e:
         print(f"{Fore.RED}❌ 无法查询系统进程: {e}。可能需要管理员权限。")
         return []
 
-    for proc in all_processes:
-        try:
-            # 确保进程名是 ssh.exe (不区分大小写)
-            if proc.info['name'] and proc.info['name'].lower() == 'ssh':
-                # 将 cmdline 列表合并为字符串，以便于搜索
-                cmdline_str = " ".join(proc.info['cmdline'] or [])
-
-                # 定义我们脚本启动的隧道的独特特征
-                if (
-                    "-o StrictHostKeyChecking=no" in cmdline_str and
-                    "-o UserKnownHostsFile=NUL" in cmdline_str and
-                    "-N" in cmdline_str and  # 确保 -N 存在
-                    "-L" in cmdline_str and  # 确保 -L 存在
-                    "-o ServerAliveInterval=60" in cmdline_str
-                ):
-                    matching_processes.append(proc)
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            # 进程可能已经结束，或者我们没有权限访问
-            continue
-        except Exception as e:
-            # 捕获其他潜在错误
-            print(f"{Fore.YELLOW}警告：检查进程 {proc.pid} 时出错: {e}")
-    
-    return matching_processes
 # --- 全局隧道计数器 ---
 # 我们使用一个全局变量来缓存隧道数量，避免在每次菜单刷新时都扫描所有进程
 G_ACTIVE_TUNNEL_COUNT = 0
 
-def update_active_tunnel_count(force_scan=True):
+def update_active_tunnel_count(force_scan=True, snapshot=False):
     """
     (昂贵的操作) 
     执行实际的进程扫描并更新全局计数器。
+    snapshot 为 True 时顺便用同一次扫描的结果更新隧道快照 (用于 --restore)。
     """
     global G_ACTIVE_TUNNEL_COUNT
-    if force_scan:
+    if force_scan and snapshot:
+        try:
+            tunnels = scan_tunnels()
+            snapshot_tunnels(CONFIG, tunnels)
+            G_ACTIVE_TUNNEL_COUNT = len(tunnels)
+        except Exception as e:
+            print(f"{Fore.RED}❌ 无法查询系统进程: {e}。可能需要管理员权限。")
+    elif force_scan:
         # 强制执行昂贵的进程扫描
         G_ACTIVE_TUNNEL_COUNT = len(get_matching_ssh_processes())
     return G_ACTIVE_TUNNEL_COUNT
@@ -95,64 +89,471 @@ def get_active_tunnel_count():
     global G_ACTIVE_TUNNEL_COUNT
     return G_ACTIVE_TUNNEL_COUNT
 
-def kill_running_ssh_tunnels(no_pause=False):
+def stop_selected_tunnels(host_name=None, service_name=None, local_port=None, timeout=3.0, no_pause=False):
     """
-    查找并终止所有匹配的 SSH 隧道进程。
+    按主机 / 服务 / 本地端口筛选并关闭隧道 (条件都为空时关闭全部)。
+    先同时发送 SIGTERM，统一等待 timeout 秒，仍未退出的再强制结束。
     """
-    print(f"{Fore.YELLOW}--- 正在搜索并关闭所有活动隧道 ---")
-    
-    # 扫描操作在这里执行一次
-    tunnel_processes = get_matching_ssh_processes()
-    
-    if not tunnel_processes:
-        print("隧道清理完毕。")
-        # 确保计数器同步
-        update_active_tunnel_count(force_scan=False) # 强制设为0（因为len是0）
-        G_ACTIVE_TUNNEL_COUNT = 0 # 或者直接设为0
-        time.sleep(1)
+    global G_ACTIVE_TUNNEL_COUNT
+
+    try:
+        tunnels = find_tunnels(CONFIG, host_name=host_name, service_name=service_name, local_port=local_port)
+    except Exception as e:
+        print(f"{Fore.RED}❌ 无法查询系统进程: {e}。可能需要管理员权限。")
+        tunnels = []
+
+    if not tunnels:
+        print("没有找到匹配的隧道。")
+        if not no_pause:
+            time.sleep(1)
         return
 
-    print(f"正在尝试关闭 {len(tunnel_processes)} 个匹配的隧道...")
-    
-    for proc in tunnel_processes:
+    if host_name is None and service_name is None and local_port is None:
+        # 关闭全部之前记下当前的隧道，之后可用 --restore 一次性恢复
         try:
-            # proc.kill() 相当于 Stop-Process -Force
-            proc.kill()
-            print(f"{Fore.GREEN}✅ 已关闭隧道 (PID: {proc.pid})")
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            print(f"{Fore.RED}❌ 关闭隧道 (PID: {proc.pid}) 时出错: 进程已不存在或无权限。")
-        except Exception as e:
-            print(f"{Fore.RED}❌ 关闭隧道 (PID: {proc.pid}) 时出错: {e}")
+            snapshot_tunnels(CONFIG, tunnels)
+        except OSError as e:
+            print(f"{Fore.YELLOW}⚠️ 保存隧道快照失败: {e}")
+
+    print(f"正在尝试关闭 {len(tunnels)} 个匹配的隧道...")
+    result = stop_tunnels(tunnels, timeout=timeout)
+
+    for pid in result['terminated']:
+        print(f"{Fore.GREEN}✅ 已关闭隧道 (PID: {pid})")
+    for pid in result['killed']:
+        print(f"{Fore.YELLOW}⚠️ 隧道未在 {timeout:g} 秒内退出，已强制结束 (PID: {pid})")
+    for pid in result['failed']:
+        print(f"{Fore.RED}❌ 关闭隧道 (PID: {pid}) 时出错: 无权限或进程无法结束。")
 
     print("--------------------")
     print("隧道清理完毕。")
-    
-    # !!! 修改点：清理后立即强制更新全局计数器 !!!
-    update_active_tunnel_count(force_scan=True)
-    
+
+    # 直接按结果更新计数器，无需再扫描一次进程表
+    stopped = len(result['terminated']) + len(result['killed'])
+    G_ACTIVE_TUNNEL_COUNT = max(0, G_ACTIVE_TUNNEL_COUNT - stopped)
+
     if not no_pause:
         # 仅在非退出时（即用户手动选'k'时）暂停
         input("按 Enter 键继续...")
 
-    print(f"正在尝试关闭 {len(tunnel_processes)} 个匹配的隧道...")
-    
-    for proc in tunnel_processes:
-        try:
-            # proc.kill() 相当于 Stop-Process -Force
-            proc.kill()
-            print(f"{Fore.GREEN}✅ 已关闭隧道 (PID: {proc.pid})")
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            print(f"{Fore.RED}❌ 关闭隧道 (PID: {proc.pid}) 时出错: 进程已不存在或无权限。")
-        except Exception as e:
-            print(f"{Fore.RED}❌ 关闭隧道 (PID: {proc.pid}) 时出错: {e}")
+def kill_running_ssh_tunnels(no_pause=False):
+    """
+    查找并终止所有匹配的 SSH 隧道进程。
+    """
+    print(f"{Fore.YELLOW}--- 正在搜索并关闭所有活动隧道 ---")
+    stop_selected_tunnels(no_pause=no_pause)
+
+
+# --- 隧道组 ---
+
+def start_tunnel_group(group_name: str, no_pause=False):
+    """
+    并行启动一个隧道组 (同一主机上的服务共用一个 ssh 连接)。
+    """
+    print(f"{Fore.CYAN}🚀 正在并行启动隧道组 '{group_name}'...")
+    try:
+        results = start_group(CONFIG, group_name, busy_ports=get_listening_ports())
+    except KeyError as e:
+        print(f"{Fore.RED}❌ {e.args[0]}")
+        results = None
+
+    for r in results or []:
+        member = f"{r['hostName']}/{r['serviceName']}"
+        if r['status'] == 'started':
+            print(f"{Fore.GREEN}✅ {member}: localhost:{r['localPort']} (PID: {r['pid']})")
+        elif r['status'] == 'running':
+            print(f"{Fore.CYAN}ℹ️ {member}: 已在运行 (PID: {r['pid']})")
+        else:
+            print(f"{Fore.RED}❌ {member}: {r['error']}")
+    if results is not None:
+        update_active_tunnel_count(force_scan=True, snapshot=True)
+
+    if not no_pause:
+        input("按 Enter 键继续...")
+
+def stop_tunnel_group(group_name: str, timeout=3.0, no_pause=False):
+    """
+    关闭一个隧道组中所有成员的隧道。
+    """
+    global G_ACTIVE_TUNNEL_COUNT
+
+    try:
+        result = stop_group(CONFIG, group_name, timeout=timeout)
+    except KeyError as e:
+        print(f"{Fore.RED}❌ {e.args[0]}")
+        result = None
+    except Exception as e:
+        print(f"{Fore.RED}❌ 无法查询系统进程: {e}。可能需要管理员权限。")
+        result = None
+
+    if result is not None and not result['matched']:
+        print(f"隧道组 '{group_name}' 没有正在运行的隧道。")
+    elif result is not None:
+        for pid in result['terminated']:
+            print(f"{Fore.GREEN}✅ 已关闭隧道 (PID: {pid})")
+        for pid in result['killed']:
+            print(f"{Fore.YELLOW}⚠️ 隧道未在 {timeout:g} 秒内退出，已强制结束 (PID: {pid})")
+        for pid in result['failed']:
+            print(f"{Fore.RED}❌ 关闭隧道 (PID: {pid}) 时出错: 无权限或进程无法结束。")
+        stopped = len(result['terminated']) + len(result['killed'])
+        G_ACTIVE_TUNNEL_COUNT = max(0, G_ACTIVE_TUNNEL_COUNT - stopped)
 
-    print("--------------------")
-    print("隧道清理完毕。")
-    
     if not no_pause:
-        # 仅在非退出时（即用户手动选'k'时）暂停
         input("按 Enter 键继续...")
 
+# --- 声明式收敛 ---
+
+def describe_tunnel(tunnel: dict) -> str:
+    forwards = ", ".join(f"{local}->{remote}" for local, remote in tunnel['forwards'])
+    services = f" [{', '.join(tunnel['services'])}]" if tunnel.get('services') else ""
+    return f"{tunnel.get('hostName') or tunnel['destination']}{services} ({forwards}, PID: {tunnel['pid']})"
+
+def reconcile_tunnels(members: list, group_names: list = None, dry_run=False, timeout=3.0):
+    """
+    让正在运行的隧道收敛到给定的 主机名/服务名 集合 (可加上隧道组的成员)：只启动缺少的，只关闭多余的。
+    dry_run 时只打印计划。返回是否全部成功。
+    """
+    desired = []
+    for member in members:
+        host_name, sep, service_name = member.partition('/')
+        if not sep:
+            print(f"{Fore.RED}❌ 无效的格式 '{member}'，应为 主机名/服务名")
+            return False
+        desired.append({'hostName': host_name, 'serviceName': service_name})
+    for group_name in group_names or []:
+        group = find_group(CONFIG, group_name)
+        if group is None:
+            print(f"{Fore.RED}❌ 未找到隧道组 '{group_name}'")
+            return False
+        desired += [{'hostName': m.get('hostName'), 'serviceName': m.get('serviceName')} for m in group.get('members', [])]
+
+    try:
+        result = reconcile(CONFIG, desired, timeout=timeout, dry_run=dry_run)
+    except Exception as e:
+        print(f"{Fore.RED}❌ 无法查询系统进程: {e}。可能需要管理员权限。")
+        return False
+
+    print(f"{Fore.CYAN}{'收敛计划 (dry run，未做任何修改)' if dry_run else '收敛计划'}:")
+    for m in result['missing']:
+        print(f"{Fore.RED}  ❌ 配置中不存在: {m['hostName']}/{m['serviceName']}")
+    for m in result['keep']:
+        print(f"  = 保持: {m['hostName']}/{m['serviceName']}")
+    for t in result['stop']:
+        print(f"{Fore.YELLOW}  - 关闭: {describe_tunnel(t)}")
+    for t in result['restart']:
+        print(f"{Fore.YELLOW}  ~ 重启 (进程中有多余的转发): {describe_tunnel(t)}")
+    for item in result['start']:
+        print(f"{Fore.GREEN}  + 启动: {item['hostName']}/{item['serviceName'] or item['remotePort']} (本地端口 {item['localPort']})")
+    for t in result['unmanaged']:
+        print(f"{Style.DIM}  · 不在收敛范围内: {describe_tunnel(t)}")
+    if not (result['stop'] or result['restart'] or result['start']):
+        print(f"{Fore.GREEN}✅ 已经是期望的状态，无需修改。")
+        return not result['missing']
+    if result['missing']:
+        print(f"{Fore.RED}❌ 期望集合中有配置里不存在的服务，未做任何修改。")
+        return False
+    if dry_run:
+        return True
+
+    for pid in result['stopped']['terminated'] + result['stopped']['killed']:
+        print(f"{Fore.GREEN}✅ 已关闭隧道 (PID: {pid})")
+    for pid in result['stopped']['failed']:
+        print(f"{Fore.RED}❌ 关闭隧道 (PID: {pid}) 时出错: 无权限或进程无法结束。")
+    for r in result['started']:
+        member = f"{r['hostName']}/{r['serviceName'] or r['remotePort']}"
+        if r['status'] in ('started', 'running'):
+            print(f"{Fore.GREEN}✅ {member}: localhost:{r['localPort']} (PID: {r['pid']})")
+        else:
+            print(f"{Fore.RED}❌ {member}: {r['error']}")
+    update_active_tunnel_count(force_scan=True, snapshot=True)
+    failed = result['stopped']['failed'] or any(r['status'] not in ('started', 'running') for r in result['started'])
+    return not (failed or result['missing'])
+
+# --- 隧道快照 ---
+
+def save_tunnel_snapshot():
+    """
+    记录当前运行的隧道，供 --restore 恢复。
+    """
+    try:
+        entries = snapshot_tunnels(CONFIG)
+    except Exception as e:
+        print(f"{Fore.RED}❌ 保存隧道快照失败: {e}")
+        return
+    if not entries:
+        print("没有正在运行的隧道，保留原有快照。")
+        return
+    print(f"{Fore.GREEN}✅ 已记录 {len(entries)} 个转发:")
+    for e in entries:
+        print(f"   {e['hostName']}/{e['serviceName'] or '自定义'}: localhost:{e['localPort']} -> {e['remotePort']}")
+
+def restore_tunnels(no_pause=False):
+    """
+    并行重新打开快照中的所有隧道，尽量沿用原来的本地端口。
+    """
+    snapshot = load_snapshot()
+    if not snapshot['tunnels']:
+        print("没有可恢复的隧道快照。")
+    else:
+        saved_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot['savedAt'] or 0))
+        print(f"{Fore.CYAN}🚀 正在并行恢复 {len(snapshot['tunnels'])} 个转发 (快照时间 {saved_at})...")
+        print_reopened(restore_snapshot(CONFIG, busy_ports=get_listening_ports()))
+        update_active_tunnel_count(force_scan=True, snapshot=True)
+
+    if not no_pause:
+        input("按 Enter 键继续...")
+
+def print_reopened(results: list):
+    """
+    打印 restore_snapshot() / revive_reaped() 的结果 (每项带有 previousPort)。
+    """
+    for r in results:
+        member = f"{r['hostName']}/{r['serviceName'] or r['remotePort']}"
+        if r['status'] == 'started':
+            moved = f" (原端口 {r['previousPort']} 已被占用)" if r['localPort'] != r['previousPort'] else ""
+            print(f"{Fore.GREEN}✅ {member}: localhost:{r['localPort']}{moved} (PID: {r['pid']})")
+        elif r['status'] == 'running':
+            print(f"{Fore.CYAN}ℹ️ {member}: 已在运行 localhost:{r['localPort']} (PID: {r['pid']})")
+        else:
+            print(f"{Fore.RED}❌ {member}: {r['error']}")
+
+# --- 空闲隧道回收 ---
+
+def run_reaper(interval: float = None):
+    """
+    采样一次隧道的客户端连接，关闭空闲超过服务 idleTimeout 的隧道。
+    给出 interval 时每隔 interval 秒重复一次 (Ctrl+C 结束)，间隔应远小于最短的 idleTimeout。
+    """
+    while True:
+        for r in reap_idle_tunnels(CONFIG):
+            print(f"{Fore.YELLOW}💤 已关闭空闲隧道: {r['hostName']}/{r['serviceName']} "
+                  f"localhost:{r['localPort']} (空闲 {r['idleSeconds']} 秒)")
+        if interval is None:
+            return
+        time.sleep(interval)
+
+def run_on_demand(host_name: str = None, interval: float = None):
+    """
+    为 onDemand 服务监听本地端口，第一个连接到来时才启动隧道 (Ctrl+C 结束)。
+    每隔 interval 秒重新监听已空出的端口，并关闭空闲超时的隧道。
+    """
+    asyncio.run(serve_on_demand(CONFIG, [host_name] if host_name else None,
+                                interval or ONDEMAND_POLL_INTERVAL))
+
+def revive_tunnels(host_name: str = None, service_name: str = None, no_pause=False):
+    """
+    重新打开因空闲被关闭的隧道，尽量沿用原来的本地端口。
+    """
+    if not load_reaped():
+        print("没有因空闲被关闭的隧道。")
+    else:
+        print(f"{Fore.CYAN}🚀 正在重新打开因空闲被关闭的隧道...")
+        print_reopened(revive_reaped(CONFIG, host_name, service_name, busy_ports=get_listening_ports()))
+        update_active_tunnel_count(force_scan=True, snapshot=True)
+
+    if not no_pause:
+        input("按 Enter 键继续...")
+
+# --- 多主机故障转移 ---
+
+def run_failover(names: list = None, interval: float = None):
+    """
+    把故障转移服务转发到延迟最低的候选主机，隧道断开后在同一个本地端口上切换到其他主机 (Ctrl+C 结束)。
+    每隔 interval 秒检查一次隧道。
+    """
+    def notify(message):
+        print(f"{time.strftime('%H:%M:%S')} {message}")
+
+    watch_failover(CONFIG, names or None, interval or FAILOVER_POLL_INTERVAL, notify=notify)
+
+def print_failover_status():
+    """打印每个故障转移服务当前转发的主机和最近的切换记录"""
+    status = failover_status(CONFIG)
+    if not status:
+        print("没有配置多主机故障转移 (failover) 的服务。")
+        return
+    for entry in status:
+        candidates = " > ".join(entry['hosts'])
+        if entry['hostName']:
+            since = time.strftime('%m-%d %H:%M:%S', time.localtime(entry['since'])) if entry['since'] else "-"
+            latency = f"{entry['latencyMs']:.0f}ms" if entry['latencyMs'] is not None else "-"
+            print(f"{Fore.GREEN}✅ {entry['serviceName']}: localhost:{entry['localPort']} -> {entry['hostName']}"
+                  f"{Style.RESET_ALL} (PID: {entry['pid']}，延迟 {latency}，自 {since})  {Style.DIM}候选: {candidates}")
+        else:
+            print(f"{Fore.RED}❌ {entry['serviceName']}: localhost:{entry['localPort']} 未运行"
+                  f"{Style.RESET_ALL}  {Style.DIM}候选: {candidates}")
+        for switch in entry['switches'][-5:]:
+            when = time.strftime('%m-%d %H:%M:%S', time.localtime(switch['ts']))
+            latency = f" ({switch['latencyMs']:.0f}ms)" if switch.get('latencyMs') is not None else ""
+            print(f"    {Fore.MAGENTA}🔀 {when} {switch['fromHost']} -> {switch['toHost']}{latency}")
+
+def group_menu():
+    """
+    显示隧道组菜单：选择一个组后整体启动或关闭。
+    """
+    while True:
+        groups = CONFIG.get('groups', [])
+        clear_screen()
+        print(f"{Fore.MAGENTA}===========================================")
+        print(f"{Fore.MAGENTA}              隧道组")
+        print(f"{Fore.CYAN}   (当前共 {get_active_tunnel_count()} 个活动隧道)")
+        print(f"{Fore.MAGENTA}===========================================")
+
+        for i, group in enumerate(groups):
+            members = ", ".join(f"{m.get('hostName')}/{m.get('serviceName')}" for m in group.get('members', []))
+            print(f" {i + 1}. {group.get('groupName', 'N/A')}  {Style.DIM}({members})")
+        print(" b. 返回主机列表")
+        print(f"{Fore.MAGENTA}===========================================")
+        print()
+
+        choice = input("请选择隧道组: ").strip().lower()
+        if choice == 'b':
+            return
+        if not choice.isdigit() or not 0 < int(choice) <= len(groups):
+            print(f"{Fore.RED}无效的选择，请重新输入。")
+            time.sleep(2)
+            continue
+
+        group_name = groups[int(choice) - 1].get('groupName')
+        action = input(f"'{group_name}': s. 启动整组 / k. 关闭整组 / 其他键返回: ").strip().lower()
+        if action == 's':
+            start_tunnel_group(group_name)
+        elif action == 'k':
+            stop_tunnel_group(group_name)
+
+
+# --- 连接预热 ---
+
+def run_prewarm(interval: float = None):
+    """
+    按使用记录为最常用的主机建立主连接，并回收空闲的主连接。
+    给出 interval 时每隔 interval 秒重复一次 (Ctrl+C 结束)，适合在登录时后台运行。
+    """
+    if not prewarm_supported():
+        print(f"{Fore.YELLOW}当前平台的 ssh 不支持 ControlMaster，无法预热连接。")
+        return
+
+    while True:
+        result = prewarm(CONFIG)
+        for host_name in result['opened']:
+            print(f"{Fore.GREEN}🔥 已预热: {host_name}")
+        for host_name in result['kept']:
+            print(f"{Fore.CYAN}ℹ️ 保持预热: {host_name}")
+        for host_name in result['closed']:
+            print(f"{Fore.YELLOW}💤 已关闭空闲连接: {host_name}")
+        for host_name, error in result['failed'].items():
+            print(f"{Fore.RED}❌ 预热 {host_name} 失败: {error}")
+        if not any(result.values()):
+            print("没有可预热的主机 (尚无使用记录)。")
+        if interval is None:
+            return
+        time.sleep(interval)
+
+
+# --- 主机可达性 ---
+
+# 延迟超过该值 (毫秒) 时用黄色标记
+SLOW_LATENCY_MS = 200
+
+def host_badge(result: dict) -> str:
+    """主机菜单中的状态标记，如 [23ms] (绿色) / [超时] (红色)"""
+    if not result:
+        return f"{Style.DIM}[{format_badge(result)}]"
+    if not result['ok']:
+        color = Fore.RED
+    elif result['latencyMs'] > SLOW_LATENCY_MS:
+        color = Fore.YELLOW
+    else:
+        color = Fore.GREEN
+    return f"{color}[{format_badge(result)}]"
+
+def print_host_status():
+    """强制重新探测所有主机并打印结果"""
+    hosts = CONFIG.get('hosts', [])
+    print(f"{Fore.CYAN}🔎 正在并发探测 {len(hosts)} 台主机的 SSH 端口...")
+    started = time.perf_counter()
+    results = probe_hosts_sync(hosts, refresh=True)
+    for host in hosts:
+        result = results.get(host.get('hostName'))
+        via = f" (经由 {result['via']})" if result and result.get('via') else ""
+        print(f" {host_badge(result)}{Style.RESET_ALL} {host.get('hostName')}  {Style.DIM}{result['target'] if result else ''}{via}")
+    print(f"完成，用时 {time.perf_counter() - started:.2f} 秒。")
+
+
+# --- 远程服务发现 ---
+
+def print_discovered_services(host_names=None, refresh=False):
+    """
+    并发列出主机上监听中的端口 (每台主机一次 ssh)，显示尚未配置的服务。
+    """
+    hosts = CONFIG.get('hosts', [])
+    if host_names:
+        hosts = [h for h in hosts if h.get('hostName') in host_names]
+        for name in set(host_names) - {h.get('hostName') for h in hosts}:
+            print(f"{Fore.RED}❌ 未找到主机: {name}")
+    print(f"{Fore.CYAN}🔎 正在发现 {len(hosts)} 台主机上的服务...")
+    results = discover_hosts_sync(hosts, refresh=refresh)
+    for host in hosts:
+        name = host.get('hostName')
+        result = results.get(name)
+        if not result['ok']:
+            print(f"{Fore.RED}❌ {name}: {result['error']}")
+            continue
+        suggestions = suggest_services(host, result)
+        print(f"{Fore.GREEN}✅ {name}: {len(result['ports'])} 个监听端口，{len(suggestions)} 个未配置")
+        for service in suggestions:
+            print(f"   {service['serviceName']}: 远程 {service['remotePort']} ({', '.join(service['addresses'])})")
+    print("(可用 python main.py discover <主机> --add 加入配置)")
+
+
+def discovered_service_menu(selected_host: dict):
+    """
+    列出主机上尚未配置的监听端口，选择后以相同的本地端口启动一个临时转发。
+    """
+    host_name = selected_host.get('hostName')
+    print(f"{Fore.CYAN}🔎 正在列出 {host_name} 上监听中的端口...")
+    result = discover_hosts_sync([selected_host]).get(host_name)
+    if not result['ok']:
+        print(f"{Fore.RED}❌ 发现失败: {result['error']}")
+        input("按 Enter 键继续...")
+        return
+    suggestions = suggest_services(selected_host, result)
+    if not suggestions:
+        print("没有尚未配置的监听端口。")
+        input("按 Enter 键继续...")
+        return
+
+    for i, service in enumerate(suggestions):
+        print(f" {i + 1}. {service['serviceName']} (远程: {service['remotePort']}，监听于 {', '.join(service['addresses'])})")
+    print(f"{Fore.CYAN}(可用 python main.py discover {host_name} --add 加入配置)")
+    choice = input("请选择要转发的端口 (直接回车返回): ").strip()
+    if not choice.isdigit() or not 0 < int(choice) <= len(suggestions):
+        return
+    remote_port = suggestions[int(choice) - 1]['remotePort']
+    start_tunnel(selected_host.get('serverIP'), selected_host.get('sshUser'), remote_port, remote_port,
+                 host_config=selected_host)
+    input("\n操作完成，按 Enter 键返回服务菜单...")
+
+
+# --- 生命周期事件 ---
+
+EVENT_COLORS = {'spawn': Fore.CYAN, 'ready': Fore.GREEN, 'failure': Fore.RED, 'exit': Fore.YELLOW, 'stop': Fore.YELLOW,
+                'switch': Fore.MAGENTA}
+
+def print_events(limit: int = 20):
+    """打印最近的隧道生命周期事件 (spawn / ready / failure / exit / stop / reap / switch)"""
+    events = read_events(limit)
+    if not events:
+        print("暂无隧道事件。")
+        return
+    for event in events:
+        when = time.strftime('%m-%d %H:%M:%S', time.localtime(event.get('ts', 0)))
+        details = {k: v for k, v in event.items() if k not in ('ts', 'event', 'pid', 'stderr', 'id')}
+        print(f"{when} {EVENT_COLORS.get(event['event'], '')}{event['event']:<8}{Style.RESET_ALL} "
+              f"PID {event.get('pid')}  {Style.DIM}{json.dumps(details, ensure_ascii=False)}")
+        for line in event.get('stderr') or []:
+            print(f"{Fore.RED}    {line}")
+
 
 # --- 辅助函数 ---
 
@@ -162,23 +563,20 @@ def clear_screen():
     """
     os.system('cls' if os.name == 'nt' else 'clear')
 
-def is_port_in_use(port: int) -> bool:
+def get_listening_ports() -> set:
     """
-    检查本地端口是否处于 LISTEN 状态。
-    (相当于 Get-NetTCPConnection -LocalPort $port -State Listen)
+    一次性获取所有处于 LISTEN 状态的本地端口 (用于端口自动递增，避免逐个端口扫描)。
     """
     try:
-        for conn in psutil.net_connections(kind='tcp'):
-            if conn.laddr and conn.laddr.port == port and conn.status == psutil.CONN_LISTEN:
-                return True
+        return listening_ports()
     except psutil.AccessDenied:
         print(f"{Fore.YELLOW}警告：无权限检查所有端口连接。端口检查可能不准确。")
     except Exception as e:
-        print(f"{Fore.YELLOW}警告：检查端口 {port} 时出错: {e}。")
-    return False
+        print(f"{Fore.YELLOW}警告：检查端口时出错: {e}。")
+    return set()
 
 
-def start_tunnel(server_ip: str, ssh_user: str, local_port: int, remote_port: int, selected_service: dict = None):
+def start_tunnel(server_ip: str, ssh_user: str, local_port: int, remote_port: int, selected_service: dict = None, host_config: dict = None):
     """
     处理端口检查、自动递增并启动 SSH 进程。
     """
@@ -187,8 +585,9 @@ def start_tunnel(server_ip: str, ssh_user: str, local_port: int, remote_port: in
     
     original_local_port = local_port
     
-    # 循环检查端口，如果被占用则自动 +1
-    while is_port_in_use(local_port):
+    # 只读取一次系统监听端口，如果被占用则自动 +1
+    busy_ports = get_listening_ports()
+    while local_port in busy_ports:
         print(f"{Fore.YELLOW}❌ 端口 {local_port} 已经被占用。")
         local_port += 1
         print(f"{Fore.YELLOW}➡️ 正在尝试下一个可用端口: {local_port}...")
@@ -206,39 +605,31 @@ def start_tunnel(server_ip: str, ssh_user: str, local_port: int, remote_port: in
     print(f"   - 连接保持间隔: 60 秒")
     print()
     
-    # 构建 ssh.exe 命令参数列表
-    ssh_args = [
-        "ssh",
-        "-o", "StrictHostKeyChecking=no",
-        "-o", "UserKnownHostsFile=NUL",
-        "-N",  # 不执行远程命令
-        "-L", f"{local_port}:localhost:{remote_port}", # 转发
-        f"{ssh_user}@{server_ip}",
-        "-o", "ServerAliveInterval=60"
-    ]
+    # 主机上的 sshPort / identityFile / proxyJump 也一并带上
+    host = dict(host_config or {})
+    host.update({'serverIP': server_ip, 'sshUser': ssh_user})
     
     # === 启动后台进程 (相当于 Start-Process -WindowStyle Hidden) ===
     try:
-        # 在 Windows 上，使用 CREATE_NO_WINDOW 标志来隐藏窗口
-        creation_flags = 0
-        if os.name == 'nt':
-            creation_flags = subprocess.CREATE_NO_WINDOW
-        
-        # 使用 Popen 启动进程，并将 stdin/out/err 重定向到 DEVNULL
-        # 这使其成为一个完全分离的后台进程
-        process = subprocess.Popen(
-            ssh_args,
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            creationflags=creation_flags
-        )
-        
-        print(f"{Fore.GREEN}✅ 隧道已在后台启动 (PID: {process.pid})。")
-        print(f"{Fore.YELLOW}   【重要】此模式要求使用 [SSH 密钥] 进行免密登录。")
-        print(f"{Fore.YELLOW}   如果连接失败 (如需密码)，后台进程会静默退出。")
-        time.sleep(0.25) # 250ms 应该足够
-        update_active_tunnel_count(force_scan=True)
+        process = launch_tunnel(host, [(local_port, remote_port)])
+        print(f"{Fore.CYAN}⏳ ssh 进程已启动 (PID: {process.pid})，正在等待端口转发就绪...")
+        ready = wait_tunnel_ready(process, [(local_port, remote_port)])
+
+        if ready['status'] == 'failed':
+            print(f"{Fore.RED}❌ 隧道启动失败: ssh 在 {ready['elapsedMs']:.0f} ms 后退出 (退出码 {ready['exitCode']})。")
+            for line in ready['stderr']:
+                print(f"{Fore.RED}   {line}")
+            print(f"{Fore.YELLOW}   【重要】此模式要求使用 [SSH 密钥] 进行免密登录。")
+            print()
+            return
+
+        # 记录使用情况 (用于连接预热和菜单排序)
+        record_use(host.get('hostName') or server_ip, (selected_service or {}).get('serviceName'))
+        if ready['status'] == 'ready':
+            print(f"{Fore.GREEN}✅ 隧道已就绪 (PID: {process.pid}，用时 {ready['elapsedMs']:.0f} ms)。")
+        else:
+            print(f"{Fore.YELLOW}⚠️ 隧道仍在连接中 (PID: {process.pid})，稍后可用 --events 查看结果。")
+        update_active_tunnel_count(force_scan=True, snapshot=True)
     except FileNotFoundError:
         print(f"{Fore.RED}❌ 启动 SSH 进程失败: 未找到 'ssh.exe'。")
         print(f"   请确保 ssh.exe (通常随 Git for Windows 或 OpenSSH) 在您的系统 PATH 中。")
@@ -301,13 +692,19 @@ def service_menu(selected_host: dict):
         print(f"{Fore.CYAN}   (当前共 {get_active_tunnel_count()} 个活动隧道)")
         print(f"{Fore.GREEN}===========================================")
 
-        # 动态生成服务菜单
+        # 动态生成服务菜单 (常用的服务排在前面)
         services = selected_host.get('services', [])
+        if use_frecency_order(CONFIG):
+            services = rank_services(host_name, services)
+        reaped = {e['serviceName'] for e in load_reaped() if e['hostName'] == host_name}
         for i, service in enumerate(services):
+            mark = f" {Fore.YELLOW}💤 空闲已关闭" if service.get('serviceName') in reaped else ""
             print(f" {i + 1}. {service.get('serviceName', 'N/A')} "
-                  f"(本地: {service.get('localPort')} -> 远程: {service.get('remotePort')})")
+                  f"(本地: {service.get('localPort')} -> 远程: {service.get('remotePort')}){mark}")
         
         print(" c. 自定义转发")
+        print(" d. 发现远程服务")
+        print(f"{Fore.YELLOW} x. 关闭此主机的隧道")
         print(f"{Fore.YELLOW} k. 清理所有隧道")
         print(" b. 返回上一级")
         print(" q. 退出 (并关闭所有隧道)")
@@ -327,6 +724,15 @@ def service_menu(selected_host: dict):
             kill_running_ssh_tunnels(no_pause=False)
             continue # 清理后返回服务菜单
 
+        if service_choice_input == 'd':
+            discovered_service_menu(selected_host)
+            continue
+
+        if service_choice_input == 'x':
+            print(f"{Fore.YELLOW}--- 正在关闭主机 {host_name} 的隧道 ---")
+            stop_selected_tunnels(host_name=host_name)
+            continue
+
         # --- 变量初始化 ---
         local_port = 0
         remote_port = 0
@@ -362,6 +768,11 @@ def service_menu(selected_host: dict):
                 choice_index = int(service_choice_input) - 1
                 if 0 <= choice_index < len(services):
                     selected_service = services[choice_index]
+                    if selected_service.get('serviceName') in reaped:
+                        # 因空闲被关闭的服务：按原来的本地端口重新打开
+                        revive_tunnels(host_name, selected_service.get('serviceName'), no_pause=True)
+                        input("\n操作完成，按 Enter 键返回服务菜单...")
+                        continue
                     remote_port = int(selected_service.get('remotePort', 0))
                     local_port = int(selected_service.get('localPort', 0))
                     if not remote_port or not local_port:
@@ -374,7 +785,7 @@ def service_menu(selected_host: dict):
                 raise ValueError("无效的选择。")
 
             # --- 端口检查和转发逻辑 (公共逻辑块) ---
-            start_tunnel(server_ip, ssh_user, local_port, remote_port, selected_service)
+            start_tunnel(server_ip, ssh_user, local_port, remote_port, selected_service, host_config=selected_host)
 
         except ValueError as e:
             print(f"{Fore.RED}输入错误: {e} 请重新输入。")
@@ -400,6 +811,10 @@ def main_menu():
         sys.exit(1)
 
     while True:
+        # 常用的主机排在前面 (每次回到主菜单都按最新的使用记录重新排序)
+        if use_frecency_order(CONFIG):
+            hosts = rank_hosts(CONFIG.get('hosts', []))
+
         clear_screen()
         print(f"{Fore.BLUE}===========================================")
         print(f"{Fore.BLUE}         请选择要连接的主机")
@@ -407,10 +822,14 @@ def main_menu():
         print(f"{Fore.CYAN}         (当前有 {get_active_tunnel_count()} 个活动隧道)")
         print(f"{Fore.BLUE}===========================================")
 
-        # 动态生成主机菜单
+        # 动态生成主机菜单 (状态标记只读探测缓存，过期的主机在后台重新探测，不阻塞菜单)
+        probes = probe_hosts_nowait(hosts)
         for i, host_info in enumerate(hosts):
-            print(f" {i + 1}. {host_info.get('hostName', 'N/A')}")
+            print(f" {i + 1}. {host_info.get('hostName', 'N/A')}  {host_badge(probes.get(host_info.get('hostName')))}")
         
+        if CONFIG.get('groups'):
+            print(" g. 隧道组")
+        print(" r. 恢复上次的隧道")
         print(" q. 退出 (并关闭所有隧道)")
         print(f"{Fore.BLUE}===========================================")
         print()
@@ -421,6 +840,14 @@ def main_menu():
             kill_running_ssh_tunnels(no_pause=True)
             sys.exit(0)
 
+        if host_choice_input == 'r':
+            restore_tunnels()
+            continue
+
+        if host_choice_input == 'g' and CONFIG.get('groups'):
+            group_menu()
+            continue
+
         # 验证输入
         if host_choice_input.isdigit():
             try:
@@ -443,6 +870,48 @@ def main_menu():
 # --- 脚本主入口 ---
 
 if __name__ == "__main__":
+    # 0. 命令行参数 (不带参数时进入交互式菜单)
+    parser = argparse.ArgumentParser(description="SSH 隧道转发管理器 (命令行菜单)")
+    parser.add_argument("--stop", action="store_true",
+                        help="关闭匹配的隧道后退出 (可配合 --host/--service/--port 筛选，不筛选则关闭全部)")
+    parser.add_argument("--host", help="按主机名筛选")
+    parser.add_argument("--service", help="按服务名筛选")
+    parser.add_argument("--port", type=int, help="按本地端口筛选")
+    parser.add_argument("--timeout", type=float, default=3.0,
+                        help="发送 SIGTERM 后等待退出的秒数，超时后强制结束 (默认: 3)")
+    parser.add_argument("--start-group", metavar="GROUP", help="并行启动一个隧道组后退出")
+    parser.add_argument("--stop-group", metavar="GROUP", help="关闭一个隧道组的所有隧道后退出")
+    parser.add_argument("--reconcile", nargs='*', metavar="HOST/SERVICE",
+                        help="让运行中的隧道收敛到给定的 主机名/服务名 集合 (可配合 --group)：只启动缺少的，只关闭多余的")
+    parser.add_argument("--group", action="append", default=[], metavar="GROUP",
+                        help="配合 --reconcile：把隧道组的成员加入期望集合 (可重复)")
+    parser.add_argument("--dry-run", action="store_true", help="配合 --reconcile：只打印计划，不做修改")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="记录当前运行的隧道 (主机、服务、实际的本地端口) 后退出")
+    parser.add_argument("--restore", action="store_true",
+                        help="并行恢复上次记录的隧道后退出 (关闭全部隧道和启动隧道时会自动记录)")
+    parser.add_argument("--reap", action="store_true",
+                        help="关闭空闲超过服务 idleTimeout 的隧道后退出 (配合 --interval 持续运行)")
+    parser.add_argument("--revive", action="store_true",
+                        help="重新打开因空闲被关闭的隧道后退出 (可配合 --host/--service 筛选)")
+    parser.add_argument("--on-demand", action="store_true",
+                        help="常驻：监听 onDemand 服务的本地端口，第一个连接到来时才启动隧道 (可配合 --host 筛选)")
+    parser.add_argument("--failover", nargs='*', metavar="SERVICE",
+                        help="常驻：把故障转移服务 (默认全部) 转发到延迟最低的候选主机，断开后在同一端口上切换")
+    parser.add_argument("--failover-status", action="store_true",
+                        help="显示故障转移服务当前的主机和最近的切换记录后退出")
+    parser.add_argument("--events", type=int, nargs='?', const=20, metavar="N",
+                        help="显示最近 N 条隧道生命周期事件 (默认 20) 后退出")
+    parser.add_argument("--probe", action="store_true", help="探测所有主机的可达性和延迟后退出")
+    parser.add_argument("--discover", nargs='*', metavar="HOST",
+                        help="列出主机 (默认全部) 上监听中、尚未配置的端口后退出，每台主机只连接一次")
+    parser.add_argument("--refresh", action="store_true", help="配合 --discover：忽略缓存的结果")
+    parser.add_argument("--prewarm", action="store_true",
+                        help="按使用记录为常用主机预先建立 SSH 主连接，并关闭空闲的主连接")
+    parser.add_argument("--interval", type=float,
+                        help="配合 --prewarm / --reap：每隔多少秒重复一次 (不指定则只执行一次)；配合 --on-demand / --failover：检查间隔 (默认 5)")
+    args = parser.parse_args()
+
     # 1. 检查配置文件
     if not CONFIG_PATH.exists():
         print(f"{Fore.RED}错误：在脚本目录下找不到配置文件 'config.json'！")
@@ -459,9 +928,73 @@ if __name__ == "__main__":
         input("按 Enter 键退出...")
         sys.exit(1)
 
+    if args.stop:
+        stop_selected_tunnels(host_name=args.host, service_name=args.service, local_port=args.port,
+                              timeout=args.timeout, no_pause=True)
+        sys.exit(0)
+    if args.start_group:
+        start_tunnel_group(args.start_group, no_pause=True)
+        sys.exit(0)
+    if args.stop_group:
+        stop_tunnel_group(args.stop_group, timeout=args.timeout, no_pause=True)
+        sys.exit(0)
+    if args.reconcile is not None:
+        ok = reconcile_tunnels(args.reconcile, args.group, dry_run=args.dry_run, timeout=args.timeout)
+        sys.exit(0 if ok else 1)
+    if args.snapshot:
+        save_tunnel_snapshot()
+        sys.exit(0)
+    if args.restore:
+        restore_tunnels(no_pause=True)
+        sys.exit(0)
+    if args.reap:
+        try:
+            run_reaper(args.interval)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if args.on_demand:
+        print(f"{Fore.CYAN}🚀 按需启动已开启，按 Ctrl+C 结束。")
+        try:
+            run_on_demand(args.host, args.interval)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if args.failover is not None:
+        print(f"{Fore.CYAN}🚀 多主机故障转移已开启，按 Ctrl+C 结束。")
+        try:
+            run_failover(args.failover, args.interval)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if args.failover_status:
+        print_failover_status()
+        sys.exit(0)
+    if args.revive:
+        revive_tunnels(host_name=args.host, service_name=args.service, no_pause=True)
+        sys.exit(0)
+    if args.events:
+        print_events(args.events)
+        sys.exit(0)
+    if args.probe:
+        print_host_status()
+        sys.exit(0)
+    if args.discover is not None:
+        print_discovered_services(args.discover, refresh=args.refresh)
+        sys.exit(0)
+    if args.prewarm:
+        try:
+            run_prewarm(args.interval)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
     # !!! 修改点：脚本启动时，执行一次昂贵的扫描 !!!
     print(f"{Fore.CYAN}正在初始化并扫描现有隧道...")
     try:
+        # 顺便关闭空闲超时的预热主连接和隧道
+        reap_idle_masters(CONFIG)
+        reap_idle_tunnels(CONFIG)
         # 强制扫描一次并更新全局计数器
         update_active_tunnel_count(force_scan=True)
         print(f"检测到 {get_active_tunnel_count()} 个由本脚本管理的活动隧道。")
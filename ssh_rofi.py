@@ -2,10 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import json
-import os
 import subprocess
 import sys
-import time
 import webbrowser
 from pathlib import Path
 import argparse
@@ -18,6 +16,14 @@ except ImportError:
     print("󰩈  退出 (错误: 缺少 'psutil' 库)")
     sys.exit(1)
 
+from sshtf_core import (launch_tunnel, scan_tunnels, find_tunnels, stop_tunnels, listening_ports,
+                        start_group, stop_group, prewarm, prewarm_supported, reap_idle_masters,
+                        wait_tunnel_ready, snapshot_tunnels, load_snapshot, restore_snapshot,
+                        reap_idle_tunnels, load_reaped, revive_reaped)
+from sshtf_usage import record_use, rank_hosts, rank_services, use_frecency_order
+from sshtf_probe import probe_hosts_nowait, format_badge
+from sshtf_discovery import discover_hosts_sync, suggest_services
+
 
 # --- 配置 ---
 
@@ -56,40 +62,28 @@ def rofi_notify(title, message, icon="dialog-information"):
 def get_matching_ssh_processes():
     """
     扫描系统，查找所有由该脚本启动的 ssh.exe 隧道进程。
-    (此函数与原版基本相同，仅移除 colorama)
+    (识别规则见 sshtf_core.is_tunnel_cmdline)
     """
-    matching_processes = []
     try:
-        all_processes = list(psutil.process_iter(['pid', 'name', 'cmdline']))
+        return [t['proc'] for t in scan_tunnels()]
     except Exception as e:
         # 无法在 Rofi 中打印，只能在 stderr 中记录
         print(f"❌ 无法查询系统进程: {e}。可能需要管理员权限。", file=sys.stderr)
         return []
 
-    for proc in all_processes:
-        try:
-            if proc.info['name'] and proc.info['name'].lower() == 'ssh':
-                cmdline_str = " ".join(proc.info['cmdline'] or [])
-                if (
-                    "-o StrictHostKeyChecking=no" in cmdline_str and
-                    "-o UserKnownHostsFile=NUL" in cmdline_str and
-                    "-N" in cmdline_str and
-                    "-L" in cmdline_str and
-                    "-o ServerAliveInterval=60" in cmdline_str
-                ):
-                    matching_processes.append(proc)
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-        except Exception as e:
-            print(f"警告：检查进程 {proc.pid} 时出错: {e}", file=sys.stderr)
-    
-    return matching_processes
-
 G_ACTIVE_TUNNEL_COUNT = 0
 
-def update_active_tunnel_count(force_scan=True):
+def update_active_tunnel_count(force_scan=True, snapshot=False):
     global G_ACTIVE_TUNNEL_COUNT
-    if force_scan:
+    if force_scan and snapshot:
+        # 同一次扫描顺便更新隧道快照 (用于 --restore)
+        try:
+            tunnels = scan_tunnels()
+            snapshot_tunnels(CONFIG, tunnels)
+            G_ACTIVE_TUNNEL_COUNT = len(tunnels)
+        except Exception as e:
+            print(f"❌ 无法查询系统进程: {e}。可能需要管理员权限。", file=sys.stderr)
+    elif force_scan:
         G_ACTIVE_TUNNEL_COUNT = len(get_matching_ssh_processes())
     return G_ACTIVE_TUNNEL_COUNT
 
@@ -97,63 +91,72 @@ def get_active_tunnel_count():
     global G_ACTIVE_TUNNEL_COUNT
     return G_ACTIVE_TUNNEL_COUNT
 
-def kill_running_ssh_tunnels(no_pause=False):
+def stop_selected_tunnels(host_name=None, service_name=None, local_port=None, timeout=3.0):
     """
-    查找并终止所有匹配的 SSH 隧道进程。
-    (已修改：使用 notify-send 替换 print/input)
+    按主机 / 服务 / 本地端口筛选并优雅关闭隧道 (条件都为空时关闭全部)。
+    所有目标同时收到 SIGTERM，超时仍未退出的再强制结束。
     """
-    rofi_notify("SSH 隧道", "正在搜索并关闭所有活动隧道...", "network-transmit")
-    
-    tunnel_processes = get_matching_ssh_processes()
-    
-    if not tunnel_processes:
-        rofi_notify("SSH 隧道", "隧道清理完毕 (未找到活动进程)。", "network-idle")
-        update_active_tunnel_count(force_scan=False)
-        G_ACTIVE_TUNNEL_COUNT = 0
+    global G_ACTIVE_TUNNEL_COUNT
+
+    try:
+        tunnels = find_tunnels(CONFIG, host_name=host_name, service_name=service_name, local_port=local_port)
+    except Exception as e:
+        print(f"❌ 无法查询系统进程: {e}。可能需要管理员权限。", file=sys.stderr)
+        tunnels = []
+
+    if not tunnels:
+        rofi_notify("SSH 隧道", "隧道清理完毕 (未找到匹配的进程)。", "network-idle")
         return
 
-    count = len(tunnel_processes)
-    rofi_notify("SSH 隧道", f"正在关闭 {count} 个匹配的隧道...", "network-transmit")
-    
-    killed_count = 0
-    for proc in tunnel_processes:
+    if host_name is None and service_name is None and local_port is None:
+        # 关闭全部之前记下当前的隧道，之后可用 --restore 一次性恢复
         try:
-            proc.kill()
-            killed_count += 1
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass # 进程已消失或无权限
-        except Exception as e:
-            print(f"❌ 关闭隧道 (PID: {proc.pid}) 时出错: {e}", file=sys.stderr)
+            snapshot_tunnels(CONFIG, tunnels)
+        except OSError as e:
+            print(f"⚠️ 保存隧道快照失败: {e}", file=sys.stderr)
 
-    rofi_notify("SSH 隧道", f"隧道清理完毕。成功关闭 {killed_count}/{count} 个。", "network-idle")
-    update_active_tunnel_count(force_scan=True)
+    count = len(tunnels)
+    rofi_notify("SSH 隧道", f"正在关闭 {count} 个匹配的隧道...", "network-transmit")
+    result = stop_tunnels(tunnels, timeout=timeout)
+
+    stopped = len(result['terminated']) + len(result['killed'])
+    message = f"隧道清理完毕。成功关闭 {stopped}/{count} 个。"
+    if result['killed']:
+        message += f"\n其中 {len(result['killed'])} 个超时后被强制结束。"
+    rofi_notify("SSH 隧道", message, "network-idle" if not result['failed'] else "dialog-warning")
+    G_ACTIVE_TUNNEL_COUNT = max(0, G_ACTIVE_TUNNEL_COUNT - stopped)
+
+def kill_running_ssh_tunnels(no_pause=False):
+    """
+    查找并终止所有匹配的 SSH 隧道进程。
+    (已修改：使用 notify-send 替换 print/input)
+    """
+    rofi_notify("SSH 隧道", "正在搜索并关闭所有活动隧道...", "network-transmit")
+    stop_selected_tunnels()
 
 # --- 辅助函数 (已修改) ---
 
-def is_port_in_use(port: int) -> bool:
+def get_listening_ports() -> set:
     """
-    检查本地端口是否处于 LISTEN 状态。
-    (已修改：移除 print 警告)
+    一次性获取所有处于 LISTEN 状态的本地端口 (用于端口自动递增，避免逐个端口扫描)。
     """
     try:
-        for conn in psutil.net_connections(kind='tcp'):
-            if conn.laddr and conn.laddr.port == port and conn.status == psutil.CONN_LISTEN:
-                return True
+        return listening_ports()
     except (psutil.AccessDenied, Exception) as e:
-        # 在 Rofi 脚本中，我们最好保持静默，只在 stderr 打印
-        print(f"警告：检查端口 {port} 时出错: {e}。", file=sys.stderr)
-    return False
+        print(f"警告：检查端口时出错: {e}。", file=sys.stderr)
+    return set()
 
 
-def start_tunnel(server_ip: str, ssh_user: str, local_port: int, remote_port: int, selected_service: dict = None):
+def start_tunnel(server_ip: str, ssh_user: str, local_port: int, remote_port: int, selected_service: dict = None, host_config: dict = None):
     """
     处理端口检查、自动递增并启动 SSH 进程。
     (已修改：使用 notify-send 替换 print/input)
     """
     original_local_port = local_port
     
-    while is_port_in_use(local_port):
-        rofi_notify("端口检查", f"端口 {local_port} 被占用，正在尝试 {local_port + 1}...", "dialog-warning")
+    # 只读取一次系统监听端口，再在内存中递增查找
+    busy_ports = get_listening_ports()
+    while local_port in busy_ports:
         local_port += 1
 
     if original_local_port != local_port:
@@ -161,32 +164,26 @@ def start_tunnel(server_ip: str, ssh_user: str, local_port: int, remote_port: in
 
     rofi_notify("SSH 隧道", f"🚀 正在启动: L:{local_port} -> R:{remote_port} @ {server_ip}", "network-transmit")
 
-    ssh_args = [
-        "ssh",
-        "-o", "StrictHostKeyChecking=no",
-        "-o", "UserKnownHostsFile=NUL",
-        "-N",
-        "-L", f"{local_port}:localhost:{remote_port}",
-        f"{ssh_user}@{server_ip}",
-        "-o", "ServerAliveInterval=60"
-    ]
+    # 主机上的 sshPort / identityFile / proxyJump 也一并带上
+    host = dict(host_config or {})
+    host.update({'serverIP': server_ip, 'sshUser': ssh_user})
     
     try:
-        creation_flags = 0
-        if os.name == 'nt':
-            creation_flags = subprocess.CREATE_NO_WINDOW
-        
-        process = subprocess.Popen(
-            ssh_args,
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            creationflags=creation_flags
-        )
-        
-        rofi_notify("SSH 隧道", f"✅ 隧道已在后台启动 (PID: {process.pid})。\n(如需密码会静默失败，请检查密钥)", "network-wired")
-        time.sleep(0.25)
-        update_active_tunnel_count(force_scan=True)
+        process = launch_tunnel(host, [(local_port, remote_port)])
+        ready = wait_tunnel_ready(process, [(local_port, remote_port)])
+
+        if ready['status'] == 'failed':
+            details = "\n".join(ready['stderr']) or "(如需密码会直接失败，请检查密钥)"
+            rofi_notify("启动失败", f"❌ ssh 退出 (退出码 {ready['exitCode']})\n{details}", "dialog-error")
+            return
+
+        # 记录使用情况 (用于连接预热和菜单排序)
+        record_use(host.get('hostName') or server_ip, (selected_service or {}).get('serviceName'))
+        if ready['status'] == 'ready':
+            rofi_notify("SSH 隧道", f"✅ 隧道已就绪 (PID: {process.pid}，{ready['elapsedMs']:.0f} ms)", "network-wired")
+        else:
+            rofi_notify("SSH 隧道", f"⏳ 隧道仍在连接中 (PID: {process.pid})", "network-transmit")
+        update_active_tunnel_count(force_scan=True, snapshot=True)
     
     except FileNotFoundError:
         rofi_notify("启动失败", "未找到 'ssh' 命令。\n请确保 OpenSSH 在系统 PATH 中。", "dialog-error")
@@ -236,14 +233,44 @@ def handle_list_hosts(config):
         print("󰩈  退出 (错误: config.json 中无主机)")
         return
     
-    # 打印所有主机
+    # 打印所有主机 (常用的排在前面)，附带可达性/延迟标记
+    if use_frecency_order(config):
+        hosts = rank_hosts(hosts)
+    # 只读探测缓存，过期的主机由独立进程在后台重新探测 (本进程打印完列表就退出)
+    probes = probe_hosts_nowait(hosts, detach=True)
     for host_info in hosts:
-        print(f"󰪥  {host_info.get('hostName', 'N/A')}")
+        host_name = host_info.get('hostName', 'N/A')
+        print(f"󰪥  {host_name}  {host_badge_markup(probes.get(host_name))}")
     
     # 打印全局操作
+    if config.get('groups'):
+        print("󰆧  隧道组")
+    print("󰑓  恢复上次的隧道")
+    if load_reaped():
+        print("󰒲  恢复空闲关闭的隧道")
     print("󰔰  清理所有隧道")
     print("󰩈  退出")
 
+def host_badge_markup(result):
+    """Rofi (Pango) 格式的状态标记"""
+    if not result:
+        color = "#9ca3af"
+    elif not result['ok']:
+        color = "#ef4444"
+    elif result['latencyMs'] > 200:
+        color = "#f59e0b"
+    else:
+        color = "#10b981"
+    return f"<span foreground='{color}' size='small'>● {format_badge(result)}</span>"
+
+def handle_list_groups(config):
+    """
+    打印 Rofi 隧道组菜单列表
+    """
+    for group in config.get('groups', []):
+        print(f"󰆧  {group.get('groupName', 'N/A')}  <span weight='light' size='small'><i>({len(group.get('members', []))} 个服务)</i></span>")
+    print("󰌍  返回上一级")
+
 def handle_list_services(config, host_name):
     """
     打印 Rofi 服务菜单列表
@@ -254,17 +281,89 @@ def handle_list_services(config, host_name):
         return
         
     services = host.get('services', [])
+    if use_frecency_order(config):
+        services = rank_services(host_name, services)
+    reaped = {e['serviceName'] for e in load_reaped() if e['hostName'] == host_name}
     for service in services:
-        # 格式:   ServiceName  (L:80 -> R:80)
-        print(f"  {service.get('serviceName', 'N/A')}  <span weight='light' size='small'><i>(L:{service.get('localPort')} -> R:{service.get('remotePort')})</i></span>")
+        # 格式:   ServiceName  (L:80 -> R:80)，因空闲被关闭的服务在括号后加 💤
+        mark = " 💤" if service.get('serviceName') in reaped else ""
+        print(f"  {service.get('serviceName', 'N/A')}  <span weight='light' size='small'><i>(L:{service.get('localPort')} -> R:{service.get('remotePort')})</i>{mark}</span>")
     
     # 打印此菜单的操作
     print("󰌖  自定义转发")
+    print("󰍉  发现远程服务")
+    print("󰅙  关闭此主机隧道")
     print("󰔰  清理所有隧道")
     print("󰌍  返回上一级")
 
+def handle_list_discovered(config, host_name):
+    """
+    打印主机上尚未配置的监听端口 (一次 ssh 列出全部，结果有 TTL 缓存)，选择后作为自定义转发启动
+    """
+    host = find_host_config(config, host_name)
+    if not host:
+        print("󰌍  返回上一级 (错误: 未找到主机)")
+        return
+    result = discover_hosts_sync([host]).get(host_name)
+    if not result['ok']:
+        rofi_notify("发现远程服务", f"❌ {host_name}: {result['error']}", "dialog-error")
+    else:
+        for service in suggest_services(host, result):
+            # 格式: 󰐕  ServiceName  (R:5432)，rofi-ssh-tunnels.sh 从中取出远程端口
+            print(f"󰐕  {service['serviceName']}  <span weight='light' size='small'><i>(R:{service['remotePort']})</i></span>")
+    print("󰌍  返回上一级")
+
 # --- Rofi Action Handlers ---
 
+def parse_group_name(group_menu_str):
+    """
+    从 Rofi 返回的隧道组菜单字符串中解析出组名 (也接受纯组名)
+    """
+    if group_menu_str.startswith("󰆧  "):
+        group_menu_str = group_menu_str.split(maxsplit=1)[1]
+    return group_menu_str.split("  <span", 1)[0].strip()
+
+def handle_start_group(config, group_menu_str):
+    group_name = parse_group_name(group_menu_str)
+    rofi_notify("隧道组", f"🚀 正在并行启动隧道组: {group_name}", "network-transmit")
+    try:
+        results = start_group(config, group_name, busy_ports=get_listening_ports())
+    except KeyError as e:
+        rofi_notify("启动失败", str(e.args[0]), "dialog-error")
+        return
+
+    lines = []
+    for r in results:
+        if r['status'] == 'started':
+            lines.append(f"✅ {r['hostName']}/{r['serviceName']}  L:{r['localPort']} (PID {r['pid']})")
+        elif r['status'] == 'running':
+            lines.append(f"ℹ️ {r['hostName']}/{r['serviceName']} 已在运行 (PID {r['pid']})")
+        else:
+            lines.append(f"❌ {r['hostName']}/{r['serviceName']}: {r['error']}")
+    failed = any(r['status'] in ('failed', 'missing') for r in results)
+    rofi_notify(f"隧道组: {group_name}", "\n".join(lines) or "组内没有服务", "dialog-warning" if failed else "network-wired")
+    update_active_tunnel_count(force_scan=True, snapshot=True)
+
+def handle_stop_group(config, group_menu_str, timeout=3.0):
+    group_name = parse_group_name(group_menu_str)
+    try:
+        result = stop_group(config, group_name, timeout=timeout)
+    except KeyError as e:
+        rofi_notify("关闭失败", str(e.args[0]), "dialog-error")
+        return
+    except (psutil.AccessDenied, Exception) as e:
+        rofi_notify("关闭失败", f"扫描进程时出错: {e}", "dialog-error")
+        return
+
+    if not result['matched']:
+        rofi_notify(f"隧道组: {group_name}", "没有正在运行的隧道。", "dialog-information")
+        return
+    message = f"已关闭 {len(result['terminated']) + len(result['killed'])} 个隧道进程"
+    if result['failed']:
+        message += f"\n无法关闭: {', '.join(str(p) for p in result['failed'])}"
+    rofi_notify(f"隧道组: {group_name}", message, "dialog-warning" if result['failed'] else "dialog-information")
+    update_active_tunnel_count(force_scan=True)
+
 def find_host_config(config, host_name):
     return next((h for h in config.get('hosts', []) if h.get('hostName') == host_name), None)
 
@@ -305,6 +404,10 @@ def handle_start_tunnel(config, host_name, service_menu_str):
     if not service_config:
         rofi_notify("错误", f"未找到服务配置: {service_menu_str}", "dialog-error")
         return
+    if any(e['hostName'] == host_name and e['serviceName'] == service_config.get('serviceName') for e in load_reaped()):
+        # 因空闲被关闭的服务：按原来的本地端口重新打开
+        handle_revive(config, host_name, service_config.get('serviceName'))
+        return
     
     try:
         start_tunnel(
@@ -312,7 +415,8 @@ def handle_start_tunnel(config, host_name, service_menu_str):
             ssh_user=host_config.get('sshUser'),
             local_port=int(service_config.get('localPort')),
             remote_port=int(service_config.get('remotePort')),
-            selected_service=service_config
+            selected_service=service_config,
+            host_config=host_config
         )
     except Exception as e:
         rofi_notify("启动失败", str(e), "dialog-error")
@@ -348,11 +452,51 @@ def handle_custom_tunnel(config, host_name, ports_str):
             ssh_user=host_config.get('sshUser'),
             local_port=local_port,
             remote_port=remote_port,
-            selected_service=None # 自定义转发没有自动打开/登录信息
+            selected_service=None, # 自定义转发没有自动打开/登录信息
+            host_config=host_config
         )
     except Exception as e:
          rofi_notify("自定义转发失败", str(e), "dialog-error")
 
+def handle_restore(config):
+    snapshot = load_snapshot()
+    if not snapshot['tunnels']:
+        rofi_notify("恢复隧道", "没有可恢复的隧道快照。", "dialog-information")
+        return
+    rofi_notify("恢复隧道", f"🚀 正在并行恢复 {len(snapshot['tunnels'])} 个转发...", "network-transmit")
+    notify_reopened("恢复隧道", restore_snapshot(config, busy_ports=get_listening_ports()))
+
+def handle_revive(config, host_name=None, service_name=None):
+    if not load_reaped():
+        rofi_notify("恢复空闲隧道", "没有因空闲被关闭的隧道。", "dialog-information")
+        return
+    notify_reopened("恢复空闲隧道", revive_reaped(config, host_name, service_name, busy_ports=get_listening_ports()))
+
+def notify_reopened(title, results):
+    """用一条通知汇总 restore_snapshot() / revive_reaped() 的结果"""
+    lines = []
+    for r in results:
+        member = f"{r['hostName']}/{r['serviceName'] or r['remotePort']}"
+        if r['status'] == 'started':
+            moved = f" (原 {r['previousPort']})" if r['localPort'] != r['previousPort'] else ""
+            lines.append(f"✅ {member}  L:{r['localPort']}{moved} (PID {r['pid']})")
+        elif r['status'] == 'running':
+            lines.append(f"ℹ️ {member} 已在运行 (PID {r['pid']})")
+        else:
+            lines.append(f"❌ {member}: {r['error']}")
+    failed = any(r['status'] in ('failed', 'missing') for r in results)
+    rofi_notify(title, "\n".join(lines), "dialog-warning" if failed else "network-wired")
+    update_active_tunnel_count(force_scan=True, snapshot=True)
+
+def handle_prewarm(config):
+    if not prewarm_supported():
+        rofi_notify("连接预热", "当前平台的 ssh 不支持 ControlMaster。", "dialog-warning")
+        return
+    result = prewarm(config)
+    lines = [f"🔥 {h}" for h in result['opened']] + [f"❌ {h}: {e}" for h, e in result['failed'].items()]
+    if lines:
+        rofi_notify("连接预热", "\n".join(lines), "dialog-warning" if result['failed'] else "network-wired")
+
 # --- 脚本主入口 (由 Argparse 驱动) ---
 
 if __name__ == "__main__":
@@ -371,10 +515,20 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="SSH Tunnel Rofi Helper")
     parser.add_argument("--list-hosts", action="store_true", help="List hosts for Rofi")
     parser.add_argument("--list-services", type=str, help="List services for a host (by name)")
+    parser.add_argument("--list-discovered", type=str, metavar='HOST_NAME', help="List unconfigured listening ports of a host")
     parser.add_argument("--get-tunnel-count", action="store_true", help="Get active tunnel count")
     parser.add_argument("--kill-all", action="store_true", help="Kill all active tunnels")
+    parser.add_argument("--stop-host", type=str, metavar='HOST_NAME', help="Stop all tunnels of a host")
+    parser.add_argument("--stop-service", nargs=2, metavar=('HOST_NAME', 'SERVICE_STR'), help="Stop the tunnels of a service")
+    parser.add_argument("--stop-port", type=int, metavar='LOCAL_PORT', help="Stop the tunnel listening on a local port")
     parser.add_argument("--start-tunnel", nargs=2, metavar=('HOST_NAME', 'SERVICE_STR'), help="Start a tunnel")
     parser.add_argument("--start-custom-tunnel", nargs=2, metavar=('HOST_NAME', 'PORTS_STR'), help="Start a custom tunnel")
+    parser.add_argument("--prewarm", action="store_true", help="Pre-open SSH master connections for frequently used hosts")
+    parser.add_argument("--list-groups", action="store_true", help="List tunnel groups for Rofi")
+    parser.add_argument("--start-group", type=str, metavar='GROUP_STR', help="Start all tunnels of a group")
+    parser.add_argument("--stop-group", type=str, metavar='GROUP_STR', help="Stop all tunnels of a group")
+    parser.add_argument("--restore", action="store_true", help="Reopen the tunnels recorded in the last snapshot")
+    parser.add_argument("--revive", action="store_true", help="Reopen the tunnels closed for being idle")
     
     args = parser.parse_args()
     
@@ -384,16 +538,44 @@ if __name__ == "__main__":
             handle_list_hosts(CONFIG)
         elif args.list_services:
             handle_list_services(CONFIG, args.list_services)
+        elif args.list_discovered:
+            handle_list_discovered(CONFIG, args.list_discovered)
         elif args.get_tunnel_count:
+            # 每次打开 Rofi 主菜单都会调用，顺便关闭空闲超时的预热主连接和隧道
+            reap_idle_masters(CONFIG)
+            reap_idle_tunnels(CONFIG)
             # Rofi Prompt 需要这个，必须强制扫描
             update_active_tunnel_count(force_scan=True)
             print(get_active_tunnel_count())
         elif args.kill_all:
             kill_running_ssh_tunnels(no_pause=True)
+        elif args.stop_host:
+            stop_selected_tunnels(host_name=args.stop_host)
+        elif args.stop_service:
+            host_name, service_str = args.stop_service
+            host_config = find_host_config(CONFIG, host_name)
+            service_config = find_service_config(host_config, service_str) if host_config else None
+            # 也接受纯服务名 (方便脚本调用)
+            service_name = service_config.get('serviceName') if service_config else service_str
+            stop_selected_tunnels(host_name=host_name, service_name=service_name)
+        elif args.stop_port:
+            stop_selected_tunnels(local_port=args.stop_port)
         elif args.start_tunnel:
             handle_start_tunnel(CONFIG, args.start_tunnel[0], args.start_tunnel[1])
         elif args.start_custom_tunnel:
             handle_custom_tunnel(CONFIG, args.start_custom_tunnel[0], args.start_custom_tunnel[1])
+        elif args.prewarm:
+            handle_prewarm(CONFIG)
+        elif args.list_groups:
+            handle_list_groups(CONFIG)
+        elif args.start_group:
+            handle_start_group(CONFIG, args.start_group)
+        elif args.stop_group:
+            handle_stop_group(CONFIG, args.stop_group)
+        elif args.restore:
+            handle_restore(CONFIG)
+        elif args.revive:
+            handle_revive(CONFIG)
         else:
             # 默认启动时，打印主机列表 (以防万一直接运行)
             handle_list_hosts(CONFIG)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+不依赖 Web 框架的 config.json 读写、主机增删与校验。
+
+供 main.py 的命令行子命令使用：模块本身只导入少量标准库，
+校验时才按需加载 Pydantic 模型 (sshtf_models.py)，因此脚本调用可以在几十毫秒内完成。
+配置以普通字典处理，写入方式与 Web UI 相同 (临时文件 + 原子替换，version 递增)，
+正在运行的 Web UI 会根据文件变化自动重新加载。
+"""
+
+import json
+import os
+import pathlib
+import tempfile
+from contextlib import contextmanager
+from typing import List
+
+from sshtf_state import exclusive_lock
+
+SCRIPT_DIR = pathlib.Path(__file__).parent.resolve()
+CONFIG_PATH = SCRIPT_DIR / "config.json"
+
+DEFAULT_SSH_PORT = 22
+# 主机未配置 localPortRange 时自动分配本地端口的范围
+DEFAULT_LOCAL_PORT_RANGE = (20000, 29999)
+
+
+class ConfigError(Exception):
+    """config.json 无法读取、格式错误，或请求的修改不合法"""
+
+
+# --- 读写 config.json ---
+
+def load_config(path: pathlib.Path = CONFIG_PATH) -> dict:
+    """读取配置字典；文件不存在或为空时返回空配置"""
+    try:
+        content = path.read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return {'hosts': []}
+    except OSError as e:
+        raise ConfigError(f"无法读取 {path}: {e}")
+    if not content.strip():
+        return {'hosts': []}
+    try:
+        config = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"{path.name} 文件格式错误 (非 JSON): {e}")
+    if not isinstance(config, dict) or not isinstance(config.get('hosts', []), list):
+        raise ConfigError(f"{path.name} 中没有找到 'hosts' 列表")
+    config.setdefault('hosts', [])
+    return config
+
+
+@contextmanager
+def config_lock(path: pathlib.Path = CONFIG_PATH):
+    """跨进程的 config.json 写锁 (config.json.lock，与 Web UI 共用)：版本比较和写入都要在锁内完成"""
+    with open(path.with_name(path.name + '.lock'), 'a+b') as lock, exclusive_lock(lock):
+        yield
+
+
+def save_config(config: dict, path: pathlib.Path = CONFIG_PATH) -> int:
+    """
+    递增 version 并写回 (先写临时文件再原子替换)，返回新的版本号。
+    若读取之后文件已被其他进程 (如 Web UI) 修改，抛出 ConfigError 而不覆盖。
+    """
+    expected_version = config.get('version', 0)
+    with config_lock(path):
+        try:
+            current_version = load_config(path).get('version', 0)
+        except ConfigError:
+            current_version = expected_version  # 原文件已损坏时允许覆盖
+        if current_version != expected_version:
+            raise ConfigError(f"配置已被其他程序修改 (当前版本 {current_version})，请重试")
+
+        config['version'] = expected_version + 1
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=path.parent, prefix=path.name + '.',
+                                         suffix='.tmp', delete=False) as f:
+            f.write(json.dumps(config, ensure_ascii=False, indent=2))
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.unlink(f.name)
+            raise
+    return config['version']
+
+
+# --- 主机 / 服务的增删 ---
+
+def find_host(config: dict, host_name: str) -> dict:
+    host = next((h for h in config['hosts'] if h.get('hostName') == host_name), None)
+    if host is None:
+        raise ConfigError(f"未找到主机 '{host_name}'")
+    return host
+
+
+def add_host(config: dict, host: dict):
+    if any(h.get('hostName') == host['hostName'] for h in config['hosts']):
+        raise ConfigError(f"主机名 '{host['hostName']}' 已存在")
+    config['hosts'].append(host)
+
+
+def _drop_group_members(config: dict, predicate):
+    """主机或服务被删除后，从各隧道组中移除对应成员 (组本身保留)，与 Web UI 的行为一致"""
+    for group in config.get('groups', []):
+        group['members'] = [m for m in group.get('members', []) if not predicate(m)]
+
+
+def remove_host(config: dict, host_name: str):
+    find_host(config, host_name)
+    config['hosts'] = [h for h in config['hosts'] if h.get('hostName') != host_name]
+    _drop_group_members(config, lambda m: m.get('hostName') == host_name)
+    for service in config.get('failover', []):
+        service['hosts'] = [h for h in service.get('hosts', []) if h != host_name]
+
+
+def remove_service(config: dict, host_name: str, service_name: str):
+    host = find_host(config, host_name)
+    services = host.get('services', [])
+    if not any(s.get('serviceName') == service_name for s in services):
+        raise ConfigError(f"主机 '{host_name}' 下未找到服务 '{service_name}'")
+    host['services'] = [s for s in services if s.get('serviceName') != service_name]
+    _drop_group_members(
+        config, lambda m: m.get('hostName') == host_name and m.get('serviceName') == service_name
+    )
+
+
+def add_service(config: dict, host_name: str, service: dict):
+    host = find_host(config, host_name)
+    services = host.setdefault('services', [])
+    if any(s.get('serviceName') == service['serviceName'] for s in services):
+        raise ConfigError(f"主机 '{host_name}' 下已存在服务 '{service['serviceName']}'")
+    services.append(service)
+
+
+def assign_local_ports(config: dict, busy: set = frozenset()):
+    """
+    为 localPort 为 0 的服务从其主机的端口范围中分配一个未被配置占用 (包括故障转移服务) 的端口 (与 Web UI 保存时的规则相同)。
+    busy 为额外需要避开的端口 (如当前正在监听的端口)。
+    """
+    claimed = set(busy) | {s['localPort'] for h in config['hosts'] for s in h.get('services', []) if s.get('localPort')}
+    claimed |= {f['localPort'] for f in config.get('failover', [])}
+    for host in config['hosts']:
+        port_range = host.get('localPortRange') or {}
+        start = port_range.get('start', DEFAULT_LOCAL_PORT_RANGE[0])
+        end = port_range.get('end', DEFAULT_LOCAL_PORT_RANGE[1])
+        for service in host.get('services', []):
+            if service.get('localPort'):
+                continue
+            port = next((p for p in range(start, end + 1) if p not in claimed), None)
+            if port is None:
+                raise ConfigError(f"主机 '{host['hostName']}' 的本地端口范围 {start}-{end} 已无可用端口")
+            service['localPort'] = port
+            claimed.add(port)
+
+
+# --- 校验 ---
+
+def validate_config(config: dict) -> List[str]:
+    """
+    检查配置是否能被 Web UI 接受，返回问题列表 (为空表示通过)：
+    字段类型 (Pydantic 模型)、重复的主机名/服务名/隧道组名、本地端口冲突、隧道组成员和故障转移候选主机是否存在。
+    """
+    from pydantic import ValidationError
+    from sshtf_models import Config
+
+    try:
+        Config.model_validate(config)
+    except ValidationError as e:
+        return [
+            f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+            for err in e.errors()
+        ]
+
+    problems = []
+    services_by_host = {}
+    for host in config['hosts']:
+        name = host['hostName']
+        if name in services_by_host:
+            problems.append(f"重复的主机名: {name}")
+            continue
+        services_by_host[name] = set()
+        for service in host.get('services', []):
+            if service['serviceName'] in services_by_host[name]:
+                problems.append(f"主机 '{name}' 下重复的服务名: {service['serviceName']}")
+            services_by_host[name].add(service['serviceName'])
+
+    claims = {}
+    for host in config['hosts']:
+        for service in host.get('services', []):
+            if service.get('localPort'):
+                claims.setdefault(service['localPort'], []).append(f"{host['hostName']}/{service['serviceName']}")
+    for service in config.get('failover', []):
+        claims.setdefault(service['localPort'], []).append(f"故障转移 {service['serviceName']}")
+    for port, owners in sorted(claims.items()):
+        if len(owners) > 1:
+            problems.append(f"本地端口 {port} 被多个服务占用: {'、'.join(owners)}")
+
+    group_names = set()
+    for group in config.get('groups', []):
+        if group['groupName'] in group_names:
+            problems.append(f"重复的隧道组名: {group['groupName']}")
+        group_names.add(group['groupName'])
+        for member in group.get('members', []):
+            if member['serviceName'] not in services_by_host.get(member['hostName'], ()):
+                problems.append(
+                    f"隧道组 '{group['groupName']}' 的成员不存在: {member['hostName']}/{member['serviceName']}"
+                )
+
+    failover_names = set()
+    for service in config.get('failover', []):
+        if service['serviceName'] in failover_names:
+            problems.append(f"重复的故障转移服务名: {service['serviceName']}")
+        failover_names.add(service['serviceName'])
+        if not service['hosts']:
+            problems.append(f"故障转移服务 '{service['serviceName']}' 没有候选主机")
+        for host_name in service['hosts']:
+            if host_name not in services_by_host:
+                problems.append(f"故障转移服务 '{service['serviceName']}' 的候选主机不存在: {host_name}")
+    return problems
@@ -0,0 +1,1154 @@
+# -*- coding: utf-8 -*-
+"""
+ssh.py / ssh_rofi.py / sshtf_web.py (Web UI) 共用的隧道核心逻辑。
+
+这里只放与界面无关的部分 (构建 ssh 命令行、扫描/关闭隧道进程等)，
+输出方式 (print / notify-send / HTTP) 由各自的调用方决定。
+"""
+
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+import psutil
+
+from sshtf_config import DEFAULT_SSH_PORT
+from sshtf_state import STATE_DIR, exclusive_lock
+from sshtf_usage import load_usage, frecency, record_use
+from sshtf_log import (log_event, new_tunnel_log, register_tunnel, registered_tunnels,
+                       unregister_tunnel, read_stderr, trim_stderr)
+
+# 由本工具启动的隧道的固定参数。
+# is_tunnel_cmdline() 依靠这些参数在进程表中识别隧道，修改时需同步。
+TUNNEL_BASE_OPTIONS = [
+    "-o", "StrictHostKeyChecking=no",
+    "-o", "UserKnownHostsFile=NUL",
+    "-N",  # 不执行远程命令
+]
+TUNNEL_KEEPALIVE_OPTIONS = ["-o", "ServerAliveInterval=60"]
+# 端口绑定失败等转发错误时让 ssh 直接退出，而不是留下一个没有转发的连接
+TUNNEL_FORWARD_OPTIONS = ["-o", "ExitOnForwardFailure=yes"]
+
+
+def build_ssh_args(host: dict, forwards: Iterable[Tuple[int, int]]) -> List[str]:
+    """
+    根据主机配置 (config.json 中的 host 字典) 和 (本地端口, 远程端口) 列表构建 ssh 命令行。
+    会带上主机上配置的 sshPort / identityFile / proxyJump / transport。
+    """
+    ssh_args = ["ssh", *TUNNEL_BASE_OPTIONS, *TUNNEL_FORWARD_OPTIONS]
+    ssh_args += _forward_args(forwards)
+    ssh_args += host_ssh_options(host)
+    ssh_args.append(f"{host.get('sshUser')}@{host.get('serverIP')}")
+    ssh_args += TUNNEL_KEEPALIVE_OPTIONS
+    return ssh_args
+
+
+def _forward_args(forwards: Iterable[Tuple[int, int]]) -> List[str]:
+    args = []
+    for local_port, remote_port in forwards:
+        args += ["-L", f"{local_port}:localhost:{remote_port}"]
+    return args
+
+
+def transport_args(transport: dict) -> List[str]:
+    """
+    传输参数 {'cipher', 'mac', 'compression'} (见 sshtf_transport) 对应的 ssh 参数。
+    compression 明确为 False 时传 Compression=no，覆盖 ~/.ssh/config 中的设置，与测试时的条件一致。
+    """
+    args = []
+    if transport.get('cipher'):
+        args += ["-c", transport['cipher']]
+    if transport.get('mac'):
+        args += ["-m", transport['mac']]
+    if transport.get('compression'):
+        args.append("-C")
+    elif transport.get('compression') is False:
+        args += ["-o", "Compression=no"]
+    return args
+
+
+def host_ssh_options(host: dict) -> List[str]:
+    """主机上配置的 sshPort / identityFile / proxyJump / transport 对应的 ssh 参数"""
+    args = transport_args(host.get('transport') or {})
+    ssh_port = int(host.get('sshPort') or DEFAULT_SSH_PORT)
+    if ssh_port != DEFAULT_SSH_PORT:
+        args += ["-p", str(ssh_port)]
+    if host.get('identityFile'):
+        args += ["-i", host['identityFile']]
+    if host.get('proxyJump'):
+        hops = parse_jump_chain(host['proxyJump'])
+        if hops and prewarm_supported():
+            # 经由最后一级跳板机的共享连接，而不是每个隧道各自连接一次跳板机 (见下方 "跳板机")
+            args += ["-o", f"ProxyCommand={jump_proxy_command(hops)}"]
+        else:
+            args += ["-J", host['proxyJump']]
+    return args
+
+
+# --- 跳板机 ---
+# proxyJump 的写法与 ssh -J 相同："user@bastion:port"，多级跳板按连接顺序用逗号分隔。
+# 支持 ControlMaster 的平台上不直接使用 -J (那样每个隧道都会单独连接一次跳板机)，而是通过 ProxyCommand
+# 经由最后一级跳板机的共享连接 (ControlMaster=auto：第一个隧道建立，之后的隧道复用) 到达目标主机；
+# 更前面的跳板只在建立这条共享连接时经过一次。最后一个隧道关闭 JUMP_PERSIST 秒后共享连接自动退出。
+
+JUMP_PERSIST = 600
+
+
+def parse_jump_chain(proxy_jump: str) -> List[dict]:
+    """把 proxyJump 拆成按连接顺序排列的跳板机 [{'sshUser' (可能为 None), 'serverIP', 'sshPort'}, ...]"""
+    hops = []
+    for spec in (proxy_jump or '').split(','):
+        spec = spec.strip()
+        if spec.startswith('ssh://'):
+            spec = spec[len('ssh://'):]
+        if not spec:
+            continue
+        user, _, address = spec.rpartition('@')
+        port = DEFAULT_SSH_PORT
+        if address.startswith('['):  # [IPv6 地址]:端口
+            address, _, rest = address[1:].partition(']')
+            if rest[1:].isdigit():
+                port = int(rest[1:])
+        elif address.count(':') == 1 and address.split(':')[1].isdigit():
+            address, port = address.split(':')[0], int(address.split(':')[1])
+        hops.append({'sshUser': user or None, 'serverIP': address, 'sshPort': port})
+    return hops
+
+
+def _jump_spec(hop: dict) -> str:
+    address = f"[{hop['serverIP']}]" if ':' in hop['serverIP'] else hop['serverIP']
+    return f"{hop['sshUser'] + '@' if hop['sshUser'] else ''}{address}:{hop['sshPort']}"
+
+
+def jump_control_path(hops: List[dict]) -> str:
+    """经由 hops 到达最后一级跳板机的共享连接的控制套接字路径"""
+    chain = ",".join(_jump_spec(hop) for hop in hops)
+    return str(CONTROL_DIR / ("j" + hashlib.blake2b(chain.encode('utf-8'), digest_size=8).hexdigest()))
+
+
+def jump_proxy_command(hops: List[dict]) -> str:
+    """经由最后一级跳板机的共享连接转发到 %h:%p 的 ProxyCommand (更前面的跳板机用 -J)"""
+    CONTROL_DIR.mkdir(parents=True, exist_ok=True, mode=0o700)
+    last = hops[-1]
+    args = ["ssh", "-o", "ControlMaster=auto", "-o", f"ControlPath={jump_control_path(hops)}",
+            "-o", f"ControlPersist={JUMP_PERSIST}"]
+    if last['sshPort'] != DEFAULT_SSH_PORT:
+        args += ["-p", str(last['sshPort'])]
+    if len(hops) > 1:
+        args += ["-J", ",".join(_jump_spec(hop) for hop in hops[:-1])]
+    destination = f"{last['sshUser']}@{last['serverIP']}" if last['sshUser'] else last['serverIP']
+    args += ["-W", "%h:%p", destination]
+    return " ".join(shlex.quote(arg) for arg in args)
+
+
+def build_command_args(host: dict, command: str, connect_timeout: int = 10) -> List[str]:
+    """
+    在主机上执行一条远程命令的 ssh 命令行 (不带 -N / -L，不会被识别为隧道)。
+    使用 BatchMode，需要密码时直接失败而不是挂起；主机有预热的主连接时通过 ControlPath 复用，省去握手。
+    """
+    args = ["ssh", "-o", "BatchMode=yes", "-o", f"ConnectTimeout={connect_timeout}",
+            "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=NUL"]
+    if prewarm_supported():
+        args += ["-o", f"ControlPath={control_path(host)}"]
+    args += host_ssh_options(host)
+    args += [f"{host.get('sshUser')}@{host.get('serverIP')}", command]
+    return args
+
+
+def launch_tunnel(host: dict, forwards: Iterable[Tuple[int, int]]):
+    """
+    在后台启动一个 ssh 隧道进程 (同一进程内可以有多个 -L 转发，共用一条 SSH 连接)。
+    如果该主机已有预热的主连接，则直接在主连接上添加转发 (见下方 "连接预热")，返回 MuxTunnel。
+    ssh 的 stderr 写入该隧道自己的日志文件 (见 sshtf_log)，返回的进程对象带有 tunnel_id 属性。
+    启动后应调用 wait_tunnel_ready() 确认转发是否建立。未找到 ssh 时抛出 FileNotFoundError。
+    """
+    forwards = list(forwards)
+    if prewarm_supported():
+        tunnel = _launch_on_master(host, forwards)
+        if tunnel is not None:
+            log_event('spawn', pid=tunnel.pid, hostName=host.get('hostName'), viaMaster=True,
+                      forwards=[list(f) for f in forwards])
+            return tunnel
+
+    # 在 Windows 上，使用 CREATE_NO_WINDOW 标志来隐藏窗口
+    creation_flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    tunnel_id, stderr_file = new_tunnel_log()
+    # stdin/stdout 重定向到 DEVNULL，使其成为一个完全分离的后台进程；stderr 写入日志文件
+    with stderr_file:
+        try:
+            process = subprocess.Popen(
+                build_ssh_args(host, forwards),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=stderr_file,
+                creationflags=creation_flags,
+            )
+        except OSError:
+            unregister_tunnel(tunnel_id)
+            raise
+
+    process.tunnel_id = tunnel_id
+    process.started_at = time.monotonic()
+    _spawned[process.pid] = process
+    destination, ssh_port = _host_destination(host)
+    try:
+        create_time = psutil.Process(process.pid).create_time()
+    except psutil.Error:
+        create_time = None
+    register_tunnel(tunnel_id, {
+        'pid': process.pid, 'createTime': create_time, 'hostName': host.get('hostName'),
+        'destination': destination, 'sshPort': ssh_port,
+        'forwards': [list(f) for f in forwards], 'startedAt': time.time(),
+    })
+    log_event('spawn', pid=process.pid, id=tunnel_id, hostName=host.get('hostName'),
+              destination=destination, sshPort=ssh_port, forwards=[list(f) for f in forwards])
+    return process
+
+
+# 本进程启动的 ssh 进程 (PID -> Popen)，用于在它们退出后取得退出码
+_spawned = {}
+
+# wait_tunnel_ready() 的默认等待时间与轮询间隔 (秒)
+TUNNEL_READY_TIMEOUT = 10.0
+TUNNEL_READY_POLL_INTERVAL = 0.02
+
+
+def wait_tunnel_ready(process, forwards: Iterable[Tuple[int, int]], timeout: float = TUNNEL_READY_TIMEOUT) -> dict:
+    """
+    等待刚启动的隧道就绪：所有本地端口都由该 ssh 进程监听即为就绪 (ready)；
+    进程在此之前退出即为失败 (failed)，此时附带退出码和 stderr 的最后几行；
+    超时仍未确定时返回 starting (例如握手较慢)。
+    返回 {'status', 'pid', 'elapsedMs', 'exitCode', 'stderr': [...]}
+    """
+    result = {'status': 'ready', 'pid': process.pid, 'elapsedMs': 0.0, 'exitCode': None, 'stderr': []}
+    if isinstance(process, MuxTunnel):
+        log_event('ready', pid=process.pid, elapsedMs=0.0, viaMaster=True)
+        return result  # 主连接已确认添加了转发
+
+    ports = {local for local, _ in forwards}
+    started = getattr(process, 'started_at', time.monotonic())
+    deadline = time.monotonic() + timeout
+    while True:
+        elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+        if process.poll() is not None:
+            tunnel_id = getattr(process, 'tunnel_id', None)
+            stderr = read_stderr(tunnel_id) if tunnel_id else []
+            result.update(status='failed', elapsedMs=elapsed_ms, exitCode=process.returncode, stderr=stderr)
+            log_event('failure', pid=process.pid, id=tunnel_id, exitCode=process.returncode,
+                      elapsedMs=elapsed_ms, stderr=stderr)
+            if tunnel_id:
+                unregister_tunnel(tunnel_id)
+            _spawned.pop(process.pid, None)
+            return result
+        try:
+            listening = {
+                c.laddr.port for c in psutil.Process(process.pid).net_connections(kind='tcp')
+                if c.status == psutil.CONN_LISTEN
+            }
+        except psutil.NoSuchProcess:
+            continue  # 刚刚退出，下一轮 poll() 会拿到退出码
+        except psutil.AccessDenied:
+            listening = set()
+        if ports <= listening:
+            result['elapsedMs'] = elapsed_ms
+            log_event('ready', pid=process.pid, id=getattr(process, 'tunnel_id', None), elapsedMs=elapsed_ms)
+            return result
+        if time.monotonic() >= deadline:
+            result.update(status='starting', elapsedMs=elapsed_ms)
+            return result
+        time.sleep(TUNNEL_READY_POLL_INTERVAL)
+
+
+def format_tunnel_failure(ready: dict) -> str:
+    """把 wait_tunnel_ready() 的失败结果整理成一行提示 (优先使用 ssh 自己的错误信息)"""
+    message = f"ssh 进程已退出 (退出码 {ready['exitCode']})"
+    if ready['stderr']:
+        message += ": " + " | ".join(ready['stderr'])
+    return message
+
+
+def collect_exited_tunnels(alive_pids: set = None) -> List[dict]:
+    """
+    检查登记过的隧道：已退出的写入 exit 事件 (附带 stderr 最后几行) 并清理其日志文件，
+    仍在运行的把 stderr 截断到上限以内。返回本次发现已退出的隧道信息。
+    """
+    exited = []
+    for tunnel in registered_tunnels():
+        pid = tunnel.get('pid')
+        if _registered_tunnel_alive(tunnel, alive_pids):
+            trim_stderr(tunnel['id'])
+            continue
+        process = _spawned.pop(pid, None)
+        exit_code = process.poll() if process is not None else None
+        stderr = read_stderr(tunnel['id'])
+        uptime = round(time.time() - tunnel.get('startedAt', time.time()), 1)
+        log_event('exit', pid=pid, id=tunnel['id'], hostName=tunnel.get('hostName'),
+                  exitCode=exit_code, uptime=uptime, stderr=stderr)
+        unregister_tunnel(tunnel['id'])
+        exited.append({**tunnel, 'exitCode': exit_code, 'stderr': stderr})
+    return exited
+
+
+def _registered_tunnel_alive(tunnel: dict, alive_pids: set = None) -> bool:
+    if alive_pids is not None:
+        return tunnel.get('pid') in alive_pids
+    try:
+        proc = psutil.Process(tunnel.get('pid'))
+        # PID 可能已被其他进程复用，用启动时间区分
+        if tunnel.get('createTime') and abs(proc.create_time() - tunnel['createTime']) > 1:
+            return False
+        return proc.status() != psutil.STATUS_ZOMBIE
+    except psutil.Error:
+        return False
+
+
+# --- 隧道进程的识别与解析 ---
+
+# ssh 中需要带参数的选项 (用于从命令行中找出目标地址)
+_SSH_OPTIONS_WITH_VALUE = set("BbcDEeFIiJLlmOoPpQRSWw")
+_SSH_PROCESS_NAMES = {'ssh', 'ssh.exe'}
+
+
+def is_tunnel_cmdline(cmdline: List[str]) -> bool:
+    """命令行是否带有本工具启动隧道时的固定参数"""
+    cmdline_str = " ".join(cmdline)
+    return (
+        "-o StrictHostKeyChecking=no" in cmdline_str and
+        "-o UserKnownHostsFile=NUL" in cmdline_str and
+        "-N" in cmdline and
+        "-L" in cmdline_str and
+        "-o ServerAliveInterval=60" in cmdline_str
+    )
+
+
+def parse_tunnel_cmdline(cmdline: List[str]) -> dict:
+    """
+    从隧道进程的命令行中解析出目标地址、ssh 端口和所有 -L 转发。
+    返回 {'destination': 'user@ip', 'sshPort': 22, 'forwards': [(本地端口, 远程端口), ...]}
+    """
+    info = {'destination': None, 'sshPort': DEFAULT_SSH_PORT, 'forwards': []}
+    args = iter(cmdline[1:])
+    for arg in args:
+        if len(arg) >= 2 and arg[0] == '-' and arg[1] in _SSH_OPTIONS_WITH_VALUE:
+            option = arg[1]
+            value = arg[2:] or next(args, '')
+            if option == 'L':
+                # [bind_address:]port:host:hostport
+                parts = value.split(':')
+                if len(parts) >= 3 and parts[-3].isdigit() and parts[-1].isdigit():
+                    info['forwards'].append((int(parts[-3]), int(parts[-1])))
+            elif option == 'p' and value.isdigit():
+                info['sshPort'] = int(value)
+        elif not arg.startswith('-') and info['destination'] is None:
+            info['destination'] = arg
+    return info
+
+
+def scan_tunnels() -> List[dict]:
+    """
+    扫描系统进程表 (昂贵的操作)，返回所有由本工具启动的隧道：
+    [{'proc': psutil.Process, 'pid': ..., 'destination': ..., 'sshPort': ..., 'forwards': [...]}, ...]
+    无法查询进程表时抛出异常，由调用方决定如何提示。
+    """
+    tunnels = []
+    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+        try:
+            name = (proc.info['name'] or '').lower()
+            cmdline = proc.info['cmdline'] or []
+            if name in _SSH_PROCESS_NAMES and is_tunnel_cmdline(cmdline):
+                tunnels.append({'proc': proc, 'pid': proc.pid, **parse_tunnel_cmdline(cmdline)})
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            # 进程可能已经结束，或者我们没有权限访问
+            continue
+    collect_exited_tunnels({t['pid'] for t in tunnels})
+    if prewarm_supported() and MASTERS_PATH.exists():
+        tunnels += _scan_mux_tunnels()
+    return tunnels
+
+
+def _host_destination(host: dict) -> Tuple[str, int]:
+    return f"{host.get('sshUser')}@{host.get('serverIP')}", int(host.get('sshPort') or DEFAULT_SSH_PORT)
+
+
+def find_tunnels(config: dict, host_name: str = None, service_name: str = None,
+                 local_port: int = None, tunnels: List[dict] = None) -> List[dict]:
+    """
+    按主机名 / 服务名 / 本地端口筛选正在运行的隧道 (条件之间为 "与" 关系，均为空时返回全部)。
+    每个结果会附带 'hostName' 和 'services' (该进程中能对应到配置的服务名)。
+    服务按 远程端口 对应，因为本地端口可能在启动时被自动递增过。
+    """
+    if tunnels is None:
+        tunnels = scan_tunnels()
+
+    hosts_by_destination = {}
+    for host in config.get('hosts', []):
+        hosts_by_destination.setdefault(_host_destination(host), host)
+
+    matched = []
+    for tunnel in tunnels:
+        host = hosts_by_destination.get((tunnel['destination'], tunnel['sshPort']))
+        remote_ports = {remote for _, remote in tunnel['forwards']}
+        services = [
+            s.get('serviceName') for s in (host or {}).get('services', [])
+            if s.get('remotePort') in remote_ports
+        ]
+        tunnel = {**tunnel, 'hostName': host.get('hostName') if host else None, 'services': services}
+
+        if host_name is not None and tunnel['hostName'] != host_name:
+            continue
+        if service_name is not None and service_name not in services:
+            continue
+        if local_port is not None and all(local != local_port for local, _ in tunnel['forwards']):
+            continue
+        matched.append(tunnel)
+    return matched
+
+
+def stop_tunnels(tunnels: List[dict], timeout: float = 3.0) -> dict:
+    """
+    优雅地批量关闭隧道：先同时向所有目标发送 SIGTERM，统一等待 timeout 秒，
+    仍未退出的再 SIGKILL。返回 {'terminated': [...], 'killed': [...], 'failed': [...]} (PID 列表)。
+    """
+    result = {'terminated': [], 'killed': [], 'failed': []}
+    procs = []
+    for tunnel in tunnels:
+        if tunnel.get('controlPath'):
+            # 预热主连接上的转发：只取消转发，主连接保留
+            ok = _cancel_mux_forwards(tunnel['controlPath'], tunnel['forwards'])
+            result['terminated' if ok else 'failed'].append(tunnel['pid'])
+            continue
+        try:
+            tunnel['proc'].terminate()
+            procs.append(tunnel['proc'])
+        except psutil.NoSuchProcess:
+            result['terminated'].append(tunnel['pid'])  # 已经退出
+        except (psutil.AccessDenied, OSError):
+            result['failed'].append(tunnel['pid'])
+
+    gone, alive = psutil.wait_procs(procs, timeout=timeout)
+    result['terminated'] += [p.pid for p in gone]
+
+    for proc in alive:
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            pass
+        except (psutil.AccessDenied, OSError):
+            result['failed'].append(proc.pid)
+    killed, still_alive = psutil.wait_procs(
+        [p for p in alive if p.pid not in result['failed']], timeout=1.0
+    )
+    result['killed'] += [p.pid for p in killed]
+    result['failed'] += [p.pid for p in still_alive]
+    for outcome in ('terminated', 'killed', 'failed'):
+        for pid in result[outcome]:
+            log_event('stop', pid=pid, outcome=outcome)
+    return result
+
+
+# --- 本地端口 ---
+
+def listening_ports() -> set:
+    """一次性读取系统中所有处于 LISTEN 状态的 TCP 端口"""
+    return {
+        conn.laddr.port for conn in psutil.net_connections(kind='tcp')
+        if conn.laddr and conn.status == psutil.CONN_LISTEN
+    }
+
+
+def next_free_port(port: int, busy: set, end: int = 65535):
+    """从 port 开始 (含) 找到第一个不在 busy 中的端口，超过 end 时返回 None"""
+    while port <= end:
+        if port not in busy:
+            return port
+        port += 1
+    return None
+
+
+# --- 隧道组 ---
+
+def find_group(config: dict, group_name: str):
+    return next((g for g in config.get('groups', []) if g.get('groupName') == group_name), None)
+
+
+def _group_members_by_host(config: dict, group: dict):
+    """
+    将组成员按主机归类：返回 ({主机名: (主机配置, [服务配置, ...])}, [无法找到的成员说明, ...])
+    """
+    hosts = {h.get('hostName'): h for h in config.get('hosts', [])}
+    by_host, missing = {}, []
+    for member in group.get('members', []):
+        host_name, service_name = member.get('hostName'), member.get('serviceName')
+        host = hosts.get(host_name)
+        service = next((s for s in (host or {}).get('services', []) if s.get('serviceName') == service_name), None)
+        if service is None:
+            missing.append(f"{host_name}/{service_name}")
+            continue
+        entry = by_host.setdefault(host_name, (host, []))
+        if service not in entry[1]:
+            entry[1].append(service)
+    return by_host, missing
+
+
+def start_group(config: dict, group_name: str, busy_ports: set = None, running: List[dict] = None) -> List[dict]:
+    """
+    并行启动一个隧道组。同一主机上的成员合并到一个 ssh 进程 (多个 -L，共用一条连接)，
+    不同主机的进程同时启动、同时检查。已在运行的成员会被跳过。
+    返回每个成员的结果：
+    {'hostName', 'serviceName', 'localPort', 'pid', 'status': 'started'|'running'|'failed'|'missing', 'error'}
+    """
+    group = find_group(config, group_name)
+    if group is None:
+        raise KeyError(f"未找到隧道组: {group_name}")
+
+    by_host, missing = _group_members_by_host(config, group)
+    results = [
+        {'hostName': m.split('/', 1)[0], 'serviceName': m.split('/', 1)[1], 'localPort': None,
+         'pid': None, 'status': 'missing', 'error': '配置中不存在该主机或服务'}
+        for m in missing
+    ]
+
+    wanted = [
+        {'hostName': host_name, 'serviceName': service.get('serviceName'),
+         'remotePort': int(service.get('remotePort')), 'localPort': int(service.get('localPort') or 0)}
+        for host_name, (host, services) in by_host.items() for service in services
+    ]
+    return results + start_forwards(config, wanted, busy_ports=busy_ports, running=running, record=True)
+
+
+def start_forwards(config: dict, wanted: List[dict], busy_ports: set = None, running: List[dict] = None,
+                   record: bool = False) -> List[dict]:
+    """
+    并行启动一批转发 (隧道组和快照恢复共用)。
+    wanted 中每项为 {'hostName', 'serviceName' (自定义转发为 None), 'remotePort', 'localPort' (首选的本地端口)}，
+    可带其他字段，会原样出现在结果中。同一主机上的转发合并到一个 ssh 进程 (多个 -L，共用一条连接)，
+    不同主机的进程同时启动、同时检查；已有隧道转发了该主机的同一远程端口时视为已在运行。
+    首选端口被占用时自动递增。record 为 True 时为成功启动的服务记录使用情况。
+    返回每项的结果：在原字段基础上更新 'localPort'，并加上
+    'pid'、'status': 'started'|'running'|'failed'|'missing'、'error'。
+    """
+    hosts = {h.get('hostName'): h for h in config.get('hosts', [])}
+    if running is None:
+        running = scan_tunnels()
+    forwarded = {}  # (主机名, 远程端口) -> (PID, 本地端口)
+    for tunnel in find_tunnels(config, tunnels=running):
+        for local, remote in tunnel['forwards']:
+            forwarded.setdefault((tunnel['hostName'], remote), (tunnel['pid'], local))
+    if busy_ports is None:
+        busy_ports = listening_ports()
+    busy_ports = set(busy_ports)
+
+    # 先在主线程中统一分配本地端口，避免并行启动时互相抢占
+    results, plans = [], {}
+    for item in wanted:
+        host = hosts.get(item['hostName'])
+        if host is None:
+            results.append({**item, 'pid': None, 'status': 'missing', 'error': '配置中不存在该主机'})
+            continue
+        already = forwarded.get((item['hostName'], item['remotePort']))
+        if already:
+            results.append({**item, 'localPort': already[1], 'pid': already[0], 'status': 'running', 'error': None})
+            continue
+        local_port = next_free_port(item.get('localPort') or 1024, busy_ports)
+        if local_port is None:
+            results.append({**item, 'localPort': None, 'pid': None, 'status': 'failed', 'error': '没有可用的本地端口'})
+            continue
+        busy_ports.add(local_port)
+        plans.setdefault(item['hostName'], (host, []))[1].append({**item, 'localPort': local_port})
+
+    def launch(plan):
+        host, members = plan
+        forwards = [(m['localPort'], m['remotePort']) for m in members]
+        try:
+            process = launch_tunnel(host, forwards)
+        except Exception as e:
+            return [{**m, 'pid': None, 'status': 'failed', 'error': str(e)} for m in members]
+        ready = wait_tunnel_ready(process, forwards)
+        if ready['status'] == 'failed':
+            error = format_tunnel_failure(ready)
+            return [{**m, 'pid': process.pid, 'status': 'failed', 'error': error} for m in members]
+        if record:
+            for m in members:
+                record_use(m['hostName'], m['serviceName'])
+        return [{**m, 'pid': process.pid, 'status': 'started', 'error': None} for m in members]
+
+    if plans:
+        with ThreadPoolExecutor(max_workers=min(16, len(plans))) as pool:
+            for member_results in pool.map(launch, plans.values()):
+                results.extend(member_results)
+    return results
+
+
+def stop_group(config: dict, group_name: str, timeout: float = 3.0, tunnels: List[dict] = None) -> dict:
+    """
+    关闭隧道组中所有成员对应的隧道进程 (同一进程中的其他转发也会一并关闭)。
+    返回值同 stop_tunnels()，另加 'matched' 表示匹配到的进程数。
+    """
+    group = find_group(config, group_name)
+    if group is None:
+        raise KeyError(f"未找到隧道组: {group_name}")
+
+    members = {(m.get('hostName'), m.get('serviceName')) for m in group.get('members', [])}
+    targets = [
+        t for t in find_tunnels(config, tunnels=tunnels)
+        if any((t['hostName'], s) in members for s in t['services'])
+    ]
+    return {'matched': len(targets), **stop_tunnels(targets, timeout=timeout)}
+
+
+# --- 声明式收敛 ---
+# 给出期望运行的 (主机名, 服务名) 集合，只启动缺少的、只关闭多余的，已经符合的隧道不受影响。
+# 一个 ssh 进程中的某个转发无法单独关闭：进程中既有期望的转发又有多余的转发时，
+# 关闭整个进程后按原来的本地端口重新启动期望的部分 (restart)。预热主连接上的转发可以逐个取消，不受此限。
+# 对应不到配置中服务的隧道 (自定义转发、未知主机) 不在收敛范围内，不会被关闭。
+
+
+def plan_reconcile(config: dict, desired: List[dict], tunnels: List[dict] = None) -> dict:
+    """
+    对比期望的转发集合与正在运行的隧道，返回收敛计划 (不做任何修改)。
+    desired 为 [{'hostName', 'serviceName'}, ...]。返回
+    - 'start': 需要启动的转发 (格式同 start_forwards() 的 wanted，restart 中需要保留的转发也在其中，沿用原端口)
+    - 'stop': 需要关闭的隧道 (其中的转发都是多余的，或与其他隧道重复)
+    - 'restart': 需要关闭后只重新启动期望部分的隧道
+    - 'keep': 已在运行、保持不变的 [{'hostName', 'serviceName'}, ...]
+    - 'unmanaged': 不在收敛范围内的隧道
+    - 'missing': 配置中不存在的期望项
+    隧道的格式同 find_tunnels()。
+    """
+    hosts = {h.get('hostName'): h for h in config.get('hosts', [])}
+    wanted, missing = {}, []
+    for item in desired:
+        host = hosts.get(item['hostName'])
+        service = next((s for s in (host or {}).get('services', []) if s.get('serviceName') == item['serviceName']), None)
+        if service is None:
+            missing.append({'hostName': item['hostName'], 'serviceName': item['serviceName']})
+            continue
+        wanted.setdefault((item['hostName'], item['serviceName']), {
+            'hostName': item['hostName'], 'serviceName': item['serviceName'],
+            'remotePort': int(service.get('remotePort')), 'localPort': int(service.get('localPort') or 0),
+        })
+
+    plan = {'start': [], 'stop': [], 'restart': [], 'keep': [], 'unmanaged': [], 'missing': missing}
+    provided = set()  # 已由保留 (或重新启动) 的隧道提供的 (主机名, 服务名)
+    for tunnel in find_tunnels(config, tunnels=tunnels):
+        services = (hosts.get(tunnel['hostName']) or {}).get('services', [])
+        forwards = []  # [(键, 本地端口, 远程端口)]，对应不到服务的转发键为 None
+        for local, remote in tunnel['forwards']:
+            service = next((s for s in services if s.get('remotePort') == remote), None)
+            forwards.append(((tunnel['hostName'], service.get('serviceName')) if service else None, local, remote))
+        if all(key is None for key, _, _ in forwards):
+            plan['unmanaged'].append(tunnel)
+            continue
+        extra = [key for key, _, _ in forwards if key is not None and (key not in wanted or key in provided)]
+        keep = [(key, local) for key, local, _ in forwards if key in wanted and key not in provided]
+        provided.update(key for key, _ in keep)
+        if not extra:
+            plan['keep'] += [{'hostName': key[0], 'serviceName': key[1]} for key, _ in keep]
+        elif not keep and all(key is not None for key, _, _ in forwards):
+            plan['stop'].append(tunnel)
+        else:
+            plan['restart'].append(tunnel)
+            plan['start'] += [{**wanted[key], 'localPort': local} for key, local in keep]
+            # 同一进程中的自定义转发也一并重新启动
+            plan['start'] += [{'hostName': tunnel['hostName'], 'serviceName': None, 'remotePort': remote,
+                               'localPort': local} for key, local, remote in forwards if key is None]
+    plan['start'] += [item for key, item in wanted.items() if key not in provided]
+    return plan
+
+
+def reconcile(config: dict, desired: List[dict], timeout: float = 3.0, dry_run: bool = False,
+              tunnels: List[dict] = None) -> dict:
+    """
+    让正在运行的隧道收敛到 desired ([{'hostName', 'serviceName'}, ...])，返回 plan_reconcile() 的计划，
+    另加 'started' (start_forwards() 的结果) 和 'stopped' (stop_tunnels() 的结果)；dry_run 时只返回计划。
+    期望项中有配置里不存在的服务时 (多半是拼写错误) 同样只返回计划，不会据此关闭其他隧道。
+    关闭与启动同时进行；要用到被关闭隧道所占本地端口的转发等关闭完成后再启动。
+    """
+    if tunnels is None:
+        tunnels = scan_tunnels()
+    plan = plan_reconcile(config, desired, tunnels)
+    if dry_run or plan['missing']:
+        return plan
+
+    to_stop = plan['stop'] + plan['restart']
+    stopping_pids = {t['pid'] for t in to_stop if not t.get('controlPath')}
+    stopping_forwards = {(t['pid'], tuple(f)) for t in to_stop for f in t['forwards']}
+    # 剩下的隧道，用于判断转发是否已在运行 (预热主连接上的转发按转发区分)
+    remaining = [t for t in tunnels if t['pid'] not in stopping_pids
+                 and not any((t['pid'], tuple(f)) in stopping_forwards for f in t['forwards'])]
+    freed = {local for t in to_stop for local, _ in t['forwards']}
+    independent = [item for item in plan['start'] if item['localPort'] not in freed]
+    dependent = [item for item in plan['start'] if item['localPort'] in freed]
+
+    started, stopped = [], {'terminated': [], 'killed': [], 'failed': []}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        stopping = pool.submit(stop_tunnels, to_stop, timeout) if to_stop else None
+        if independent:
+            started += start_forwards(config, independent, running=remaining)
+        if stopping:
+            stopped = stopping.result()
+    if dependent:
+        started += start_forwards(config, dependent, running=remaining)
+    return {**plan, 'started': started, 'stopped': stopped}
+
+
+# --- 隧道快照 ---
+# 记录正在运行的隧道 (主机、服务、实际使用的本地端口)，重启、休眠或 "关闭全部" 之后可以一次性恢复。
+
+SNAPSHOT_PATH = STATE_DIR / 'snapshot.json'
+
+
+def snapshot_tunnels(config: dict, tunnels: List[dict] = None) -> List[dict]:
+    """
+    把当前运行的隧道写入 snapshot.json，返回记录的条目
+    [{'hostName', 'serviceName' (自定义转发为 None), 'localPort', 'remotePort'}, ...]。
+    没有可记录的隧道时不覆盖已有快照，这样关闭全部隧道之后仍能恢复上一次的隧道。
+    """
+    hosts = {h.get('hostName'): h for h in config.get('hosts', [])}
+    entries, seen = [], set()
+    for tunnel in find_tunnels(config, tunnels=tunnels):
+        host = hosts.get(tunnel['hostName'])
+        if host is None:
+            continue  # 无法对应到配置中的主机，恢复时也无法重建
+        for local, remote in tunnel['forwards']:
+            if (tunnel['hostName'], remote) in seen:
+                continue
+            seen.add((tunnel['hostName'], remote))
+            service = next((s for s in host.get('services', []) if s.get('remotePort') == remote), None)
+            entries.append({'hostName': tunnel['hostName'], 'serviceName': service.get('serviceName') if service else None,
+                            'localPort': local, 'remotePort': remote})
+    if not entries:
+        return []
+
+    write_state_file(SNAPSHOT_PATH, {'savedAt': time.time(), 'tunnels': entries})
+    return entries
+
+
+def load_snapshot() -> dict:
+    """{'savedAt': 时间戳|None, 'tunnels': [...]}，没有快照时 tunnels 为空"""
+    try:
+        snapshot = json.loads(SNAPSHOT_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {'savedAt': None, 'tunnels': []}
+    return {'savedAt': snapshot.get('savedAt'), 'tunnels': snapshot.get('tunnels', [])}
+
+
+def restore_snapshot(config: dict, busy_ports: set = None, running: List[dict] = None) -> List[dict]:
+    """
+    并行重新打开快照中的所有隧道，本地端口空闲时沿用快照中的端口，否则自动递增。
+    返回值同 start_forwards()，每项另有 'previousPort' (快照中的本地端口)。
+    """
+    wanted = [
+        {'hostName': e['hostName'], 'serviceName': e.get('serviceName'), 'remotePort': e['remotePort'],
+         'localPort': e['localPort'], 'previousPort': e['localPort']}
+        for e in load_snapshot()['tunnels']
+    ]
+    return start_forwards(config, wanted, busy_ports=busy_ports, running=running)
+
+
+# --- 空闲隧道回收 ---
+# 服务可以设置 idleTimeout (秒)：隧道在这么长时间内都没有客户端连接时自动关闭，释放 ssh 进程和服务器会话。
+# 只对登记过的隧道 (本工具启动的 ssh 进程、预热主连接上的转发) 逐个 PID 查询其 TCP 连接，
+# 不扫描进程表，也不读取全系统的连接表。活动时间只在采样时更新，应以远小于超时的间隔
+# 定期调用 reap_idle_tunnels() (ssh.py --reap --interval 60；菜单打开时也会顺便采样一次)。
+# 被回收的转发记录在 REAPED_PATH 中，revive_reaped() 按原来的本地端口立即重新打开。
+
+IDLE_STATE_PATH = STATE_DIR / 'idle.json'
+REAPED_PATH = STATE_DIR / 'reaped.json'
+
+
+def _tracked_tunnels() -> List[dict]:
+    """登记过且仍在运行的隧道 (格式同 scan_tunnels())，不扫描进程表"""
+    tunnels = []
+    for tunnel in registered_tunnels():
+        if not _registered_tunnel_alive(tunnel):
+            continue
+        try:
+            proc = psutil.Process(tunnel['pid'])
+        except psutil.Error:
+            continue
+        tunnels.append({'proc': proc, 'pid': tunnel['pid'], 'destination': tunnel.get('destination'),
+                        'sshPort': tunnel.get('sshPort'), 'forwards': [tuple(f) for f in tunnel.get('forwards', [])]})
+    if prewarm_supported() and MASTERS_PATH.exists():
+        tunnels += _scan_mux_tunnels()
+    return tunnels
+
+
+def _active_local_ports(pid: int, ports: set) -> set:
+    """进程的转发端口中，有已建立的客户端连接的那些 (只查询这一个进程的连接)"""
+    try:
+        connections = psutil.Process(pid).net_connections(kind='tcp')
+    except psutil.Error:
+        return set(ports)  # 无法查询时视为活动，宁可不回收
+    return {c.laddr.port for c in connections
+            if c.status == psutil.CONN_ESTABLISHED and c.laddr and c.laddr.port in ports}
+
+
+def write_state_file(path, data):
+    """把 data 以 JSON 原子地写入状态目录下的 path (先写临时文件再替换，临时文件按进程区分)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def load_reaped() -> List[dict]:
+    """被回收的转发 [{'hostName', 'serviceName', 'localPort', 'remotePort', 'reapedAt'}, ...]"""
+    try:
+        return json.loads(REAPED_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return []
+
+
+def reap_idle_tunnels(config: dict, now: float = None) -> List[dict]:
+    """
+    采样一次所有登记隧道的客户端连接并更新活动时间，关闭所有转发都空闲超过所属服务 idleTimeout 的隧道
+    (同一进程中有未设置 idleTimeout 的服务时不关闭)。返回被回收的转发，同时记入 REAPED_PATH。
+    """
+    now = time.time() if now is None else now
+    hosts_by_destination = {}
+    for host in config.get('hosts', []):
+        hosts_by_destination.setdefault(_host_destination(host), host)
+    tunnels = _tracked_tunnels()
+
+    try:
+        previous = json.loads(IDLE_STATE_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        previous = {}
+    ports_by_pid = {}
+    for tunnel in tunnels:
+        ports_by_pid.setdefault(tunnel['pid'], set()).update(local for local, _ in tunnel['forwards'])
+    last_active = {}  # "PID:本地端口" -> 最近一次观察到客户端连接的时间 (第一次见到时记为现在)
+    for pid, ports in ports_by_pid.items():
+        active = _active_local_ports(pid, ports)
+        for port in ports:
+            key = f"{pid}:{port}"
+            last_active[key] = now if port in active or key not in previous else previous[key]
+
+    to_stop, reaped = [], []
+    for tunnel in tunnels:
+        host = hosts_by_destination.get((tunnel['destination'], tunnel['sshPort']))
+        entries = []
+        for local, remote in tunnel['forwards']:
+            service = next((s for s in (host or {}).get('services', []) if s.get('remotePort') == remote), None)
+            idle = now - last_active[f"{tunnel['pid']}:{local}"]
+            if not (service or {}).get('idleTimeout') or idle < service['idleTimeout']:
+                break
+            entries.append({'hostName': host.get('hostName'), 'serviceName': service.get('serviceName'),
+                            'localPort': local, 'remotePort': remote, 'reapedAt': now, 'idleSeconds': round(idle)})
+        else:
+            to_stop.append(tunnel)
+            reaped += entries
+
+    if to_stop:
+        stop_tunnels(to_stop)
+        for entry in reaped:
+            log_event('reap', **entry)
+        keys = {(e['hostName'], e['remotePort']) for e in reaped}
+        marked = [e for e in load_reaped() if (e['hostName'], e['remotePort']) not in keys]
+        write_state_file(REAPED_PATH, marked + [{k: v for k, v in e.items() if k != 'idleSeconds'} for e in reaped])
+        for tunnel in to_stop:
+            for local, _ in tunnel['forwards']:
+                last_active.pop(f"{tunnel['pid']}:{local}", None)
+    if last_active != previous:
+        write_state_file(IDLE_STATE_PATH, last_active)
+    return reaped
+
+
+def revive_reaped(config: dict, host_name: str = None, service_name: str = None,
+                  busy_ports: set = None, running: List[dict] = None) -> List[dict]:
+    """
+    重新打开被回收的转发 (可按主机 / 服务筛选)，本地端口空闲时沿用原来的端口。running 的含义同 start_forwards()。
+    返回值同 start_forwards()，每项另有 'previousPort'；重新打开或已在运行的转发不再标记为已回收。
+    """
+    marked = load_reaped()
+    selected = [e for e in marked
+                if (host_name is None or e['hostName'] == host_name)
+                and (service_name is None or e['serviceName'] == service_name)]
+    wanted = [{'hostName': e['hostName'], 'serviceName': e['serviceName'], 'remotePort': e['remotePort'],
+               'localPort': e['localPort'], 'previousPort': e['localPort']} for e in selected]
+    results = start_forwards(config, wanted, busy_ports=busy_ports, running=running, record=True)
+    revived = {(r['hostName'], r['remotePort']) for r in results if r['status'] in ('started', 'running')}
+    if revived:
+        write_state_file(REAPED_PATH, [e for e in marked if (e['hostName'], e['remotePort']) not in revived])
+    return results
+
+
+# --- 连接预热 (ControlMaster) ---
+# 根据使用记录，预先为最常用的主机建立 ssh 主连接 (ssh -M)。之后添加转发只需通过
+# 控制套接字发送 "ssh -O forward"，省去每次建立 SSH 连接的握手。
+# 主连接本身不带 -L，不会被 is_tunnel_cmdline() 识别为隧道；在它上面添加的转发登记在
+# MASTERS_PATH 中，scan_tunnels() 会把它们与普通隧道进程一起返回，stop_tunnels() 用 "-O cancel" 关闭。
+# 主连接不使用 ControlPersist (它不把监听中的转发算作活动连接)，空闲关闭由 reap_idle_masters() 负责。
+
+PREWARM_DEFAULTS = {
+    'maxConnections': 3,  # 最多同时保持的预热主连接数
+    'idleTimeout': 1800,  # 没有转发的主连接空闲多少秒后关闭
+}
+MASTERS_PATH = STATE_DIR / 'masters.json'
+CONTROL_DIR = STATE_DIR / 'cm'
+MASTER_STARTUP_TIMEOUT = 10.0
+MUX_COMMAND_TIMEOUT = 5.0
+
+
+class MuxTunnel:
+    """在预热主连接上添加的转发：没有独立的 ssh 进程，pid 为主连接进程 (接口与 Popen 的用法保持一致)"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        return None
+
+
+def prewarm_supported() -> bool:
+    # Windows 自带的 OpenSSH 不支持 ControlMaster
+    return os.name != 'nt'
+
+
+def prewarm_settings(config: dict) -> dict:
+    return {**PREWARM_DEFAULTS, **(config.get('prewarm') or {})}
+
+
+def control_path(host: dict) -> str:
+    """主机对应的控制套接字路径 (用摘要命名，避免超过 Unix 套接字的路径长度限制)"""
+    destination, ssh_port = _host_destination(host)
+    identity = f"{destination}\0{ssh_port}\0{host.get('identityFile') or ''}\0{host.get('proxyJump') or ''}"
+    if host.get('transport'):
+        # 传输参数改变后不再复用按旧参数建立的主连接
+        identity += "\0" + json.dumps(host['transport'], sort_keys=True)
+    return str(CONTROL_DIR / hashlib.blake2b(identity.encode('utf-8'), digest_size=8).hexdigest())
+
+
+@contextmanager
+def _masters_state():
+    """在文件锁内读写预热主连接登记表：{控制套接字路径: {'hostName', 'destination', 'sshPort', 'pid', 'warmedAt', 'lastUsed', 'forwards'}}"""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(STATE_DIR / 'masters.lock', 'a+b') as lock, exclusive_lock(lock):
+        try:
+            masters = json.loads(MASTERS_PATH.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            masters = {}
+        original = json.dumps(masters, sort_keys=True)
+        yield masters
+        if json.dumps(masters, sort_keys=True) != original:
+            tmp_path = MASTERS_PATH.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(masters, indent=2), encoding='utf-8')
+            os.replace(tmp_path, MASTERS_PATH)
+
+
+def _master_alive(path: str, entry: dict) -> bool:
+    try:
+        proc = psutil.Process(entry['pid'])
+        return proc.is_running() and path in proc.cmdline() and os.path.exists(path)
+    except (psutil.NoSuchProcess, psutil.AccessDenied, KeyError):
+        return False
+
+
+def _prune_dead_masters(masters: dict):
+    for path in [p for p, entry in masters.items() if not _master_alive(p, entry)]:
+        del masters[path]
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _mux_command(path: str, entry: dict, command: str, forwards) -> bool:
+    args = ["ssh", "-S", path, "-O", command, *_forward_args(forwards)]
+    if entry.get('sshPort', DEFAULT_SSH_PORT) != DEFAULT_SSH_PORT:
+        args += ["-p", str(entry['sshPort'])]
+    args.append(entry['destination'])
+    try:
+        completed = subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL, timeout=MUX_COMMAND_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return completed.returncode == 0
+
+
+def _launch_on_master(host: dict, forwards: List[Tuple[int, int]]) -> Optional[MuxTunnel]:
+    """主机有存活的预热主连接时，在其上添加转发；否则返回 None (由调用方启动独立进程)"""
+    path = control_path(host)
+    if not os.path.exists(path):
+        return None
+    with _masters_state() as masters:
+        entry = masters.get(path)
+        if entry is None or not _master_alive(path, entry):
+            _prune_dead_masters(masters)
+            return None
+        entry = dict(entry)
+    # ssh -O 在锁外执行：控制套接字无响应时要等到超时，不能让其他进程的启动、扫描和关闭一起等待
+    if not _mux_command(path, entry, "forward", forwards):
+        return None
+    with _masters_state() as masters:
+        current = masters.get(path)
+        if current is None or current['pid'] != entry['pid']:
+            return None  # 期间主连接已被关闭，转发也随之消失
+        current['forwards'] += [list(f) for f in forwards]
+        current['lastUsed'] = time.time()
+        return MuxTunnel(current['pid'])
+
+
+def _scan_mux_tunnels() -> List[dict]:
+    """登记表中仍然有效的转发，每个转发一项 (格式同 scan_tunnels())"""
+    tunnels = []
+    with _masters_state() as masters:
+        _prune_dead_masters(masters)
+        for path, entry in masters.items():
+            for local_port, remote_port in entry['forwards']:
+                tunnels.append({
+                    'proc': None, 'pid': entry['pid'], 'controlPath': path,
+                    'destination': entry['destination'], 'sshPort': entry['sshPort'],
+                    'forwards': [(local_port, remote_port)],
+                })
+    return tunnels
+
+
+def _cancel_mux_forwards(path: str, forwards) -> bool:
+    with _masters_state() as masters:
+        entry = masters.get(path)
+        if entry is None or not _master_alive(path, entry):
+            return True  # 主连接已经不在，转发也随之消失
+        entry = dict(entry)
+    if not _mux_command(path, entry, "cancel", forwards):  # 同样在锁外执行
+        return False
+    with _masters_state() as masters:
+        current = masters.get(path)
+        if current is None or current['pid'] != entry['pid']:
+            return True
+        cancelled = {tuple(f) for f in forwards}
+        current['forwards'] = [f for f in current['forwards'] if tuple(f) not in cancelled]
+        if not current['forwards']:
+            current['lastUsed'] = time.time()  # 从最后一个转发关闭时开始计算空闲时间
+        return True
+
+
+def open_master(host: dict, timeout: float = MASTER_STARTUP_TIMEOUT) -> int:
+    """
+    为主机建立一个预热主连接并登记，返回主连接进程的 PID (已存在时直接返回)。
+    主连接使用 BatchMode，需要密码时会直接失败而不是挂起。失败时抛出 RuntimeError / TimeoutError。
+    """
+    path = control_path(host)
+    with _masters_state() as masters:
+        entry = masters.get(path)
+        if entry is not None and _master_alive(path, entry):
+            return entry['pid']
+
+    CONTROL_DIR.mkdir(parents=True, exist_ok=True, mode=0o700)
+    try:
+        os.unlink(path)  # 上一个主连接异常退出后残留的套接字
+    except OSError:
+        pass
+
+    destination, ssh_port = _host_destination(host)
+    args = ["ssh", "-M", "-S", path, "-o", "BatchMode=yes", *TUNNEL_BASE_OPTIONS,
+            *host_ssh_options(host), destination, *TUNNEL_KEEPALIVE_OPTIONS]
+    # 独立的会话，启动它的脚本退出后主连接仍然保留
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, start_new_session=True)
+
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if process.poll() is not None:
+            raise RuntimeError(f"ssh 主连接已退出 (退出码 {process.returncode})")
+        if time.monotonic() > deadline:
+            process.terminate()
+            raise TimeoutError(f"{timeout:g} 秒内未能建立主连接")
+        time.sleep(0.1)
+
+    now = time.time()
+    with _masters_state() as masters:
+        masters[path] = {
+            'hostName': host.get('hostName'), 'destination': destination, 'sshPort': ssh_port,
+            'pid': process.pid, 'warmedAt': now, 'lastUsed': now, 'forwards': [],
+        }
+    return process.pid
+
+
+def _close_master(path: str, entry: dict):
+    try:
+        psutil.Process(entry['pid']).terminate()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        pass
+
+
+def _reap_masters(masters: dict, keep: set, settings: dict, now: float) -> List[str]:
+    """
+    关闭没有转发且空闲超过 idleTimeout 的主连接；空闲主连接总数超出 maxConnections 时，
+    再按最近使用时间从旧到新关闭 (keep 中的除外)。返回被关闭的主机名列表。
+    """
+    _prune_dead_masters(masters)
+    closed = []
+    idle = sorted(
+        (p for p, e in masters.items() if not e['forwards'] and p not in keep),
+        key=lambda p: masters[p]['lastUsed'],
+    )
+    budget = max(0, int(settings['maxConnections']) - len(keep))
+    for index, path in enumerate(idle):
+        entry = masters[path]
+        if now - entry['lastUsed'] >= settings['idleTimeout'] or index < len(idle) - budget:
+            _close_master(path, entry)
+            closed.append(entry['hostName'])
+            del masters[path]
+    return closed
+
+
+def reap_idle_masters(config: dict, now: float = None) -> List[str]:
+    """只做空闲回收 (不预热新连接)，返回被关闭的主机名列表"""
+    if not prewarm_supported() or not MASTERS_PATH.exists():
+        return []
+    with _masters_state() as masters:
+        return _reap_masters(masters, set(), prewarm_settings(config), time.time() if now is None else now)
+
+
+def predict_hosts(config: dict, limit: int, usage: dict = None, now: float = None) -> List[dict]:
+    """按使用频率 (随时间衰减) 预测最可能用到的主机，没有使用记录的主机不参与"""
+    usage = load_usage() if usage is None else usage
+    scored = [(frecency(usage, h.get('hostName'), now=now), h) for h in config.get('hosts', [])]
+    scored = [item for item in scored if item[0] > 0]
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [h for _, h in scored[:limit]]
+
+
+def prewarm(config: dict, usage: dict = None, now: float = None) -> dict:
+    """
+    预热：为预测的前 maxConnections 台主机建立主连接 (并行)，已预热的刷新空闲计时；
+    同时回收其他空闲的主连接。
+    返回 {'opened': [...], 'kept': [...], 'closed': [...], 'failed': {主机名: 错误}}
+    """
+    now = time.time() if now is None else now
+    settings = prewarm_settings(config)
+    candidates = {control_path(h): h for h in predict_hosts(config, int(settings['maxConnections']), usage, now)}
+    result = {'opened': [], 'kept': [], 'closed': [], 'failed': {}}
+
+    with _masters_state() as masters:
+        result['closed'] = _reap_masters(masters, set(candidates), settings, now)
+        for path in candidates:
+            if path in masters:
+                masters[path]['lastUsed'] = now
+                result['kept'].append(candidates[path].get('hostName'))
+        to_open = [h for p, h in candidates.items() if p not in masters]
+
+    def warm(host):
+        try:
+            open_master(host)
+            return host.get('hostName'), None
+        except Exception as e:
+            return host.get('hostName'), str(e)
+
+    if to_open:
+        with ThreadPoolExecutor(max_workers=len(to_open)) as pool:
+            for host_name, error in pool.map(warm, to_open):
+                if error is None:
+                    result['opened'].append(host_name)
+                else:
+                    result['failed'][host_name] = error
+    return result
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+远程服务发现。
+
+每台主机只建立一次 SSH 连接，执行一次 `ss -ltn` (没有 ss 时退回 netstat) 列出所有监听中的 TCP 端口，
+多台主机并发执行 (受并发上限约束)。主机有预热的主连接时直接复用，省去握手。
+结果按主机名缓存在状态目录的 discovery.json 中，TTL 内不会重复连接；
+配置中尚未添加的端口由 suggest_services() 整理成可以直接添加的服务。
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import List
+
+from sshtf_config import DEFAULT_SSH_PORT
+from sshtf_core import build_command_args
+from sshtf_state import STATE_DIR
+
+DISCOVERY_CACHE_PATH = STATE_DIR / 'discovery.json'
+DISCOVERY_TIMEOUT = 15        # 单个主机的总超时 (秒，含建立连接)
+DISCOVERY_CONCURRENCY = 32    # 同时运行的 ssh 进程数上限
+DISCOVERY_TTL = 300           # 缓存结果的有效期 (秒)
+
+# 一次往返列出所有监听端口：优先 ss，其次 Linux / BSD (macOS) 的 netstat
+LISTING_COMMAND = "ss -ltn 2>/dev/null || netstat -ltn 2>/dev/null || netstat -an -p tcp 2>/dev/null"
+
+
+def parse_listening_ports(output: str) -> List[dict]:
+    """
+    解析 ss / netstat 的输出，返回 [{'port': 端口, 'addresses': [监听地址, ...]}, ...] (按端口排序)。
+    两者的第 4 列都是本地地址：ss / Linux netstat 为 "地址:端口"，BSD netstat 为 "地址.端口"。
+    """
+    ports = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) < 4 or 'LISTEN' not in fields:
+            continue
+        address, _, port = fields[3].rpartition(':')
+        if not port.isdigit():
+            address, _, port = fields[3].rpartition('.')
+        if not port.isdigit():
+            continue
+        ports.setdefault(int(port), set()).add(address or '*')
+    return [{'port': port, 'addresses': sorted(addresses)} for port, addresses in sorted(ports.items())]
+
+
+def discovery_target(host: dict) -> str:
+    """发现结果对应的连接 (用户@地址:端口 及跳板机)，改变后对应的缓存视为过期"""
+    target = f"{host.get('sshUser')}@{host.get('serverIP')}:{int(host.get('sshPort') or DEFAULT_SSH_PORT)}"
+    return target + (f" via {host['proxyJump']}" if host.get('proxyJump') else "")
+
+
+async def discover_host(host: dict, timeout: float = DISCOVERY_TIMEOUT) -> dict:
+    """
+    列出单个主机上监听中的 TCP 端口。返回
+    {'ok': bool, 'ports': [...], 'error': str|None, 'checkedAt': 时间戳, 'elapsedMs': float, 'target': str}
+    """
+    result = {'ok': False, 'ports': [], 'error': None, 'checkedAt': None, 'elapsedMs': None,
+              'target': discovery_target(host)}
+    started = time.perf_counter()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *build_command_args(host, LISTING_COMMAND, connect_timeout=max(1, int(timeout))),
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        return {**result, 'error': '未找到 ssh', 'checkedAt': time.time()}
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return {**result, 'error': '超时', 'checkedAt': time.time()}
+
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    output = stdout.decode('utf-8', errors='replace')
+    ports = parse_listening_ports(output)
+    if process.returncode == 255:
+        # ssh 自身的错误 (认证失败、无法连接等)，取 stderr 的最后一行
+        lines = stderr.decode('utf-8', errors='replace').strip().splitlines()
+        error = lines[-1] if lines else f"ssh 退出码 {process.returncode}"
+        return {**result, 'error': error, 'checkedAt': time.time(), 'elapsedMs': elapsed_ms}
+    if not ports and not output.strip():
+        return {**result, 'error': '远程主机上没有可用的 ss / netstat', 'checkedAt': time.time(), 'elapsedMs': elapsed_ms}
+    return {**result, 'ok': True, 'ports': ports, 'checkedAt': time.time(), 'elapsedMs': elapsed_ms}
+
+
+async def discover_hosts(hosts: list, timeout: float = DISCOVERY_TIMEOUT,
+                         concurrency: int = DISCOVERY_CONCURRENCY) -> dict:
+    """并发发现多个主机，返回 {主机名: 结果}"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def discover(host):
+        async with semaphore:
+            return host.get('hostName'), await discover_host(host, timeout)
+
+    return dict(await asyncio.gather(*(discover(h) for h in hosts)))
+
+
+# --- TTL 缓存 ---
+
+def load_discovery_cache() -> dict:
+    try:
+        return json.loads(DISCOVERY_CACHE_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_discovery_cache(cache: dict):
+    try:
+        DISCOVERY_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = DISCOVERY_CACHE_PATH.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(cache), encoding='utf-8')
+        os.replace(tmp_path, DISCOVERY_CACHE_PATH)
+    except OSError:
+        pass  # 缓存只是加速手段，写入失败不影响结果
+
+
+async def discover_hosts_cached(hosts: list, ttl: float = DISCOVERY_TTL, refresh: bool = False,
+                                timeout: float = DISCOVERY_TIMEOUT,
+                                concurrency: int = DISCOVERY_CONCURRENCY) -> dict:
+    """
+    返回这些主机的发现结果：TTL 内成功的缓存直接使用，过期、缺失或上次失败的主机并发重新发现。
+    refresh 为 True 时忽略缓存；主机的连接参数改变后对应的缓存也视为过期。
+    """
+    cache = load_discovery_cache()
+    now = time.time()
+
+    def is_stale(host):
+        cached = cache.get(host.get('hostName'))
+        if refresh or not cached or not cached.get('ok') or now - (cached.get('checkedAt') or 0) >= ttl:
+            return True
+        return cached.get('target') != discovery_target(host)
+
+    stale = [h for h in hosts if is_stale(h)]
+    if stale:
+        cache.update(await discover_hosts(stale, timeout, concurrency))
+        _save_discovery_cache(cache)
+    return {h.get('hostName'): cache[h.get('hostName')] for h in hosts if h.get('hostName') in cache}
+
+
+def discover_hosts_sync(hosts: list, **kwargs) -> dict:
+    """供同步的命令行脚本调用的 discover_hosts_cached()"""
+    return asyncio.run(discover_hosts_cached(hosts, **kwargs))
+
+
+# --- 建议的服务 ---
+
+def _service_name(port: int, taken: set) -> str:
+    try:
+        name = socket.getservbyport(port, 'tcp')
+    except OSError:
+        name = f"port-{port}"
+    if name in taken:
+        name = f"{name}-{port}"
+    return name
+
+
+def suggest_services(host: dict, result: dict) -> List[dict]:
+    """
+    把发现结果中尚未配置的端口整理成服务 (格式同 config.json 中的 service，localPort 为 0 表示保存时自动分配)。
+    已配置为该主机某个服务的远程端口和主机自身的 SSH 端口不会出现。
+    每项另有 'addresses' (远程监听地址)，保存前应去掉。
+    """
+    if not result or not result.get('ok'):
+        return []
+    services = host.get('services', [])
+    configured = {s.get('remotePort') for s in services}
+    taken = {s.get('serviceName') for s in services}
+    ssh_port = int(host.get('sshPort') or DEFAULT_SSH_PORT)
+
+    suggestions = []
+    for entry in result['ports']:
+        port = entry['port']
+        if port in configured or port == ssh_port:
+            continue
+        name = _service_name(port, taken)
+        taken.add(name)
+        suggestions.append({
+            'serviceName': name, 'remotePort': port, 'localPort': 0,
+            'autoOpenUrl': False, 'urlTemplate': "", 'addresses': entry['addresses'],
+        })
+    return suggestions
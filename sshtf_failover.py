@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+多主机故障转移。
+
+同一个服务部署在多台主机上时，在 config.json 的 failover 中定义一次 (候选主机、远程端口和固定的本地端口)：
+1. 启动时并发探测所有候选主机的 SSH 端口 (见 sshtf_probe)，转发到延迟最低的可达主机，启动失败时依次尝试下一台；
+2. 之后定期检查隧道，隧道断开 (主机宕机、网络中断、ServerAlive 超时) 后重新探测，
+   在同一个本地端口上切换到其他候选主机，客户端只需重新连接同一个端口；
+3. 每次切换写入 switch 事件 (events.jsonl)，当前主机和最近的切换记录保存在状态目录的 failover.json。
+手动关闭 (有 stop 事件) 的隧道不会被切换，直到重新运行 ssh.py --failover。
+"""
+
+import json
+import time
+from typing import Callable, List
+
+from sshtf_core import scan_tunnels, find_tunnels, start_forwards, write_state_file
+from sshtf_log import log_event, read_events
+from sshtf_probe import probe_hosts_sync
+from sshtf_state import STATE_DIR
+
+FAILOVER_STATE_PATH = STATE_DIR / 'failover.json'
+FAILOVER_POLL_INTERVAL = 5.0  # 检查隧道是否断开的间隔 (秒)
+FAILOVER_HISTORY = 20         # 每个服务保留的切换记录条数
+STOP_GRACE = 1.0              # 发现隧道断开后等待 stop 事件的时间 (秒)：手动关闭时 stop 事件在进程退出之后才写入
+
+
+def failover_services(config: dict, names: List[str] = None) -> List[dict]:
+    """配置中的故障转移服务，可按服务名筛选"""
+    return [s for s in config.get('failover', []) if not names or s.get('serviceName') in names]
+
+
+def load_failover_state() -> dict:
+    """{服务名: {'hostName', 'pid', 'latencyMs', 'since', 'switches': [...]}}"""
+    try:
+        return json.loads(FAILOVER_STATE_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def rank_candidates(config: dict, service: dict) -> List[dict]:
+    """
+    并发探测服务的候选主机 (忽略探测缓存)，返回 [{'hostName', 'ok', 'latencyMs', 'error'}, ...]：
+    可达的按延迟从低到高排在前面，延迟相同时按配置顺序；不可达的按配置顺序排在后面。
+    """
+    hosts = {h.get('hostName'): h for h in config.get('hosts', [])}
+    candidates = [hosts[name] for name in service.get('hosts', []) if name in hosts]
+    results = probe_hosts_sync(candidates, refresh=True) if candidates else {}
+    ranked = []
+    for order, name in enumerate(service.get('hosts', [])):
+        result = results.get(name) or {'ok': False, 'latencyMs': None, 'error': '配置中不存在该主机'}
+        ranked.append((not result['ok'], result['latencyMs'] or 0, order,
+                       {'hostName': name, 'ok': result['ok'], 'latencyMs': result['latencyMs'],
+                        'error': result['error']}))
+    return [entry for *_, entry in sorted(ranked, key=lambda r: r[:3])]
+
+
+def _active_host(config: dict, service: dict, tunnels: List[dict]):
+    """在 localPort 上转发某台候选主机 remotePort 的隧道 (本工具启动的)，返回 (主机名, PID)，没有时返回 (None, None)"""
+    forward = (int(service['localPort']), int(service['remotePort']))
+    for tunnel in find_tunnels(config, tunnels=tunnels):
+        if tunnel['hostName'] in service.get('hosts', []) and forward in tunnel['forwards']:
+            return tunnel['hostName'], tunnel['pid']
+    return None, None
+
+
+def start_failover(config: dict, service: dict, exclude: List[str] = (), tunnels: List[dict] = None) -> dict:
+    """
+    把服务转发到延迟最低的可达候选主机，启动失败时依次尝试下一台；exclude 中的主机 (刚刚断开的) 只作为最后的选择。
+    已有隧道在 localPort 上转发某台候选主机时直接沿用。本地端口固定为服务的 localPort，被其他程序占用时启动失败。
+    返回 {'serviceName', 'hostName', 'localPort', 'pid', 'status': 'started'|'running'|'failed',
+    'latencyMs', 'error', 'tried': [{'hostName', 'error'}, ...]}
+    """
+    if tunnels is None:
+        tunnels = scan_tunnels()
+    result = {'serviceName': service['serviceName'], 'hostName': None, 'localPort': int(service['localPort']),
+              'pid': None, 'status': 'failed', 'latencyMs': None, 'error': None, 'tried': []}
+    host_name, pid = _active_host(config, service, tunnels)
+    if host_name:
+        return {**result, 'hostName': host_name, 'pid': pid, 'status': 'running'}
+
+    ranked = rank_candidates(config, service)
+    ranked = [c for c in ranked if c['hostName'] not in exclude] + [c for c in ranked if c['hostName'] in exclude]
+    for candidate in ranked:
+        if not candidate['ok']:
+            result['tried'].append({'hostName': candidate['hostName'], 'error': candidate['error'] or '不可达'})
+            continue
+        wanted = {'hostName': candidate['hostName'], 'serviceName': service['serviceName'],
+                  'remotePort': int(service['remotePort']), 'localPort': int(service['localPort'])}
+        # running=[]：同一主机上转发相同远程端口的其他隧道不算数，这里要的是固定的本地端口
+        started = start_forwards(config, [wanted], busy_ports=set(), running=[])[0]
+        if started['status'] == 'started':
+            return {**result, 'hostName': candidate['hostName'], 'pid': started['pid'], 'status': 'started',
+                    'latencyMs': candidate['latencyMs'], 'tried': result['tried']}
+        result['tried'].append({'hostName': candidate['hostName'], 'error': started['error']})
+    result['error'] = "没有可用的候选主机" if result['tried'] else "没有配置候选主机"
+    return result
+
+
+def _record_active(state: dict, result: dict, reason: str = None):
+    """把 start_failover() 的结果写入状态；主机改变且给出 reason 时记录一次切换并写入 switch 事件"""
+    name = result['serviceName']
+    previous = state.get(name) or {}
+    entry = {**previous, 'hostName': result['hostName'], 'pid': result['pid'], 'latencyMs': result['latencyMs']}
+    if result['hostName'] != previous.get('hostName') or result['pid'] != previous.get('pid'):
+        entry['since'] = time.time()
+    if reason and previous.get('hostName') and result['hostName'] != previous['hostName']:
+        switch = {'ts': entry['since'], 'fromHost': previous['hostName'], 'toHost': result['hostName'],
+                  'latencyMs': result['latencyMs'], 'reason': reason}
+        entry['switches'] = (previous.get('switches', []) + [switch])[-FAILOVER_HISTORY:]
+        log_event('switch', pid=result['pid'], serviceName=name, localPort=result['localPort'],
+                  fromHost=previous['hostName'], toHost=result['hostName'], latencyMs=result['latencyMs'],
+                  reason=reason)
+    state[name] = entry
+
+
+def _stopped_manually(pid: int, since: float) -> bool:
+    return any(e['event'] == 'stop' and e.get('ts', 0) >= (since or 0) for e in read_events(50, pid=pid))
+
+
+def watch_failover(config: dict, names: List[str] = None, interval: float = FAILOVER_POLL_INTERVAL,
+                   notify: Callable[[str], None] = print, rounds: int = None):
+    """
+    启动故障转移服务并持续检查 (rounds 为空时一直运行，直到被中断)：
+    隧道断开后在同一个本地端口上切换到其他候选主机；所有候选主机都不可用时，之后每一轮继续重试。
+    """
+    services = failover_services(config, names)
+    if not services:
+        notify("没有配置多主机故障转移 (failover) 的服务。")
+        return
+    state = load_failover_state()
+    stopped = set()  # 被手动关闭的服务，本次运行中不再切换
+    pending = {s['serviceName']: None for s in services}  # 需要 (重新) 启动的服务 -> 切换原因
+    errors = {}  # 服务名 -> 上一次的失败信息 (相同的失败只提示一次)
+    round_ = 0
+    while True:
+        tunnels = scan_tunnels()
+        for service in services:
+            name = service['serviceName']
+            if name in stopped:
+                continue
+            current = state.get(name) or {}
+            host_name, _ = _active_host(config, service, tunnels)
+            if name not in pending:
+                if host_name:
+                    continue
+                if current.get('pid'):
+                    time.sleep(STOP_GRACE)
+                if current.get('pid') and _stopped_manually(current['pid'], current.get('since')):
+                    stopped.add(name)
+                    notify(f"ℹ️ {name}: 隧道已被手动关闭，不再切换")
+                    continue
+                notify(f"⚠️ {name}: {current.get('hostName')} 上的隧道已断开，正在切换...")
+                pending[name] = 'exit'
+
+            reason = pending[name]
+            exclude = [current['hostName']] if reason and current.get('hostName') else []
+            result = start_failover(config, service, exclude, tunnels)
+            if result['status'] == 'failed':
+                details = "; ".join(f"{t['hostName']}: {t['error']}" for t in result['tried'])
+                message = f"❌ {name}: {result['error']}" + (f" ({details})" if details else "")
+                if errors.get(name) != message:
+                    notify(message + "，稍后重试")
+                errors[name] = message
+                continue
+            del pending[name]
+            errors.pop(name, None)
+            _record_active(state, result, reason)
+            latency = f"，延迟 {result['latencyMs']:.0f}ms" if result['latencyMs'] is not None else ""
+            if result['status'] == 'running':
+                notify(f"ℹ️ {name}: 沿用 {result['hostName']} 上的隧道 localhost:{result['localPort']} (PID: {result['pid']})")
+            elif reason and current.get('hostName') and current['hostName'] != result['hostName']:
+                notify(f"🔀 {name}: 已从 {current['hostName']} 切换到 {result['hostName']}{latency} "
+                       f"localhost:{result['localPort']} (PID: {result['pid']})")
+            else:
+                notify(f"🚀 {name}: 已转发到 {result['hostName']}{latency} "
+                       f"localhost:{result['localPort']} (PID: {result['pid']})")
+        write_state_file(FAILOVER_STATE_PATH, state)
+
+        round_ += 1
+        if rounds is not None and round_ >= rounds:
+            return
+        time.sleep(interval)
+
+
+def failover_status(config: dict, tunnels: List[dict] = None) -> List[dict]:
+    """
+    每个故障转移服务的当前状态：[{'serviceName', 'localPort', 'remotePort', 'hosts', 'hostName' (当前转发的主机，
+    隧道未运行时为 None), 'pid', 'latencyMs', 'since', 'switches': [最近的切换记录]}, ...]
+    """
+    if tunnels is None:
+        tunnels = scan_tunnels()
+    state = load_failover_state()
+    status = []
+    for service in failover_services(config):
+        entry = state.get(service['serviceName']) or {}
+        host_name, pid = _active_host(config, service, tunnels)
+        status.append({
+            'serviceName': service['serviceName'], 'localPort': service['localPort'],
+            'remotePort': service['remotePort'], 'hosts': service.get('hosts', []),
+            'hostName': host_name, 'pid': pid,
+            'latencyMs': entry.get('latencyMs') if host_name == entry.get('hostName') else None,
+            'since': entry.get('since') if host_name == entry.get('hostName') else None,
+            'switches': entry.get('switches', []),
+        })
+    return status
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+隧道的 stderr 捕获与生命周期事件日志。
+
+- 每个由本工具启动的 ssh 进程的 stderr 以追加方式写入状态目录下 tunnels/<id>.log。扫描隧道时超过
+  STDERR_LOG_MAX_BYTES 的文件只保留最后 STDERR_KEEP_BYTES (相当于一个按字节计的环形缓冲区)，之后的输出继续追加。
+  同目录的 <id>.json 记录该隧道的 PID、主机、转发等信息。
+- 生命周期事件 (spawn / ready / failure / exit / stop / reap / switch) 以 JSON Lines 写入 events.jsonl。
+  命令行、Rofi 和 Web 服务可能同时写入：每条事件以 O_APPEND 一次写入，超过大小上限后在锁文件的保护下轮转，
+  轮转时仍在写入的进程写到的是改名后的文件，不会丢失事件。
+"""
+
+import json
+import os
+import secrets
+import time
+from typing import List, Optional
+
+from sshtf_state import STATE_DIR, exclusive_lock
+
+TUNNEL_LOG_DIR = STATE_DIR / 'tunnels'
+EVENTS_PATH = STATE_DIR / 'events.jsonl'
+EVENTS_LOCK_PATH = STATE_DIR / 'events.lock'
+EVENTS_MAX_BYTES = 1024 * 1024  # 单个事件日志文件的上限，超过后轮转
+EVENTS_BACKUP_COUNT = 3         # 保留的历史事件日志数量
+STDERR_LOG_MAX_BYTES = 64 * 1024
+STDERR_KEEP_BYTES = 16 * 1024
+STDERR_TAIL_LINES = 5           # 事件和错误提示中附带的 stderr 行数
+
+
+def _rotate_events():
+    """events.jsonl -> .1 -> .2 ...，只保留 EVENTS_BACKUP_COUNT 份。在锁内重新检查大小，避免多个进程重复轮转"""
+    with open(EVENTS_LOCK_PATH, 'a+b') as lock, exclusive_lock(lock):
+        try:
+            if EVENTS_PATH.stat().st_size <= EVENTS_MAX_BYTES:
+                return  # 其他进程已经轮转过
+        except FileNotFoundError:
+            return
+        for i in range(EVENTS_BACKUP_COUNT - 1, 0, -1):
+            source = EVENTS_PATH.with_name(f"{EVENTS_PATH.name}.{i}")
+            if source.exists():
+                os.replace(source, EVENTS_PATH.with_name(f"{EVENTS_PATH.name}.{i + 1}"))
+        os.replace(EVENTS_PATH, EVENTS_PATH.with_name(f"{EVENTS_PATH.name}.1"))
+
+
+def log_event(event: str, **fields):
+    """写入一条生命周期事件 (一行 JSON)。日志只是辅助信息，写入失败时静默忽略。"""
+    record = {'ts': round(time.time(), 3), 'event': event, **fields}
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+    try:
+        STATE_DIR.mkdir(parents=True, exist_ok=True)
+        fd = os.open(EVENTS_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)  # O_APPEND：整行一次写入，多个进程同时写入也不会互相覆盖
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > EVENTS_MAX_BYTES:
+            _rotate_events()
+    except OSError:
+        pass  # 例如 Windows 上其他进程正打开着日志文件时无法改名，下一次写入时再轮转
+
+
+def read_events(limit: int = 100, pid: int = None) -> List[dict]:
+    """读取最近的事件 (按时间从旧到新)，可按 PID 筛选；只读当前文件和最近一个轮转文件"""
+    events = []
+    for path in (EVENTS_PATH.with_name(EVENTS_PATH.name + '.1'), EVENTS_PATH):
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if pid is None or event.get('pid') == pid:
+                        events.append(event)
+        except OSError:
+            continue
+    return events[-limit:]
+
+
+# --- 每个隧道的 stderr ---
+
+def new_tunnel_log():
+    """为即将启动的隧道创建 stderr 文件，返回 (隧道 ID, 以追加方式打开的文件对象)"""
+    TUNNEL_LOG_DIR.mkdir(parents=True, exist_ok=True)
+    tunnel_id = f"{int(time.time())}-{secrets.token_hex(3)}"
+    return tunnel_id, open(TUNNEL_LOG_DIR / f"{tunnel_id}.log", 'ab')
+
+
+def register_tunnel(tunnel_id: str, info: dict):
+    path = TUNNEL_LOG_DIR / f"{tunnel_id}.json"
+    path.write_text(json.dumps({'id': tunnel_id, **info}), encoding='utf-8')
+
+
+def registered_tunnels() -> List[dict]:
+    """所有已登记 (尚未确认退出) 的隧道信息"""
+    tunnels = []
+    for path in TUNNEL_LOG_DIR.glob('*.json'):
+        try:
+            tunnels.append(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue
+    return tunnels
+
+
+def find_registered_tunnel(pid: int) -> Optional[dict]:
+    return next((t for t in registered_tunnels() if t.get('pid') == pid), None)
+
+
+def unregister_tunnel(tunnel_id: str):
+    for suffix in ('.json', '.log'):
+        try:
+            os.unlink(TUNNEL_LOG_DIR / f"{tunnel_id}{suffix}")
+        except OSError:
+            pass
+
+
+def read_stderr(tunnel_id: str, lines: int = STDERR_TAIL_LINES) -> List[str]:
+    """读取隧道 stderr 的最后几行"""
+    try:
+        with open(TUNNEL_LOG_DIR / f"{tunnel_id}.log", 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - STDERR_KEEP_BYTES))
+            data = f.read()
+    except OSError:
+        return []
+    text = data.decode('utf-8', errors='replace')
+    return [line.rstrip('\r') for line in text.splitlines() if line.strip()][-lines:]
+
+
+def trim_stderr(tunnel_id: str):
+    """
+    stderr 超过上限时只保留最后 STDERR_KEEP_BYTES 字节。
+    ssh 以追加方式写入 (O_APPEND)，截断后它的下一次写入会接在新的末尾。
+    """
+    path = TUNNEL_LOG_DIR / f"{tunnel_id}.log"
+    try:
+        if path.stat().st_size <= STDERR_LOG_MAX_BYTES:
+            return
+        with open(path, 'r+b') as f:
+            f.seek(-STDERR_KEEP_BYTES, os.SEEK_END)
+            tail = f.read()
+            f.seek(0)
+            f.write(tail)
+            f.truncate()
+    except OSError:
+        pass
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+config.json 的 Pydantic 模型。
+
+只依赖 pydantic：Web UI (sshtf_web.py) 和 main.py 的 validate 子命令共用，
+后者不需要加载 FastAPI。
+"""
+
+from typing import List, Optional, Dict, Any, Literal
+
+from pydantic import BaseModel
+
+
+class Service(BaseModel):
+    serviceName: str
+    remotePort: int
+    localPort: int = 0  # 0 表示保存时从主机的本地端口范围中自动分配
+    autoOpenUrl: bool
+    urlTemplate: str
+    loginInfo: Optional[Dict[str, Any]] = None
+    idleTimeout: Optional[int] = None  # 没有客户端连接超过这么多秒后自动关闭隧道，为空时不自动关闭
+    onDemand: bool = False  # 由 sshtf 监听本地端口，第一个连接到来时才启动隧道 (ssh.py --on-demand)
+
+class PortRange(BaseModel):
+    start: int
+    end: int  # 包含
+
+class Transport(BaseModel):
+    # SSH 传输参数，启动隧道时以 -c / -m / -C 传给 ssh；可由 main.py bench-transport 测出后保存
+    cipher: Optional[str] = None
+    mac: Optional[str] = None
+    compression: bool = False
+
+class Host(BaseModel):
+    hostName: str
+    serverIP: str
+    sshUser: str
+    sshPort: int = 22
+    proxyJump: Optional[str] = None  # 跳板机，写法同 ssh -J，多级跳板按连接顺序用逗号分隔
+    identityFile: Optional[str] = None
+    transport: Optional[Transport] = None  # 为空时使用 ssh 的默认设置
+    localPortRange: Optional[PortRange] = None  # 自动分配本地端口的范围，为空时使用 DEFAULT_LOCAL_PORT_RANGE
+    services: List[Service] = []
+
+class GroupMember(BaseModel):
+    hostName: str
+    serviceName: str
+
+class TunnelGroup(BaseModel):
+    groupName: str
+    members: List[GroupMember] = []  # 同一主机上的成员启动时共用一个 ssh 连接
+
+class FailoverService(BaseModel):
+    # 部署在多台主机上的同一个服务：转发到延迟最低的可达主机，断开后在同一个本地端口上切换 (ssh.py --failover)
+    serviceName: str
+    remotePort: int
+    localPort: int  # 固定的本地端口，切换主机后保持不变
+    hosts: List[str]  # 候选主机名，延迟相同时按此顺序优先
+
+class PrewarmSettings(BaseModel):
+    maxConnections: int = 3  # 最多同时保持的预热主连接数
+    idleTimeout: int = 1800  # 没有转发的主连接空闲多少秒后关闭
+
+class Config(BaseModel):
+    hosts: List[Host]
+    groups: List[TunnelGroup] = []
+    failover: List[FailoverService] = []
+    prewarm: PrewarmSettings = PrewarmSettings()
+    menuOrder: Literal['frecency', 'config'] = 'frecency'  # 命令行 / Rofi 菜单的排序方式
+    version: int = 0  # 每次保存递增，对外作为 ETag
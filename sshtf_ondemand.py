@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+按需启动的隧道。
+
+配置了 onDemand 的服务平时由 sshtf 自己监听其 localPort，并不建立 SSH 连接；第一个客户端连接到来时才启动真正的转发：
+1. 连接被接受后先挂起，启动期间同一端口上到来的其他连接也一起挂起 (每个端口同时只会启动一个隧道)；
+2. 支持 ControlMaster 时先建立主连接 (握手期间端口仍由 sshtf 监听)，再让出端口并在主连接上添加转发，
+   让出端口到 ssh 开始监听之间只有几毫秒；不支持时让出端口后直接启动 ssh，这段时间内的新连接会被拒绝；
+3. 转发就绪后把挂起的连接逐个接到隧道上。之后的新连接直接由 ssh 处理，不再经过 sshtf。
+隧道关闭 (空闲回收、手动关闭) 后端口空出，sshtf 会重新监听，等待下一次连接。
+配合服务的 idleTimeout 使用时，服务随时可用，平时却不占用 ssh 进程和服务器会话。
+"""
+
+import asyncio
+from typing import Callable, List, Tuple
+
+from sshtf_core import (start_forwards, load_reaped, revive_reaped, reap_idle_tunnels,
+                        prewarm_supported, open_master)
+
+ONDEMAND_BIND_ADDRESS = '127.0.0.1'  # 与 ssh -L 默认的监听地址一致
+ONDEMAND_POLL_INTERVAL = 5.0         # 检查端口是否空出、采样空闲隧道的间隔 (秒)
+UPSTREAM_CONNECT_RETRIES = 50        # 隧道启动后连接其本地端口的重试次数 (每次间隔 0.1 秒)
+SPLICE_BUFFER_SIZE = 65536
+
+
+def on_demand_services(config: dict, host_names: List[str] = None) -> List[Tuple[dict, dict]]:
+    """配置了 onDemand 的服务 [(host, service), ...]，可按主机名筛选"""
+    return [
+        (host, service)
+        for host in config.get('hosts', [])
+        if not host_names or host.get('hostName') in host_names
+        for service in host.get('services', [])
+        if service.get('onDemand') and service.get('localPort')
+    ]
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while data := await reader.read(SPLICE_BUFFER_SIZE):
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()  # 半关闭，另一个方向仍可继续传输
+    except (ConnectionError, OSError):
+        writer.close()
+
+
+async def splice(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, port: int) -> bool:
+    """把挂起的客户端连接接到本地端口 port 上的隧道，直到两个方向都结束。连接不上时关闭客户端连接并返回 False"""
+    for _ in range(UPSTREAM_CONNECT_RETRIES):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(ONDEMAND_BIND_ADDRESS, port)
+            break
+        except OSError:
+            await asyncio.sleep(0.1)  # ssh 报告就绪前超时 (握手较慢) 时，端口可能还没开始监听
+    else:
+        writer.close()
+        return False
+    try:
+        await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+    finally:
+        writer.close()
+        upstream_writer.close()
+    return True
+
+
+class OnDemandPort:
+    """一个按需启动的服务：端口空闲时由 sshtf 监听，第一个连接到来时启动隧道并让出端口"""
+
+    def __init__(self, config: dict, host: dict, service: dict, notify: Callable[[str], None] = print):
+        self.config = config
+        self.host = host
+        self.service = service
+        self.port = int(service['localPort'])
+        self.notify = notify
+        self.server = None
+        self.activation = None  # 启动隧道期间为 Future，结果为隧道的本地端口 (失败时为 None)
+        self._tasks = set()
+
+    @property
+    def name(self) -> str:
+        return f"{self.host.get('hostName')}/{self.service.get('serviceName')}"
+
+    @property
+    def listening(self) -> bool:
+        return self.server is not None
+
+    async def listen(self) -> bool:
+        """端口空闲时开始监听，返回是否由 sshtf 监听 (隧道仍在运行、端口被占用时为 False)"""
+        if self.server is not None:
+            return True
+        if self.activation is not None:
+            return False
+        try:
+            self.server = await asyncio.start_server(self._accept, ONDEMAND_BIND_ADDRESS, self.port)
+        except OSError:
+            return False
+        return True
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.activation is None:
+            self.activation = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(self._activate())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        port = await asyncio.shield(self.activation)
+        if port is None:
+            writer.close()
+            return
+        await splice(reader, writer, port)
+
+    async def _activate(self):
+        port = None
+        try:
+            if prewarm_supported():
+                try:
+                    # 握手期间仍然监听端口，新连接继续挂起
+                    await asyncio.to_thread(open_master, self.host)
+                except Exception:
+                    pass  # 建立不了主连接时退回普通的 ssh 进程
+            # 让出端口给 ssh。已接受的连接不受影响
+            self.server.close()
+            self.server = None
+            result = (await asyncio.to_thread(self._start_tunnel))[0]
+            if result['status'] in ('started', 'running'):
+                port = result['localPort']
+                self.notify(f"🚀 {self.name}: 已按需启动隧道 localhost:{port} (PID: {result['pid']})")
+            else:
+                self.notify(f"❌ {self.name}: 启动隧道失败: {result['error']}")
+        except Exception as e:
+            self.notify(f"❌ {self.name}: 启动隧道失败: {e}")
+        finally:
+            self.activation.set_result(port)
+            self.activation = None
+
+    def _start_tunnel(self) -> List[dict]:
+        # 端口刚才还由 sshtf 监听，不可能已有隧道在转发它：running=[]，不扫描进程表，第一个连接不必多等
+        host_name, service_name = self.host.get('hostName'), self.service.get('serviceName')
+        if any(e['hostName'] == host_name and e['serviceName'] == service_name for e in load_reaped()):
+            # 之前因空闲被关闭：重新打开并清除标记
+            return revive_reaped(self.config, host_name, service_name, busy_ports=set(), running=[])
+        wanted = {'hostName': host_name, 'serviceName': service_name,
+                  'remotePort': int(self.service['remotePort']), 'localPort': self.port}
+        return start_forwards(self.config, [wanted], busy_ports=set(), running=[], record=True)
+
+
+async def serve_on_demand(config: dict, host_names: List[str] = None, interval: float = ONDEMAND_POLL_INTERVAL,
+                          reap: bool = True, notify: Callable[[str], None] = print):
+    """
+    为所有按需启动的服务监听本地端口，一直运行直到被取消。
+    每隔 interval 秒重新监听已经空出的端口；reap 为 True 时同时采样一次空闲隧道 (见 reap_idle_tunnels())。
+    """
+    ports = [OnDemandPort(config, host, service, notify) for host, service in on_demand_services(config, host_names)]
+    if not ports:
+        notify("没有配置为按需启动 (onDemand) 的服务。")
+        return
+    while True:
+        for port in ports:
+            was_listening = port.listening
+            if await port.listen() and not was_listening:
+                notify(f"👂 {port.name}: 等待连接 localhost:{port.port}")
+        await asyncio.sleep(interval)
+        if reap:
+            for r in await asyncio.to_thread(reap_idle_tunnels, config):
+                notify(f"💤 {r['hostName']}/{r['serviceName']}: 空闲 {r['idleSeconds']} 秒，已关闭隧道")
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+主机可达性 / 延迟探测。
+
+用 asyncio 同时向所有主机的 SSH 端口发起 TCP 连接 (受并发上限约束)，
+因此探测全部主机的耗时约等于一次超时时间，而不是主机数 × 超时。
+结果按主机名缓存在状态目录的 probe.json 中，TTL 内不会重复探测。
+菜单只读取缓存 (probe_hosts_nowait())，过期的主机在后台重新探测，不会因为不可达的主机阻塞界面。
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from sshtf_config import DEFAULT_SSH_PORT
+from sshtf_core import parse_jump_chain
+from sshtf_state import STATE_DIR
+
+PROBE_CACHE_PATH = STATE_DIR / 'probe.json'
+PROBE_TIMEOUT = 1.5       # 单个主机的连接超时 (秒)
+PROBE_CONCURRENCY = 256   # 同时进行的连接数上限 (避免耗尽文件描述符)
+PROBE_TTL = 60            # 缓存结果的有效期 (秒)
+
+
+def probe_target(host: dict):
+    """
+    实际要探测的 (地址, 端口)。配置了 proxyJump 的主机通常无法直连，
+    此时探测第一个跳板机 ([user@]host[:port])。
+    """
+    hops = parse_jump_chain(host.get('proxyJump'))
+    if hops:
+        return hops[0]['serverIP'], hops[0]['sshPort']
+    return host.get('serverIP'), int(host.get('sshPort') or DEFAULT_SSH_PORT)
+
+
+async def probe_host(host: dict, timeout: float = PROBE_TIMEOUT) -> dict:
+    """
+    探测单个主机。返回
+    {'ok': bool, 'latencyMs': float|None, 'error': str|None, 'checkedAt': 时间戳, 'target': "地址:端口", 'via': 跳板机|None}
+    """
+    address, port = probe_target(host)
+    result = {'ok': False, 'latencyMs': None, 'error': None, 'checkedAt': None,
+              'target': f"{address}:{port}", 'via': address if host.get('proxyJump') else None}
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except asyncio.TimeoutError:
+        return {**result, 'error': '超时', 'checkedAt': time.time()}
+    except ConnectionRefusedError:
+        return {**result, 'error': '拒绝连接', 'checkedAt': time.time()}
+    except socket.gaierror:
+        return {**result, 'error': '无法解析', 'checkedAt': time.time()}
+    except OSError as e:
+        return {**result, 'error': e.strerror or '不可达', 'checkedAt': time.time()}
+
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return {**result, 'ok': True, 'latencyMs': latency_ms, 'checkedAt': time.time()}
+
+
+async def probe_hosts(hosts: list, timeout: float = PROBE_TIMEOUT, concurrency: int = PROBE_CONCURRENCY) -> dict:
+    """并发探测多个主机，返回 {主机名: 探测结果}"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe(host):
+        async with semaphore:
+            return host.get('hostName'), await probe_host(host, timeout)
+
+    return dict(await asyncio.gather(*(probe(h) for h in hosts)))
+
+
+# --- TTL 缓存 ---
+
+def load_probe_cache() -> dict:
+    try:
+        return json.loads(PROBE_CACHE_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_probe_cache(cache: dict):
+    try:
+        PROBE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = PROBE_CACHE_PATH.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(cache), encoding='utf-8')
+        os.replace(tmp_path, PROBE_CACHE_PATH)
+    except OSError:
+        pass  # 缓存只是加速手段，写入失败不影响结果
+
+
+async def probe_hosts_cached(hosts: list, ttl: float = PROBE_TTL, refresh: bool = False,
+                             timeout: float = PROBE_TIMEOUT, concurrency: int = PROBE_CONCURRENCY) -> dict:
+    """
+    返回所有主机的探测结果：TTL 内的缓存直接使用，过期或缺失的主机并发重新探测。
+    refresh 为 True 时忽略缓存；主机地址改变后对应的缓存也视为过期。
+    """
+    cache = load_probe_cache()
+    names = {h.get('hostName') for h in hosts}
+    stale = hosts if refresh else _stale_hosts(hosts, cache, ttl)
+    if stale:
+        cache.update(await probe_hosts(stale, timeout, concurrency))
+        _save_probe_cache(cache)
+    return {name: cache[name] for name in names if name in cache}
+
+
+def _cached_target_matches(host: dict, cached: dict) -> bool:
+    address, port = probe_target(host)
+    return cached.get('target') == f"{address}:{port}"
+
+
+def _stale_hosts(hosts: list, cache: dict, ttl: float = PROBE_TTL) -> list:
+    """缓存缺失、过期或地址已改变的主机"""
+    now = time.time()
+    stale = []
+    for host in hosts:
+        cached = cache.get(host.get('hostName'))
+        if not cached or now - (cached.get('checkedAt') or 0) >= ttl or not _cached_target_matches(host, cached):
+            stale.append(host)
+    return stale
+
+
+def probe_hosts_sync(hosts: list, **kwargs) -> dict:
+    """供同步的命令行脚本调用的 probe_hosts_cached()"""
+    return asyncio.run(probe_hosts_cached(hosts, **kwargs))
+
+
+# --- 不阻塞的读取 (菜单使用) ---
+
+_refresh_thread = None
+
+
+def probe_hosts_nowait(hosts: list, ttl: float = PROBE_TTL, detach: bool = False) -> dict:
+    """
+    立即返回缓存中的探测结果 (过期的结果照常返回，没有缓存的主机不出现，显示为 "未探测")，
+    同时在后台重新探测过期的主机，下次读取时生效。
+    detach 为 True 时在独立的进程中探测 (调用方马上退出时使用，如 Rofi 的列表命令)，否则使用后台线程。
+    """
+    global _refresh_thread
+    cache = load_probe_cache()
+    results = {
+        h.get('hostName'): cache[h.get('hostName')] for h in hosts
+        if h.get('hostName') in cache and _cached_target_matches(h, cache[h.get('hostName')])
+    }
+    stale = _stale_hosts(hosts, cache, ttl)
+    if not stale:
+        return results
+    if detach:
+        try:
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                       start_new_session=True)
+            process.stdin.write(json.dumps(stale).encode('utf-8'))
+            process.stdin.close()
+        except OSError:
+            pass  # 探测只是辅助信息，启动失败时下次再试
+    elif _refresh_thread is None or not _refresh_thread.is_alive():
+        _refresh_thread = threading.Thread(target=probe_hosts_sync, args=(stale,), kwargs={'ttl': ttl}, daemon=True)
+        _refresh_thread.start()
+    return results
+
+
+def format_badge(result: dict) -> str:
+    """纯文本的状态标记，如 "23ms" / "超时" / "未探测" """
+    if not result:
+        return "未探测"
+    if result['ok']:
+        return f"{result['latencyMs']:.0f}ms"
+    return result['error'] or "不可达"
+
+
+if __name__ == '__main__':
+    # probe_hosts_nowait(detach=True) 启动的后台进程：从标准输入读取要探测的主机，结果写入缓存
+    probe_hosts_sync(json.load(sys.stdin))
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+~/.ssh/config 的解析、导入到 config.json，以及反向导出为 ssh_config 格式。
+
+由 main.py 的 import / export 子命令按需导入。
+"""
+
+import asyncio
+import fnmatch
+import getpass
+import glob
+import heapq
+import os
+import pathlib
+import re
+from typing import List, Tuple
+
+from sshtf_config import CONFIG_PATH, DEFAULT_SSH_PORT, ConfigError, load_config, save_config
+
+# --- SSH Config 导入逻辑 ---
+
+# 与 OpenSSH 的 READCONF_MAX_DEPTH 保持一致，防止 Include 循环
+SSH_CONFIG_MAX_INCLUDE_DEPTH = 16
+# 导入时会同步到主机配置的连接字段 (update 策略下用于比较/覆盖)
+SSH_CONFIG_HOST_FIELDS = ('serverIP', 'sshUser', 'sshPort', 'proxyJump', 'identityFile')
+
+_SSH_CONFIG_LINE_RE = re.compile(r'^\s*([A-Za-z]\w*)(?:\s*=\s*|\s+)(.*?)\s*$')
+_SSH_CONFIG_ARG_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def _split_ssh_config_args(value: str) -> List[str]:
+    """按 ssh_config 的规则切分参数 (支持双引号；未加引号的 # 之后视为注释)"""
+    args = []
+    for m in _SSH_CONFIG_ARG_RE.finditer(value):
+        if m.group(1) is not None:
+            args.append(m.group(1))
+        elif m.group(2).startswith('#'):
+            break
+        else:
+            args.append(m.group(2))
+    return args
+
+
+def _is_literal_host_pattern(pattern: str) -> bool:
+    """不含通配符、也不是否定模式的 Host 模式即为一个具体的主机别名"""
+    return not pattern.startswith('!') and not any(c in pattern for c in '*?')
+
+
+def _host_patterns_match(alias: str, patterns: List[str]) -> bool:
+    """
+    与 ssh 相同的 Host 匹配规则：任一模式命中即匹配，命中否定模式 (!pattern) 则整体不匹配。
+    ssh 在匹配前会把主机名转为小写，这里对别名和模式都转为小写后比较 (模式本身保留原样)。
+    """
+    matched = False
+    alias = alias.lower()
+    for pattern in patterns:
+        negate = pattern.startswith('!')
+        if fnmatch.fnmatchcase(alias, pattern.lstrip('!').lower()):
+            if negate:
+                return False
+            matched = True
+    return matched
+
+
+async def _read_ssh_config_file(path: pathlib.Path, base_dir: pathlib.Path, depth: int,
+                                ancestors: Tuple[str, ...] = ()) -> list:
+    """
+    读取单个 ssh_config 文件，返回按顺序排列的指令列表：
+    ('host', patterns) / ('match', args) / ('include', [子文件指令列表...]) / ('option', key, args)。
+    同一文件中所有 Include 匹配到的文件会被并发读取 (在线程池中)。
+    ancestors 为正在读取的上层文件 (真实路径)，Include 回到其中任何一个时跳过，避免循环。
+    """
+    ancestors += (os.path.realpath(path),)
+    try:
+        content = await asyncio.to_thread(path.read_text, encoding='utf-8', errors='replace')
+    except OSError as e:
+        print(f"⚠️ 无法读取 '{path}': {e}，已跳过。")
+        return []
+
+    items = []
+    includes = []  # (items 中的下标, 要读取的文件列表)
+    for line in content.splitlines():
+        m = _SSH_CONFIG_LINE_RE.match(line)
+        if not m:
+            continue  # 空行、注释或无参数的行
+        key = m.group(1).lower()
+        args = _split_ssh_config_args(m.group(2))
+        if not args:
+            continue
+
+        if key == 'host':
+            items.append(('host', args))  # 保留原始大小写，别名按写法导入为主机名
+        elif key == 'match':
+            items.append(('match', args))
+        elif key == 'include':
+            if depth >= SSH_CONFIG_MAX_INCLUDE_DEPTH:
+                print(f"⚠️ '{path}' 中的 Include 嵌套过深，已忽略: {' '.join(args)}")
+                continue
+            files = []
+            for pattern in args:
+                pattern = os.path.expanduser(pattern)
+                if not os.path.isabs(pattern):
+                    # 与 ssh 一样，相对路径相对于 ssh 配置目录
+                    pattern = str(base_dir / pattern)
+                for p in sorted(glob.glob(pattern)):
+                    if not os.path.isfile(p):
+                        continue
+                    if os.path.realpath(p) in ancestors:
+                        print(f"⚠️ '{path}' 中的 Include 形成循环，已忽略: {p}")
+                        continue
+                    files.append(p)
+            includes.append((len(items), files))
+            items.append(('include', []))
+        else:
+            items.append(('option', key, args))
+
+    tasks = [
+        _read_ssh_config_file(pathlib.Path(p), base_dir, depth + 1, ancestors)
+        for _, files in includes for p in files
+    ]
+    results = iter(await asyncio.gather(*tasks))
+    for index, files in includes:
+        items[index] = ('include', [next(results) for _ in files])
+    return items
+
+
+def _flatten_ssh_config(items: list, conditions: list, blocks: list):
+    """
+    将指令列表展开为按出现顺序排列的配置块 {'conditions': [...], 'options': {...}}。
+    conditions 中每一项是一组 Host 模式 (需全部匹配)，None 表示无法求值的 Match 块 (永不匹配)。
+    Include 内的块继承所在块的条件，Include 结束后恢复原来的块，与 ssh 的行为一致。
+    """
+    block = {'conditions': conditions, 'options': {}}
+    blocks.append(block)
+    for item in items:
+        kind = item[0]
+        if kind == 'host':
+            block = {'conditions': conditions + [item[1]], 'options': {}}
+            blocks.append(block)
+        elif kind == 'match':
+            # 只支持 "Match all"，其余条件依赖运行时信息，导入时无法判断
+            extra = [] if [a.lower() for a in item[1]] == ['all'] else [None]
+            block = {'conditions': conditions + extra, 'options': {}}
+            blocks.append(block)
+        elif kind == 'include':
+            for sub_items in item[1]:
+                _flatten_ssh_config(sub_items, block['conditions'], blocks)
+            block = {'conditions': block['conditions'], 'options': {}}
+            blocks.append(block)
+        else:
+            # ssh 的规则：每个选项第一次出现的值生效
+            block['options'].setdefault(item[1], item[2])
+
+
+def _resolve_ssh_hosts(blocks: list) -> List[dict]:
+    """按 ssh 的 "先匹配者优先" 规则，为每个具体的主机别名计算最终生效的选项"""
+    aliases = {}  # 小写的别名 -> 首次出现时的写法 (保持首次出现顺序)
+    literal_index = {}  # 小写的别名 -> 只可能匹配该别名的块下标
+    generic_blocks = []  # 含通配符或全局生效的块下标，需要对每个别名求值
+    for i, block in enumerate(blocks):
+        conditions = block['conditions']
+        if None in conditions:
+            continue
+        own = conditions[-1] if conditions else None
+        if own:
+            for pattern in own:
+                # 位于不可能匹配的块中的别名 (如嵌在其他 Host 块里的 Include) ssh 也无法使用
+                if _is_literal_host_pattern(pattern) and all(_host_patterns_match(pattern, c) for c in conditions):
+                    aliases.setdefault(pattern.lower(), pattern)
+        if not block['options']:
+            continue
+        if own and all(_is_literal_host_pattern(p) for p in own):
+            for pattern in own:
+                literal_index.setdefault(pattern.lower(), []).append(i)
+        else:
+            generic_blocks.append(i)
+
+    try:
+        default_user = getpass.getuser()
+    except (KeyError, OSError):
+        default_user = ''  # 容器等环境中没有登录名，也没有设置 USER
+    hosts = []
+    for key, alias in aliases.items():
+        options = {}
+        for i in heapq.merge(literal_index.get(key, []), generic_blocks):
+            block = blocks[i]
+            if all(_host_patterns_match(alias, c) for c in block['conditions']):
+                for option, args in block['options'].items():
+                    options.setdefault(option, args)
+
+        # 未配置 HostName 时 ssh 直接连接别名本身
+        server_ip = options.get('hostname', [alias])[0].replace('%h', alias)
+        try:
+            ssh_port = int(options.get('port', [DEFAULT_SSH_PORT])[0])
+        except ValueError:
+            print(f"⚠️ 主机 '{alias}' 的 Port 无效: {options['port'][0]}，已跳过。")
+            continue
+        proxy_jump = options.get('proxyjump', [None])[0]
+        if proxy_jump and (proxy_jump.lower() == 'none' or proxy_jump == alias):
+            # 跳板机自身也会命中 "Host *" 中的 ProxyJump，不能跳转到自己
+            proxy_jump = None
+
+        hosts.append({
+            'hostName': alias,
+            'serverIP': server_ip,
+            'sshUser': options.get('user', [default_user])[0],
+            'sshPort': ssh_port,
+            'proxyJump': proxy_jump,
+            'identityFile': options.get('identityfile', [None])[0],
+            'services': [],
+        })
+    return hosts
+
+
+async def parse_ssh_config(ssh_config_path: pathlib.Path) -> List[dict]:
+    """解析 ssh_config 文件 (递归跟随 Include)，返回其中所有具体主机"""
+    items = await _read_ssh_config_file(ssh_config_path, ssh_config_path.parent, 0)
+    blocks = []
+    _flatten_ssh_config(items, [], blocks)
+    return _resolve_ssh_hosts(blocks)
+
+
+def merge_ssh_hosts(config: dict, parsed_hosts: List[dict], on_conflict: str = 'skip') -> Tuple[int, int, int]:
+    """
+    按主机名合并解析出的主机，返回 (新增, 更新, 跳过) 的数量。
+    on_conflict: 'skip' 跳过已存在的主机；'update' 用 ssh 配置覆盖其连接字段 (保留已有服务)。
+    """
+    host_index = {h.get('hostName'): i for i, h in enumerate(config['hosts'])}
+    added, updated, skipped = 0, 0, 0
+
+    for new_host in parsed_hosts:
+        index = host_index.get(new_host['hostName'])
+        if index is None:
+            host_index[new_host['hostName']] = len(config['hosts'])
+            config['hosts'].append(new_host)
+            added += 1
+            continue
+
+        old_host = config['hosts'][index]
+        defaults = {'sshPort': DEFAULT_SSH_PORT}
+        changes = {
+            field: new_host[field]
+            for field in SSH_CONFIG_HOST_FIELDS
+            if old_host.get(field, defaults.get(field)) != new_host[field]
+        }
+        if on_conflict == 'update' and changes:
+            old_host.update(changes)
+            updated += 1
+        else:
+            skipped += 1
+    return added, updated, skipped
+
+
+def import_ssh_config(ssh_config_path_str: str, on_conflict: str = 'skip',
+                      config_path: pathlib.Path = CONFIG_PATH) -> bool:
+    """
+    从 .ssh/config 文件解析主机信息并导入到 config.json，返回是否成功。
+    on_conflict: 'skip' 跳过已存在的主机；'update' 用 ssh 配置覆盖其连接字段 (保留已有服务)。
+    """
+    ssh_config_path = pathlib.Path(ssh_config_path_str).expanduser()
+    if not ssh_config_path.is_file():
+        print(f"❌ 错误: 路径 '{ssh_config_path_str}' 不是一个有效文件。")
+        return False
+
+    print(f"ℹ️ 正在从 '{ssh_config_path_str}' 读取 SSH 配置...")
+
+    try:
+        parsed_hosts = asyncio.run(parse_ssh_config(ssh_config_path))
+    except Exception as e:
+        print(f"❌ 解析 SSH 配置文件时出错: {e}")
+        return False
+
+    if not parsed_hosts:
+        print("ℹ️ 未在 SSH 配置文件中找到任何具体的 Host 条目。")
+        return True
+
+    print(f"✅ 成功解析到 {len(parsed_hosts)} 个主机。正在合并到 config.json...")
+
+    # --- 合并逻辑：按主机名建立索引，一次性写回 ---
+    try:
+        config = load_config(config_path)
+        added, updated, skipped = merge_ssh_hosts(config, parsed_hosts, on_conflict)
+        if added or updated:
+            save_config(config, config_path)
+            print(f"✅ 导入完成: 新增 {added} 个，更新 {updated} 个，跳过 {skipped} 个 -> {config_path}")
+        else:
+            print(f"ℹ️ 没有主机被导入或更新（{skipped} 个已存在）。")
+    except (ConfigError, OSError) as e:
+        print(f"❌ 写入 config.json 时出错: {e}")
+        return False
+    return True
+
+
+# --- 导出 ---
+
+def export_ssh_config(config: dict) -> str:
+    """把配置中的主机导出为 ssh_config 格式的 Host 块 (import 的逆操作，不含服务)"""
+    blocks = []
+    for host in config['hosts']:
+        lines = [f"Host {host['hostName']}", f"    HostName {host['serverIP']}", f"    User {host['sshUser']}"]
+        if host.get('sshPort', DEFAULT_SSH_PORT) != DEFAULT_SSH_PORT:
+            lines.append(f"    Port {host['sshPort']}")
+        if host.get('proxyJump'):
+            lines.append(f"    ProxyJump {host['proxyJump']}")
+        if host.get('identityFile'):
+            lines.append(f"    IdentityFile {host['identityFile']}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks) + "\n" if blocks else ""
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+运行时状态目录与跨进程文件锁。
+
+命令行、Rofi 和 Web 服务共用状态目录下的文件 (使用记录、事件日志、预热连接登记表等)，
+以及 config.json 的写锁；这里只依赖标准库，任何模块都可以导入。
+"""
+
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+if os.name == 'nt':
+    fcntl = None
+else:
+    import fcntl
+
+
+def _default_state_dir() -> Path:
+    if os.environ.get('SSHTF_STATE_DIR'):
+        return Path(os.environ['SSHTF_STATE_DIR'])
+    if os.name == 'nt':
+        return Path(os.environ.get('LOCALAPPDATA', Path.home())) / 'sshtf'
+    return Path(os.environ.get('XDG_STATE_HOME', Path.home() / '.local' / 'state')) / 'sshtf'
+
+
+# 运行时状态 (使用记录、预热连接等) 的存放目录，可用环境变量 SSHTF_STATE_DIR 覆盖
+STATE_DIR = _default_state_dir()
+
+
+@contextmanager
+def exclusive_lock(f):
+    """在支持的平台上对打开的文件加独占锁 (Windows 上尽力而为，不加锁)"""
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
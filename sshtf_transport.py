@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+SSH 传输参数 (加密算法 / MAC / 压缩) 的吞吐量与延迟测试。
+
+每组候选参数单独建立一条 SSH 连接 (不复用预热的主连接)，在远程执行 `cat` 作为回显，经由这条连接的通道测量：
+- 建立连接的耗时 (握手 + 认证，到第一个字节回显为止)；
+- 往返延迟：逐个发送小消息并等待回显，取中位数；
+- 吞吐量：连续发送 size 字节的数据并全部收回。
+端口转发 (-L) 的数据走的是同一条连接中的通道，加密、MAC 和压缩的开销与这里测到的相同；
+用回显命令代替转发，远程主机上不需要有接收数据的服务。目标可以是任何 sshd，包括本机上用于测试的 sshd。
+最佳参数可以保存为主机的 transport 字段，之后启动隧道时自动带上 (见 sshtf_core.transport_args())。
+"""
+
+import os
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from typing import List
+
+from sshtf_core import host_ssh_options, transport_args
+
+# 默认的候选参数：常见的 AEAD 算法，以及 CTR 模式配合两种 MAC；每种都分别测试开启和关闭压缩
+DEFAULT_CANDIDATES = [
+    {'cipher': 'aes128-gcm@openssh.com'},
+    {'cipher': 'aes256-gcm@openssh.com'},
+    {'cipher': 'chacha20-poly1305@openssh.com'},
+    {'cipher': 'aes128-ctr', 'mac': 'umac-64-etm@openssh.com'},
+    {'cipher': 'aes128-ctr', 'mac': 'hmac-sha2-256-etm@openssh.com'},
+]
+DEFAULT_SIZE = 16 * 1024 * 1024   # 吞吐量测试的数据量 (字节)
+DEFAULT_ROUNDS = 20               # 往返延迟测试的次数
+DEFAULT_TIMEOUT = 60.0            # 单组参数的总超时 (秒)
+CHUNK_SIZE = 64 * 1024
+PING_SIZE = 64
+
+
+def local_algorithms(kind: str) -> set:
+    """本机 ssh 支持的算法 (`ssh -Q cipher|mac`)，查询失败时返回空集合 (不做过滤)"""
+    try:
+        output = subprocess.run(["ssh", "-Q", kind], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return set()
+    return set(output.split())
+
+
+def expand_candidates(candidates: List[dict] = None, compression: bool = True) -> List[dict]:
+    """去掉本机 ssh 不支持的算法，并为每组参数展开压缩开/关两种 (compression 为 False 时只测关闭)"""
+    ciphers, macs = local_algorithms('cipher'), local_algorithms('mac')
+    expanded = []
+    for candidate in candidates or DEFAULT_CANDIDATES:
+        if ciphers and candidate.get('cipher') and candidate['cipher'] not in ciphers:
+            continue
+        if macs and candidate.get('mac') and candidate['mac'] not in macs:
+            continue
+        for compress in ((False, True) if compression else (False,)):
+            expanded.append({'cipher': candidate.get('cipher'), 'mac': candidate.get('mac'), 'compression': compress})
+    return expanded
+
+
+def make_payload(size: int, kind: str = 'random') -> bytes:
+    """random: 不可压缩的随机数据；text: 随机数据的十六进制文本 (约可压缩一半，接近网页、日志等流量)"""
+    if kind == 'text':
+        return os.urandom(size // 2 + 1).hex()[:size].encode('ascii')
+    return os.urandom(size)
+
+
+def bench_args(host: dict, transport: dict, timeout: float) -> List[str]:
+    """用 transport 代替主机上保存的传输参数、在远程执行 cat 的 ssh 命令行 (不使用主连接)"""
+    args = ["ssh", "-o", "BatchMode=yes", "-o", f"ConnectTimeout={max(1, int(timeout))}",
+            "-o", "ControlMaster=no", "-o", "ControlPath=none",
+            "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=NUL"]
+    args += transport_args(transport)
+    args += host_ssh_options({**host, 'transport': None})
+    args += [f"{host.get('sshUser')}@{host.get('serverIP')}", "cat"]
+    return args
+
+
+def _read_exact(stream, size: int) -> bool:
+    remaining = size
+    while remaining:
+        data = stream.read(min(remaining, CHUNK_SIZE))
+        if not data:
+            return False
+        remaining -= len(data)
+    return True
+
+
+def measure_transport(host: dict, transport: dict, payload: bytes, rounds: int = DEFAULT_ROUNDS,
+                      timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """
+    测量一组传输参数。返回
+    {'cipher', 'mac', 'compression', 'ok', 'error', 'connectMs', 'latencyMs', 'throughputMBps'}
+    """
+    result = {**transport, 'ok': False, 'error': None, 'connectMs': None, 'latencyMs': None, 'throughputMBps': None}
+    started = time.perf_counter()
+    # stderr 写入临时文件而不是管道：测量期间没有人读取，ssh 输出较多 (banner、-v、警告) 时管道写满会卡住测量
+    stderr_file = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(bench_args(host, transport, timeout), stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=stderr_file)
+    except FileNotFoundError:
+        stderr_file.close()
+        return {**result, 'error': '未找到 ssh'}
+    # 超时后结束进程，阻塞中的读写随之返回
+    watchdog = threading.Timer(timeout, process.kill)
+    watchdog.start()
+    try:
+        process.stdin.write(b"\n")
+        process.stdin.flush()
+        if not _read_exact(process.stdout, 1):
+            raise ConnectionError
+        result['connectMs'] = round((time.perf_counter() - started) * 1000, 1)
+
+        ping = b"x" * (PING_SIZE - 1) + b"\n"
+        latencies = []
+        for _ in range(rounds):
+            sent = time.perf_counter()
+            process.stdin.write(ping)
+            process.stdin.flush()
+            if not _read_exact(process.stdout, len(ping)):
+                raise ConnectionError
+            latencies.append((time.perf_counter() - sent) * 1000)
+        result['latencyMs'] = round(statistics.median(latencies), 2)
+
+        def send():
+            try:
+                for offset in range(0, len(payload), CHUNK_SIZE):
+                    process.stdin.write(payload[offset:offset + CHUNK_SIZE])
+                process.stdin.flush()
+            except OSError:
+                pass
+
+        sender = threading.Thread(target=send, daemon=True)
+        sent = time.perf_counter()
+        sender.start()
+        if not _read_exact(process.stdout, len(payload)):
+            raise ConnectionError
+        elapsed = time.perf_counter() - sent
+        sender.join()
+        result.update(ok=True, throughputMBps=round(len(payload) / elapsed / 1e6, 1))
+    except (ConnectionError, OSError):
+        result['error'] = '超时' if not watchdog.is_alive() else '连接已断开'
+    finally:
+        watchdog.cancel()
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        with stderr_file:
+            if result['error'] == '连接已断开':
+                # ssh 自身的错误 (认证失败、对方不支持该算法等)，取 stderr 的最后一行
+                stderr_file.seek(0)
+                lines = stderr_file.read().decode('utf-8', errors='replace').strip().splitlines()
+                if lines:
+                    result['error'] = lines[-1]
+    return result
+
+
+def bench_transports(host: dict, candidates: List[dict] = None, size: int = DEFAULT_SIZE, payload: str = 'random',
+                     rounds: int = DEFAULT_ROUNDS, timeout: float = DEFAULT_TIMEOUT, compression: bool = True,
+                     progress=None) -> List[dict]:
+    """
+    依次测量每组候选参数 (逐个进行，避免互相争抢带宽)，返回按吞吐量从高到低排列的结果，失败的排在最后。
+    progress 为可选的回调，每测完一组调用一次。
+    """
+    data = make_payload(size, payload)
+    results = []
+    for transport in expand_candidates(candidates, compression):
+        result = measure_transport(host, transport, data, rounds, timeout)
+        results.append(result)
+        if progress:
+            progress(result)
+    return sorted(results, key=lambda r: (not r['ok'], -(r['throughputMBps'] or 0), r['latencyMs'] or 0))
+
+
+def best_transport(results: List[dict]):
+    """bench_transports() 结果中最快的一组，作为主机的 transport 字段保存；全部失败时返回 None"""
+    best = next((r for r in results if r['ok']), None)
+    if best is None:
+        return None
+    transport = {'cipher': best['cipher'], 'compression': best['compression']}
+    if best.get('mac'):
+        transport['mac'] = best['mac']
+    return transport
+
+
+def format_transport(transport: dict) -> str:
+    """如 "aes128-gcm@openssh.com + 压缩" """
+    if not transport:
+        return "默认"
+    parts = [transport.get('cipher') or "默认算法"]
+    if transport.get('mac'):
+        parts.append(transport['mac'])
+    if transport.get('compression'):
+        parts.append("压缩")
+    return " + ".join(parts)
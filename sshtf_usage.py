@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+主机 / 服务的使用记录 (启动次数、最近使用时间、衰减后的使用频率)。
+
+记录保存在一个紧凑的二进制文件中：8 字节文件头 + 若干条定长记录，
+每条记录以 (主机名, 服务名) 的 16 字节摘要为键。每次启动只原地改写一条记录
+(新键追加到末尾)，读取时一次性读入整个文件，菜单等热路径上无需解析 JSON。
+"""
+
+import hashlib
+import math
+import os
+import struct
+import time
+from pathlib import Path
+
+from sshtf_state import STATE_DIR, exclusive_lock
+
+USAGE_PATH = STATE_DIR / 'usage.bin'
+
+_HEADER = struct.Struct('<4sHH')      # 魔数, 格式版本, 保留
+_RECORD = struct.Struct('<16sIdd')    # 键摘要, 使用次数, 最近使用时间, 衰减分数 (截至最近使用时间)
+_MAGIC = b'STFU'
+_FORMAT_VERSION = 1
+
+# 使用频率的半衰期：3 天前的一次使用只算半次
+FRECENCY_HALF_LIFE = 3 * 24 * 3600
+
+
+def usage_key(host_name: str, service_name: str = '') -> bytes:
+    """(主机名, 服务名) 的记录键；服务名为空表示主机本身"""
+    return hashlib.blake2b(f"{host_name}\0{service_name}".encode('utf-8'), digest_size=16).digest()
+
+
+def _decay(score: float, elapsed: float, half_life: float = FRECENCY_HALF_LIFE) -> float:
+    return score * math.pow(0.5, max(elapsed, 0.0) / half_life)
+
+
+def load_usage(path: Path = USAGE_PATH) -> dict:
+    """
+    一次性读入全部使用记录：{键摘要: (使用次数, 最近使用时间, 衰减分数)}。
+    文件不存在或格式不符时返回空字典。
+    """
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return {}
+    if len(data) < _HEADER.size:
+        return {}
+    magic, version, _ = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _FORMAT_VERSION:
+        return {}
+    count = (len(data) - _HEADER.size) // _RECORD.size
+    return {
+        key: (uses, last_used, score)
+        for key, uses, last_used, score in _RECORD.iter_unpack(
+            data[_HEADER.size:_HEADER.size + count * _RECORD.size]
+        )
+    }
+
+
+def record_use(host_name: str, service_name: str = None, now: float = None, path: Path = USAGE_PATH) -> bool:
+    """
+    记录一次使用：同时更新主机本身和 (给出时) 该服务的记录。
+    使用记录只是辅助信息，写入失败时返回 False 而不抛出异常。
+    """
+    now = time.time() if now is None else now
+    keys = [usage_key(host_name)]
+    if service_name:
+        keys.append(usage_key(host_name, service_name))
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, 'r+b') as f, exclusive_lock(f):
+            data = f.read()
+            if len(data) < _HEADER.size or _HEADER.unpack_from(data)[:2] != (_MAGIC, _FORMAT_VERSION):
+                # 新文件或无法识别的旧文件：重新开始
+                f.seek(0)
+                f.truncate()
+                f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, 0))
+                data = b''
+            elif (len(data) - _HEADER.size) % _RECORD.size:
+                # 上次写入被中断留下的半条记录
+                data = data[:len(data) - (len(data) - _HEADER.size) % _RECORD.size]
+                f.truncate(len(data))
+
+            offsets = {}
+            for offset in range(_HEADER.size, len(data) - _RECORD.size + 1, _RECORD.size):
+                offsets[data[offset:offset + 16]] = offset
+
+            for key in keys:
+                offset = offsets.get(key)
+                if offset is None:
+                    f.seek(0, os.SEEK_END)
+                    f.write(_RECORD.pack(key, 1, now, 1.0))
+                    continue
+                _, uses, last_used, score = _RECORD.unpack_from(data, offset)
+                f.seek(offset)
+                f.write(_RECORD.pack(key, uses + 1, now, _decay(score, now - last_used) + 1.0))
+        return True
+    except OSError:
+        return False
+
+
+def frecency(usage: dict, host_name: str, service_name: str = '', now: float = None) -> float:
+    """按当前时间衰减后的使用频率，没有记录时为 0"""
+    record = usage.get(usage_key(host_name, service_name))
+    if record is None:
+        return 0.0
+    _, last_used, score = record
+    return _decay(score, (time.time() if now is None else now) - last_used)
+
+
+# --- 菜单排序 ---
+
+def _rank(items: list, score) -> list:
+    # sorted() 是稳定排序：分数相同 (包括没有使用记录) 的项保持配置中的顺序
+    return sorted(items, key=lambda item: -score(item))
+
+
+def rank_hosts(hosts: list, usage: dict = None, now: float = None) -> list:
+    """按使用频率从高到低排列主机，没有使用记录的按配置顺序排在后面"""
+    usage = load_usage() if usage is None else usage
+    now = time.time() if now is None else now
+    return _rank(hosts, lambda h: frecency(usage, h.get('hostName'), now=now))
+
+
+def rank_services(host_name: str, services: list, usage: dict = None, now: float = None) -> list:
+    """按使用频率从高到低排列某台主机的服务"""
+    usage = load_usage() if usage is None else usage
+    now = time.time() if now is None else now
+    return _rank(services, lambda s: frecency(usage, host_name, s.get('serviceName'), now=now))
+
+
+def use_frecency_order(config: dict) -> bool:
+    """config.json 中 menuOrder 为 "config" 时菜单保持配置顺序"""
+    return config.get('menuOrder', 'frecency') != 'config'
@@ -0,0 +1,1044 @@
+# -*- coding: utf-8 -*-
+"""
+Web UI 的 FastAPI 应用与服务器启动逻辑。
+
+由 `python main.py` (或 `main.py serve`) 按需导入；main.py 的其他子命令不会加载这里的 Web 框架。
+"""
+
+import json
+import os
+import gzip
+import socket
+import time
+import asyncio
+import aiofiles
+import psutil
+import pathlib 
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response, Header, Query
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional, Any, Dict, Literal, Tuple
+from sshtf_config import CONFIG_PATH, DEFAULT_LOCAL_PORT_RANGE, config_lock
+from sshtf_models import Service, PortRange, Host, GroupMember, TunnelGroup, Config
+from sshtf_probe import probe_hosts_cached
+from sshtf_discovery import discover_hosts_cached, suggest_services
+from sshtf_log import read_events, find_registered_tunnel, read_stderr
+from sshtf_core import find_tunnels, stop_tunnels, listening_ports, next_free_port, start_group, stop_group, reconcile
+from sshtf_failover import failover_status
+SCRIPT_DIR = pathlib.Path(__file__).parent.resolve()
+# --- 配置 ---
+file_lock = asyncio.Lock()
+
+# --- 批量操作模型 ---
+
+class HostOperation(BaseModel):
+    op: Literal['create', 'update', 'delete']
+    hostName: str                 # 目标主机名 (update/delete 时为原主机名)
+    host: Optional[Host] = None   # create/update 时的主机数据
+
+class ServiceOperation(BaseModel):
+    op: Literal['create', 'update', 'delete']
+    hostName: str
+    serviceName: Optional[str] = None  # update/delete 时的原服务名
+    service: Optional[Service] = None  # create/update 时的服务数据
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    detail: str
+
+class BatchResult(BaseModel):
+    applied: bool
+    results: List[BatchItemResult]
+
+class ServiceRef(BaseModel):
+    hostName: Optional[str] = None  # 故障转移服务 (config.failover) 不属于某台主机，为空
+    serviceName: str
+
+class PortConflict(BaseModel):
+    localPort: int
+    services: List[ServiceRef]
+
+# --- 运行中隧道模型 ---
+
+class TunnelForward(BaseModel):
+    localPort: int
+    remotePort: int
+
+class TunnelInfo(BaseModel):
+    pid: int
+    hostName: Optional[str] = None  # 无法对应到配置中的主机时为空
+    services: List[str] = []
+    destination: Optional[str] = None
+    sshPort: int = 22
+    forwards: List[TunnelForward] = []
+
+class TunnelStopRequest(BaseModel):
+    hostName: Optional[str] = None
+    serviceName: Optional[str] = None
+    localPort: Optional[int] = None
+    timeout: float = 3.0  # SIGTERM 后等待的秒数，超时强制结束
+
+class TunnelStopResult(BaseModel):
+    matched: int
+    terminated: List[int]
+    killed: List[int]
+    failed: List[int]
+
+class HostStatus(BaseModel):
+    ok: bool
+    latencyMs: Optional[float] = None
+    error: Optional[str] = None
+    checkedAt: float
+    target: str              # 实际探测的 地址:端口
+    via: Optional[str] = None  # 配置了 proxyJump 时探测的是第一个跳板机
+
+class ListeningPort(BaseModel):
+    port: int
+    addresses: List[str]  # 远程监听地址，如 0.0.0.0 / 127.0.0.1 / [::]
+
+class DiscoveredService(Service):
+    addresses: List[str]
+
+class HostDiscovery(BaseModel):
+    ok: bool
+    error: Optional[str] = None
+    checkedAt: float
+    elapsedMs: Optional[float] = None
+    target: str
+    ports: List[ListeningPort] = []
+    suggestions: List[DiscoveredService] = []  # 尚未配置的端口，localPort 为 0 (保存时自动分配)
+
+class TunnelEvent(BaseModel):
+    model_config = ConfigDict(extra='allow')  # 不同事件带有不同的字段 (exitCode / elapsedMs / stderr 等)
+    ts: float
+    event: Literal['spawn', 'ready', 'failure', 'exit', 'stop', 'reap', 'switch']
+    pid: Optional[int] = None
+
+class TunnelStderr(BaseModel):
+    pid: int
+    lines: List[str]
+
+class GroupMemberResult(BaseModel):
+    hostName: str
+    serviceName: Optional[str] = None  # 自定义转发为空
+    status: Literal['started', 'running', 'failed', 'missing']
+    localPort: Optional[int] = None
+    pid: Optional[int] = None
+    error: Optional[str] = None
+
+class GroupStopRequest(BaseModel):
+    timeout: float = 3.0
+
+class ReconcileRequest(BaseModel):
+    desired: List[GroupMember]  # 期望运行的 (主机名, 服务名)，不在其中的受管隧道会被关闭
+    dryRun: bool = False
+    timeout: float = 3.0
+
+class PlannedForward(BaseModel):
+    hostName: str
+    serviceName: Optional[str] = None
+    remotePort: int
+    localPort: int
+
+class ReconcileResult(BaseModel):
+    start: List[PlannedForward]
+    stop: List[TunnelInfo]
+    restart: List[TunnelInfo]  # 进程中有多余的转发，关闭后只重新启动期望的部分
+    keep: List[GroupMember]
+    unmanaged: List[TunnelInfo]  # 对应不到配置中服务的隧道，不会被关闭
+    missing: List[GroupMember]
+    started: List[GroupMemberResult] = []  # dryRun 时为空
+    stopped: Optional[TunnelStopResult] = None
+
+class FailoverSwitch(BaseModel):
+    ts: float
+    fromHost: str
+    toHost: str
+    latencyMs: Optional[float] = None
+    reason: str  # exit: 原主机上的隧道断开
+
+class FailoverStatus(BaseModel):
+    serviceName: str
+    localPort: int
+    remotePort: int
+    hosts: List[str]
+    hostName: Optional[str] = None  # 当前转发的主机，隧道未运行时为空
+    pid: Optional[int] = None
+    latencyMs: Optional[float] = None  # 选择该主机时探测到的延迟
+    since: Optional[float] = None
+    switches: List[FailoverSwitch] = []  # 最近的切换记录 (从旧到新)
+
+# --- FastAPI 应用实例 ---
+app = FastAPI(title="端口转发配置管理器 API (V3)")
+
+# --- 辅助函数：异步读写 config.json ---
+# config.json 的解析结果按文件 (mtime, size) 缓存在内存中，外部进程改写文件后会自动重新加载。
+# 每次保存都会递增 config.version，作为 HTTP ETag 实现乐观并发控制。
+
+_config_cache: Optional[Config] = None
+_config_cache_stat: Optional[Tuple[int, int]] = None
+
+
+class ConfigVersionConflict(Exception):
+    """保存时发现磁盘上的配置版本与预期不一致"""
+    def __init__(self, current_version: int):
+        super().__init__(f"配置已被修改 (当前版本 {current_version})")
+        self.current_version = current_version
+
+
+def _config_file_stat() -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(CONFIG_PATH)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+async def _load_config_locked() -> Config:
+    """(需持有 file_lock) 返回当前配置的缓存对象，文件有变化时重新读取。调用方不得修改返回值。"""
+    global _config_cache, _config_cache_stat
+    stat = _config_file_stat()
+    if _config_cache is not None and stat == _config_cache_stat:
+        return _config_cache
+
+    if stat is None:
+        config = Config(hosts=[])
+    else:
+        async with aiofiles.open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+            content = await f.read()
+        if not content:
+            config = Config(hosts=[])
+        else:
+            try:
+                config = Config.model_validate(json.loads(content))
+            except json.JSONDecodeError:
+                raise HTTPException(status_code=500, detail="config.json 文件格式错误 (非 JSON)")
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"解析 config.json 出错: {e}")
+
+    _config_cache, _config_cache_stat = config, stat
+    return config
+
+
+async def get_config() -> Config:
+    """异步读取、解析并校验 config.json (返回副本，可直接修改)"""
+    async with file_lock:
+        return (await _load_config_locked()).model_copy(deep=True)
+
+
+async def get_config_version() -> int:
+    """当前配置版本号，不复制配置对象"""
+    async with file_lock:
+        return (await _load_config_locked()).version
+
+
+@asynccontextmanager
+async def _config_write_lock():
+    """
+    写配置时在 file_lock 之外再持有的跨进程锁 (与 main.py 等命令行写入共用 config.json.lock)，
+    在线程中等待，不阻塞事件循环。
+    等待期间请求被取消 (如客户端断开) 时线程仍会拿到锁，拿到后立即释放，不会一直占着锁。
+    """
+    lock = config_lock(CONFIG_PATH)
+    acquiring = asyncio.ensure_future(asyncio.to_thread(lock.__enter__))
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        def release(f: asyncio.Future):
+            if not f.cancelled() and f.exception() is None:
+                lock.__exit__(None, None, None)
+        acquiring.add_done_callback(release)
+        raise
+    try:
+        yield
+    finally:
+        lock.__exit__(None, None, None)
+
+
+async def _write_config_locked(config: Config) -> int:
+    """(需持有 file_lock 与 _config_write_lock) 递增版本号并写回 config.json，返回新的版本号"""
+    global _config_cache, _config_cache_stat
+    current = await _load_config_locked()
+    config.version = current.version + 1
+    # 先写临时文件再原子替换，避免其他进程读到写了一半的文件
+    tmp_path = CONFIG_PATH.with_name(f"{CONFIG_PATH.name}.{os.getpid()}.tmp")
+    async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+        await f.write(config.model_dump_json(indent=2))
+    os.replace(tmp_path, CONFIG_PATH)
+
+    _config_cache, _config_cache_stat = config.model_copy(deep=True), _config_file_stat()
+    return config.version
+
+
+async def save_config(config: Config, expected_version: Optional[int] = None) -> int:
+    """
+    异步将配置对象写回 config.json，返回新的版本号。
+    给出 expected_version 时，若磁盘上的版本已不同则抛出 ConfigVersionConflict (比较并交换)。
+    """
+    async with file_lock, _config_write_lock():
+        current = await _load_config_locked()
+        if expected_version is not None and current.version != expected_version:
+            raise ConfigVersionConflict(current.version)
+        return await _write_config_locked(config)
+
+
+# --- GET /api/config 响应缓存 ---
+# 缓存当前配置对象序列化后的 JSON (及按需生成的 gzip) 字节。
+# 配置被修改或从磁盘重新加载时 _config_cache 会换成新对象，缓存随之失效。
+
+CONFIG_GZIP_MIN_SIZE = 1024  # 小于该大小的响应不压缩
+_config_response_cache: Optional[Dict[str, Any]] = None
+
+
+async def get_config_response_body(accept_gzip: bool) -> Tuple[int, bytes, bool]:
+    """返回 (版本号, 响应体字节, 是否已 gzip)。同一版本只序列化/压缩一次。"""
+    global _config_response_cache
+    async with file_lock:
+        config = await _load_config_locked()
+
+    cache = _config_response_cache
+    if cache is None or cache['config'] is not config:
+        # pydantic-core 直接输出 JSON 字节，绕过 response_model 的逐字段校验与 jsonable_encoder
+        body = Config.__pydantic_serializer__.to_json(config)
+        cache = {'config': config, 'json': body, 'gzip': None}
+        _config_response_cache = cache
+
+    if accept_gzip and len(cache['json']) >= CONFIG_GZIP_MIN_SIZE:
+        if cache['gzip'] is None:
+            cache['gzip'] = gzip.compress(cache['json'], compresslevel=6)
+        return config.version, cache['gzip'], True
+    return config.version, cache['json'], False
+
+
+# --- ETag / If-Match 辅助函数 ---
+
+def _format_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def _etag_matches(header: str, version: int) -> bool:
+    """If-Match / If-None-Match 头是否包含指定版本 (支持 * 与弱校验 W/ 前缀)"""
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.removeprefix('W/') == _format_etag(version):
+            return True
+    return False
+
+
+async def _busy_local_ports() -> set:
+    """在线程中扫描一次系统中正在监听的端口 (分配本地端口时避开)；无权限读取系统连接时返回空集合"""
+    try:
+        return await asyncio.to_thread(listening_ports)
+    except (psutil.Error, OSError):
+        return set()
+
+
+async def _mutate_config(apply, if_match: Optional[str], response: Optional[Response] = None,
+                         busy_ports: Optional[set] = None):
+    """
+    读取-修改-保存的通用流程，整个过程在一次 file_lock (及跨进程的 config.json.lock) 内完成，不会丢失并发写入。
+    apply(config) 直接修改传入的配置副本并返回结果；抛出异常时不保存。
+    带 If-Match 且版本不一致时返回 412。成功后在 response 上设置新的 ETag。
+    busy_ports 为分配本地端口时要避开的监听端口，为空时在加锁之前扫描一次。
+    """
+    if busy_ports is None:
+        busy_ports = await _busy_local_ports()
+    async with file_lock, _config_write_lock():
+        current = await _load_config_locked()
+        if if_match is not None and not _etag_matches(if_match, current.version):
+            raise HTTPException(status_code=412, detail="配置已被其他客户端修改，请刷新后重试")
+        config = current.model_copy(deep=True)
+        result = apply(config)
+        _assign_local_ports(config, busy_ports)
+        _check_new_port_conflicts(current, config)
+        version = await _write_config_locked(config)
+
+    if response is not None:
+        response.headers["ETag"] = _format_etag(version)
+    return result
+
+
+# --- 配置修改辅助函数 (单条接口与批量接口共用) ---
+# 这些函数只修改内存中的 config 对象，出错时抛出 HTTPException，由调用方决定何时保存。
+
+def _find_host(config: Config, host_name: str) -> Host:
+    host_found = next((h for h in config.hosts if h.hostName == host_name), None)
+    if not host_found:
+        raise HTTPException(status_code=404, detail="未找到指定的主机名")
+    return host_found
+
+def _add_host(config: Config, host: Host):
+    if any(h.hostName == host.hostName for h in config.hosts):
+        raise HTTPException(status_code=400, detail="主机名已存在")
+    config.hosts.append(host)
+
+def _update_host(config: Config, host_name: str, updated_host: Host) -> Host:
+    """只覆盖请求中显式给出的字段 (未给出 services 时保留原有服务)"""
+    host_found = _find_host(config, host_name)
+    new_name = updated_host.hostName
+    if new_name != host_name and any(h.hostName == new_name for h in config.hosts):
+        raise HTTPException(status_code=400, detail=f"主机名 '{new_name}' 已存在")
+    merged = host_found.model_copy(update={
+        field: getattr(updated_host, field) for field in updated_host.model_fields_set
+    })
+    config.hosts[config.hosts.index(host_found)] = merged
+    if new_name != host_name:
+        for group in config.groups:
+            for member in group.members:
+                if member.hostName == host_name:
+                    member.hostName = new_name
+        for service in config.failover:
+            service.hosts = [new_name if h == host_name else h for h in service.hosts]
+    return merged
+
+def _delete_host(config: Config, host_name: str):
+    original_count = len(config.hosts)
+    config.hosts = [h for h in config.hosts if h.hostName != host_name]
+    if len(config.hosts) == original_count:
+        raise HTTPException(status_code=404, detail="未找到指定的主机名")
+    _drop_group_members(config, lambda m: m.hostName == host_name)
+    for service in config.failover:
+        service.hosts = [h for h in service.hosts if h != host_name]
+
+def _add_service(config: Config, host_name: str, service: Service):
+    host_found = _find_host(config, host_name)
+    if any(s.serviceName == service.serviceName for s in host_found.services):
+        raise HTTPException(status_code=400, detail=f"主机 '{host_name}' 下已存在同名服务")
+    host_found.services.append(service)
+
+def _update_service(config: Config, host_name: str, original_service_name: str, updated_service: Service):
+    host_found = _find_host(config, host_name)
+    service_index = next(
+        (i for i, s in enumerate(host_found.services) if s.serviceName == original_service_name), -1
+    )
+    if service_index == -1:
+        raise HTTPException(status_code=404, detail="未找到要修改的原始服务名")
+
+    new_name = updated_service.serviceName
+    if new_name != original_service_name and any(s.serviceName == new_name for s in host_found.services):
+        raise HTTPException(status_code=400, detail=f"服务名 '{new_name}' 已在当前主机下存在")
+    host_found.services[service_index] = updated_service
+    if new_name != original_service_name:
+        for group in config.groups:
+            for member in group.members:
+                if member.hostName == host_name and member.serviceName == original_service_name:
+                    member.serviceName = new_name
+
+def _delete_service(config: Config, host_name: str, service_name: str):
+    host_found = _find_host(config, host_name)
+    original_service_count = len(host_found.services)
+    host_found.services = [s for s in host_found.services if s.serviceName != service_name]
+    if len(host_found.services) == original_service_count:
+        raise HTTPException(status_code=404, detail="未找到指定的服务名")
+    _drop_group_members(config, lambda m: m.hostName == host_name and m.serviceName == service_name)
+
+def _drop_group_members(config: Config, predicate):
+    """主机或服务被删除后，从各隧道组中移除对应成员 (组本身保留)"""
+    for group in config.groups:
+        group.members = [m for m in group.members if not predicate(m)]
+
+def _find_group(config: Config, group_name: str) -> TunnelGroup:
+    group_found = next((g for g in config.groups if g.groupName == group_name), None)
+    if not group_found:
+        raise HTTPException(status_code=404, detail="未找到指定的隧道组")
+    return group_found
+
+def _validate_group(config: Config, group: TunnelGroup):
+    """组成员必须指向已存在的服务，且不能重复"""
+    seen = set()
+    for member in group.members:
+        host_found = _find_host(config, member.hostName)
+        if not any(s.serviceName == member.serviceName for s in host_found.services):
+            raise HTTPException(status_code=404, detail=f"主机 '{member.hostName}' 下未找到服务 '{member.serviceName}'")
+        key = (member.hostName, member.serviceName)
+        if key in seen:
+            raise HTTPException(status_code=400, detail=f"隧道组中重复的成员: {member.hostName}/{member.serviceName}")
+        seen.add(key)
+
+def _validate_failover(config: Config):
+    """故障转移服务名不能重复，候选主机必须已存在"""
+    seen = set()
+    for service in config.failover:
+        if service.serviceName in seen:
+            raise HTTPException(status_code=400, detail=f"重复的故障转移服务名: {service.serviceName}")
+        seen.add(service.serviceName)
+        for host_name in service.hosts:
+            _find_host(config, host_name)
+
+def _add_group(config: Config, group: TunnelGroup):
+    if any(g.groupName == group.groupName for g in config.groups):
+        raise HTTPException(status_code=400, detail="隧道组名已存在")
+    _validate_group(config, group)
+    config.groups.append(group)
+
+def _update_group(config: Config, group_name: str, updated_group: TunnelGroup):
+    group_found = _find_group(config, group_name)
+    new_name = updated_group.groupName
+    if new_name != group_name and any(g.groupName == new_name for g in config.groups):
+        raise HTTPException(status_code=400, detail=f"隧道组名 '{new_name}' 已存在")
+    _validate_group(config, updated_group)
+    config.groups[config.groups.index(group_found)] = updated_group
+
+def _delete_group(config: Config, group_name: str):
+    config.groups.remove(_find_group(config, group_name))
+
+def _local_port_claims(config: Config) -> Dict[int, List[Tuple[Optional[str], str]]]:
+    """
+    本地端口索引：本地端口 -> 占用该端口的 (主机名, 服务名) 列表 (不含待分配的 0)。
+    故障转移服务也占用其 localPort，主机名记为 None (与 sshtf_config.validate_config 的规则一致)。
+    """
+    claims: Dict[int, List[Tuple[Optional[str], str]]] = {}
+    for h in config.hosts:
+        for s in h.services:
+            if s.localPort:
+                claims.setdefault(s.localPort, []).append((h.hostName, s.serviceName))
+    for f in config.failover:
+        claims.setdefault(f.localPort, []).append((None, f.serviceName))
+    return claims
+
+def _claim_name(owner: Tuple[Optional[str], str]) -> str:
+    host_name, service_name = owner
+    return f"'{host_name}/{service_name}'" if host_name is not None else f"故障转移服务 '{service_name}'"
+
+def _port_conflicts(config: Config) -> Dict[int, List[Tuple[str, str]]]:
+    """被多个服务同时占用的本地端口"""
+    return {port: owners for port, owners in _local_port_claims(config).items() if len(owners) > 1}
+
+def _check_new_port_conflicts(old_config: Config, new_config: Config):
+    """
+    只拒绝本次修改新引入的端口冲突；配置中原有的冲突不阻止其他修改 (通过 GET /api/ports/conflicts 查看)。
+    """
+    old_conflicts = _port_conflicts(old_config)
+    for port, owners in _port_conflicts(new_config).items():
+        if set(owners) - set(old_conflicts.get(port, [])):
+            names = "、".join(_claim_name(owner) for owner in owners)
+            raise HTTPException(status_code=409, detail=f"本地端口 {port} 被多个服务占用: {names}")
+
+def _assign_local_ports(config: Config, busy_ports: set):
+    """
+    为 localPort 为 0 的服务从其主机的端口范围中分配一个未被配置占用、也不在 busy_ports
+    (调用方事先扫描好的监听端口，见 _busy_local_ports) 中的端口。
+    """
+    pending = [(h, s) for h in config.hosts for s in h.services if not s.localPort]
+    if not pending:
+        return
+    claimed = set(_local_port_claims(config)) | busy_ports
+
+    for host, service in pending:
+        port_range = host.localPortRange or PortRange(start=DEFAULT_LOCAL_PORT_RANGE[0], end=DEFAULT_LOCAL_PORT_RANGE[1])
+        port = next_free_port(port_range.start, claimed, port_range.end)
+        if port is None:
+            raise HTTPException(
+                status_code=409,
+                detail=f"主机 '{host.hostName}' 的本地端口范围 {port_range.start}-{port_range.end} 已无可用端口",
+            )
+        service.localPort = port
+        claimed.add(port)
+
+def _apply_batch(config: Config, operations: list, apply_one, busy_ports: set) -> BatchResult:
+    """
+    依次应用批量操作并逐条记录结果，最后统一分配本地端口 (避开 busy_ports) 并检查冲突。
+    apply_one(config, op) 返回该操作最终涉及的 (主机名, 服务名) 列表，用于端口冲突检查。
+    只要有一条失败，applied 即为 False，调用方不应保存。
+    """
+    results = []
+    touched = {}  # 结果下标 -> 涉及的服务
+    for index, op in enumerate(operations):
+        try:
+            touched[index] = apply_one(config, op)
+            results.append(BatchItemResult(index=index, ok=True, detail="OK"))
+        except HTTPException as e:
+            results.append(BatchItemResult(index=index, ok=False, detail=str(e.detail)))
+
+    services = {(h.hostName, s.serviceName): s for h in config.hosts for s in h.services}
+    try:
+        _assign_local_ports(config, busy_ports)
+    except HTTPException as e:
+        for index, keys in touched.items():
+            if any(key in services and not services[key].localPort for key in keys):
+                results[index] = BatchItemResult(index=index, ok=False, detail=str(e.detail))
+    claims = _local_port_claims(config)
+    for index, keys in touched.items():
+        for key in keys:
+            service = services.get(key)
+            if service is None or not service.localPort:
+                continue  # 已被同一批次中的后续操作删除，或端口分配失败
+            others = [c for c in claims[service.localPort] if c != key]
+            if others:
+                results[index] = BatchItemResult(
+                    index=index, ok=False,
+                    detail=f"本地端口 {service.localPort} 与 {_claim_name(others[0])} 冲突",
+                )
+                break
+
+    return BatchResult(applied=all(r.ok for r in results), results=results)
+
+def _apply_host_operation(config: Config, op: HostOperation) -> List[Tuple[str, str]]:
+    if op.op == 'delete':
+        _delete_host(config, op.hostName)
+        return []
+    if op.host is None:
+        raise HTTPException(status_code=400, detail=f"'{op.op}' 操作缺少 host 字段")
+    if op.op == 'create':
+        if op.hostName != op.host.hostName:
+            raise HTTPException(
+                status_code=400,
+                detail=f"hostName '{op.hostName}' 与 host.hostName '{op.host.hostName}' 不一致",
+            )
+        _add_host(config, op.host)
+        host = op.host
+    else:
+        host = _update_host(config, op.hostName, op.host)
+    return [(host.hostName, s.serviceName) for s in host.services]
+
+def _apply_service_operation(config: Config, op: ServiceOperation) -> List[Tuple[str, str]]:
+    if op.op == 'create':
+        if op.service is None:
+            raise HTTPException(status_code=400, detail="'create' 操作缺少 service 字段")
+        _add_service(config, op.hostName, op.service)
+        return [(op.hostName, op.service.serviceName)]
+    if not op.serviceName:
+        raise HTTPException(status_code=400, detail=f"'{op.op}' 操作缺少 serviceName 字段")
+    if op.op == 'delete':
+        _delete_service(config, op.hostName, op.serviceName)
+        return []
+    if op.service is None:
+        raise HTTPException(status_code=400, detail="'update' 操作缺少 service 字段")
+    _update_service(config, op.hostName, op.serviceName, op.service)
+    return [(op.hostName, op.service.serviceName)]
+
+
+# --- API Endpoints ---
+# 所有修改类接口都接受可选的 If-Match 头 (值为 GET /api/config 返回的 ETag)，
+# 版本不一致时返回 412；成功后响应头中带有新的 ETag。
+
+# 1. 获取所有配置
+@app.get("/api/config", response_model=Config, tags=["Config"],
+         responses={304: {"description": "配置未变化 (If-None-Match 命中)"}})
+async def api_get_config(accept_encoding: Optional[str] = Header(None),
+                         if_none_match: Optional[str] = Header(None)):
+    """获取完整的配置信息 (直接返回缓存的序列化结果，支持 gzip)"""
+    if if_none_match is not None:
+        version = await get_config_version()
+        if _etag_matches(if_none_match, version):
+            return Response(status_code=304, headers={"ETag": _format_etag(version)})
+
+    accept_gzip = accept_encoding is not None and 'gzip' in accept_encoding.lower()
+    version, body, gzipped = await get_config_response_body(accept_gzip)
+    headers = {"ETag": _format_etag(version), "Vary": "Accept-Encoding"}
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# 2. 【新增】保存完整配置 (用于拖拽排序)
+@app.put("/api/config", response_model=Config, tags=["Config"])
+async def api_update_config(config: Config, response: Response, if_match: Optional[str] = Header(None)):
+    """
+    接收一个完整的配置对象并覆盖保存。
+    未带 If-Match 时，若请求体中给出了 version，则以它作为预期版本。
+    """
+    if if_match is None and 'version' in config.model_fields_set:
+        if_match = _format_etag(config.version)
+
+    def apply(current: Config):
+        current.hosts = config.hosts
+        if 'groups' in config.model_fields_set:
+            current.groups = config.groups
+        if 'failover' in config.model_fields_set:
+            current.failover = config.failover
+        if 'prewarm' in config.model_fields_set:
+            current.prewarm = config.prewarm
+        if 'menuOrder' in config.model_fields_set:
+            current.menuOrder = config.menuOrder
+        for group in current.groups:
+            _validate_group(current, group)
+        _validate_failover(current)
+        return current
+
+    try:
+        return await _mutate_config(apply, if_match, response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"保存配置失败: {e}")
+
+# 3. 添加新主机
+@app.post("/api/hosts", response_model=Host, tags=["Hosts"])
+async def api_add_host(host: Host, response: Response, if_match: Optional[str] = Header(None)):
+    """添加一个新主机"""
+    await _mutate_config(lambda config: _add_host(config, host), if_match, response)
+    return host
+
+# 4. 删除主机
+@app.delete("/api/hosts/{host_name}", response_model=dict, tags=["Hosts"])
+async def api_delete_host(host_name: str, response: Response, if_match: Optional[str] = Header(None)):
+    """根据主机名删除一个主机"""
+    await _mutate_config(lambda config: _delete_host(config, host_name), if_match, response)
+    return {"message": f"主机 '{host_name}' 已删除"}
+
+# 5. 添加新服务
+@app.post("/api/hosts/{host_name}/services", response_model=Service, tags=["Services"])
+async def api_add_service(host_name: str, service: Service, response: Response,
+                          if_match: Optional[str] = Header(None)):
+    """为指定的主机添加一个新服务"""
+    await _mutate_config(lambda config: _add_service(config, host_name, service), if_match, response)
+    return service
+
+# 6. 删除服务
+@app.delete("/api/hosts/{host_name}/services/{service_name}", response_model=dict, tags=["Services"])
+async def api_delete_service(host_name: str, service_name: str, response: Response,
+                             if_match: Optional[str] = Header(None)):
+    """删除指定主机下的指定服务"""
+    await _mutate_config(lambda config: _delete_service(config, host_name, service_name), if_match, response)
+    return {"message": f"服务 '{service_name}' 已从 '{host_name}' 删除"}
+
+# 7. 修改服务
+@app.put("/api/hosts/{host_name}/services/{original_service_name}", response_model=Service, tags=["Services"])
+async def api_update_service(host_name: str, original_service_name: str, updated_service: Service,
+                             response: Response, if_match: Optional[str] = Header(None)):
+    """修改指定主机下的指定服务"""
+    await _mutate_config(
+        lambda config: _update_service(config, host_name, original_service_name, updated_service),
+        if_match, response,
+    )
+    return updated_service
+
+class _BatchRejected(Exception):
+    """批量操作中有失败项，整批不保存"""
+    def __init__(self, result: BatchResult):
+        self.result = result
+
+async def _run_batch(operations: list, apply_one, if_match: Optional[str], response: Response):
+    busy_ports = await _busy_local_ports()
+
+    def apply(config: Config) -> BatchResult:
+        result = _apply_batch(config, operations, apply_one, busy_ports)
+        if not result.applied:
+            raise _BatchRejected(result)
+        return result
+
+    try:
+        return await _mutate_config(apply, if_match, response, busy_ports)
+    except _BatchRejected as e:
+        return JSONResponse(status_code=400, content=e.result.model_dump())
+
+# 8. 批量增删改主机
+@app.post("/api/hosts/batch", response_model=BatchResult, tags=["Hosts"],
+          responses={400: {"model": BatchResult}})
+async def api_batch_hosts(operations: List[HostOperation], response: Response,
+                          if_match: Optional[str] = Header(None)):
+    """
+    批量创建/修改/删除主机。所有操作一起校验 (重名、本地端口冲突)，
+    全部成功才一次性保存；否则不做任何修改并返回 400 及逐条结果。
+    """
+    return await _run_batch(operations, _apply_host_operation, if_match, response)
+
+# 9. 批量增删改服务
+@app.post("/api/services/batch", response_model=BatchResult, tags=["Services"],
+          responses={400: {"model": BatchResult}})
+async def api_batch_services(operations: List[ServiceOperation], response: Response,
+                             if_match: Optional[str] = Header(None)):
+    """批量创建/修改/删除服务 (可跨主机)，规则同 /api/hosts/batch"""
+    return await _run_batch(operations, _apply_service_operation, if_match, response)
+
+
+# 10. 本地端口冲突
+@app.get("/api/ports/conflicts", response_model=List[PortConflict], tags=["Config"])
+async def api_port_conflicts():
+    """列出配置中被多个服务同时占用的本地端口"""
+    config = await get_config()
+    return [
+        PortConflict(localPort=port, services=[ServiceRef(hostName=h, serviceName=s) for h, s in owners])
+        for port, owners in sorted(_port_conflicts(config).items())
+    ]
+
+# 11. 为主机建议下一个可用本地端口
+@app.get("/api/hosts/{host_name}/next-port", response_model=dict, tags=["Hosts"])
+async def api_next_local_port(host_name: str):
+    """按主机的端口范围返回下一个可自动分配的本地端口 (不保存)"""
+    config = await get_config()
+    probe = Service(serviceName="", remotePort=0, localPort=0, autoOpenUrl=False, urlTemplate="")
+    _find_host(config, host_name).services.append(probe)
+    _assign_local_ports(config, await _busy_local_ports())
+    return {"localPort": probe.localPort}
+
+# 12. 主机可达性 / 延迟
+@app.get("/api/hosts/status", response_model=Dict[str, HostStatus], tags=["Hosts"])
+async def api_host_status(refresh: bool = False):
+    """
+    并发探测所有主机的 SSH 端口 (TCP 连接)，返回 {主机名: 状态}。
+    结果有 TTL 缓存，refresh=true 时强制重新探测。
+    """
+    config = await get_config()
+    return await probe_hosts_cached([h.model_dump() for h in config.hosts], refresh=refresh)
+
+# 13. 远程服务发现
+@app.get("/api/hosts/discover", response_model=Dict[str, HostDiscovery], tags=["Hosts"])
+async def api_discover_services(host: Optional[List[str]] = Query(None), refresh: bool = False):
+    """
+    列出主机 (?host=a&host=b，默认全部) 上监听中的 TCP 端口：每台主机一次 ssh，多台并发执行，
+    结果有 TTL 缓存 (refresh=true 时重新连接)。suggestions 为尚未配置的端口，可直接用于添加服务。
+    """
+    config = await get_config()
+    hosts = [_find_host(config, name) for name in host] if host else config.hosts
+    host_dicts = [h.model_dump() for h in hosts]
+    results = await discover_hosts_cached(host_dicts, refresh=refresh)
+    return {
+        h['hostName']: {**results[h['hostName']], 'suggestions': suggest_services(h, results[h['hostName']])}
+        for h in host_dicts
+    }
+
+def _tunnel_info(tunnel: dict) -> TunnelInfo:
+    return TunnelInfo(
+        pid=tunnel['pid'],
+        hostName=tunnel['hostName'],
+        services=tunnel['services'],
+        destination=tunnel['destination'],
+        sshPort=tunnel['sshPort'],
+        forwards=[TunnelForward(localPort=l, remotePort=r) for l, r in tunnel['forwards']],
+    )
+
+# 14. 列出运行中的隧道
+@app.get("/api/tunnels", response_model=List[TunnelInfo], tags=["Tunnels"])
+async def api_list_tunnels(hostName: Optional[str] = None, serviceName: Optional[str] = None,
+                           localPort: Optional[int] = None):
+    """扫描进程表，列出由本工具启动的隧道 (可按主机/服务/本地端口筛选)"""
+    config = (await get_config()).model_dump()
+    tunnels = await asyncio.to_thread(find_tunnels, config, hostName, serviceName, localPort)
+    return [_tunnel_info(t) for t in tunnels]
+
+# 15. 批量关闭隧道
+@app.post("/api/tunnels/stop", response_model=TunnelStopResult, tags=["Tunnels"])
+async def api_stop_tunnels(request: TunnelStopRequest):
+    """
+    按主机/服务/本地端口筛选并关闭隧道 (均为空时关闭全部)。
+    同时向所有目标发送 SIGTERM，等待 timeout 秒后强制结束仍未退出的进程。
+    """
+    config = (await get_config()).model_dump()
+
+    def stop():
+        tunnels = find_tunnels(config, request.hostName, request.serviceName, request.localPort)
+        return len(tunnels), stop_tunnels(tunnels, timeout=request.timeout)
+
+    matched, result = await asyncio.to_thread(stop)
+    return TunnelStopResult(matched=matched, **result)
+
+# 16. 声明式收敛
+@app.post("/api/tunnels/reconcile", response_model=ReconcileResult, tags=["Tunnels"])
+async def api_reconcile_tunnels(request: ReconcileRequest):
+    """
+    让运行中的隧道收敛到 desired：只启动缺少的、只关闭多余的，已符合的隧道不受影响；关闭与启动并行进行。
+    dryRun 为 true 时只返回计划；desired 中有配置里不存在的服务时返回 404，不做任何修改。
+    """
+    config = (await get_config()).model_dump()
+    desired = [m.model_dump() for m in request.desired]
+    result = await asyncio.to_thread(reconcile, config, desired, request.timeout, request.dryRun)
+    if result['missing'] and not request.dryRun:
+        names = ", ".join(f"{m['hostName']}/{m['serviceName']}" for m in result['missing'])
+        raise HTTPException(status_code=404, detail=f"配置中不存在: {names}，未做任何修改")
+    stopped = result.get('stopped')
+    return ReconcileResult(
+        start=[PlannedForward(**item) for item in result['start']],
+        stop=[_tunnel_info(t) for t in result['stop']],
+        restart=[_tunnel_info(t) for t in result['restart']],
+        keep=result['keep'],
+        unmanaged=[_tunnel_info(t) for t in result['unmanaged']],
+        missing=result['missing'],
+        started=[GroupMemberResult(**r) for r in result.get('started', [])],
+        stopped=TunnelStopResult(matched=len(result['stop']) + len(result['restart']), **stopped) if stopped else None,
+    )
+
+# 17. 隧道生命周期事件
+@app.get("/api/tunnels/events", response_model=List[TunnelEvent], tags=["Tunnels"])
+async def api_tunnel_events(limit: int = 100, pid: Optional[int] = None):
+    """最近的隧道生命周期事件 (spawn / ready / failure / exit / stop / reap)，按时间从旧到新"""
+    return await asyncio.to_thread(read_events, limit, pid)
+
+# 18. 隧道的 stderr
+@app.get("/api/tunnels/{pid}/stderr", response_model=TunnelStderr, tags=["Tunnels"])
+async def api_tunnel_stderr(pid: int, lines: int = 50):
+    """读取一个运行中隧道的 stderr 最后几行 (已退出隧道的输出见 exit/failure 事件)"""
+    tunnel = find_registered_tunnel(pid)
+    if tunnel is None:
+        raise HTTPException(status_code=404, detail="未找到该 PID 对应的隧道")
+    return TunnelStderr(pid=pid, lines=read_stderr(tunnel['id'], lines))
+
+# 19. 添加隧道组
+@app.post("/api/groups", response_model=TunnelGroup, tags=["Groups"])
+async def api_add_group(group: TunnelGroup, response: Response, if_match: Optional[str] = Header(None)):
+    """添加一个隧道组，成员为已存在的 (主机, 服务)"""
+    await _mutate_config(lambda config: _add_group(config, group), if_match, response)
+    return group
+
+# 20. 修改隧道组
+@app.put("/api/groups/{group_name}", response_model=TunnelGroup, tags=["Groups"])
+async def api_update_group(group_name: str, group: TunnelGroup, response: Response,
+                           if_match: Optional[str] = Header(None)):
+    """整体替换一个隧道组 (可改名)"""
+    await _mutate_config(lambda config: _update_group(config, group_name, group), if_match, response)
+    return group
+
+# 21. 删除隧道组
+@app.delete("/api/groups/{group_name}", response_model=dict, tags=["Groups"])
+async def api_delete_group(group_name: str, response: Response, if_match: Optional[str] = Header(None)):
+    """删除一个隧道组 (不影响其中的主机和服务)"""
+    await _mutate_config(lambda config: _delete_group(config, group_name), if_match, response)
+    return {"message": f"隧道组 '{group_name}' 已删除"}
+
+# 22. 启动隧道组
+@app.post("/api/groups/{group_name}/start", response_model=List[GroupMemberResult], tags=["Groups"])
+async def api_start_group(group_name: str):
+    """
+    并行启动隧道组中的所有服务：同一主机上的成员合并为一个 ssh 进程 (多个 -L)，
+    已在运行的成员会被跳过。
+    """
+    config = await get_config()
+    _find_group(config, group_name)
+    results = await asyncio.to_thread(start_group, config.model_dump(), group_name)
+    return [GroupMemberResult(**r) for r in results]
+
+# 23. 关闭隧道组
+@app.post("/api/groups/{group_name}/stop", response_model=TunnelStopResult, tags=["Groups"])
+async def api_stop_group(group_name: str, request: Optional[GroupStopRequest] = None):
+    """关闭隧道组中所有成员的隧道 (与成员共用 ssh 进程的其他转发也会一并关闭)"""
+    config = await get_config()
+    _find_group(config, group_name)
+    timeout = request.timeout if request else 3.0
+    result = await asyncio.to_thread(stop_group, config.model_dump(), group_name, timeout)
+    return TunnelStopResult(**result)
+
+# 24. 多主机故障转移状态
+@app.get("/api/failover", response_model=List[FailoverStatus], tags=["Tunnels"])
+async def api_failover_status():
+    """每个故障转移服务当前转发的主机和最近的切换记录 (切换由 ssh.py --failover 完成)"""
+    config = (await get_config()).model_dump()
+    return await asyncio.to_thread(failover_status, config)
+
+
+# --- 静态文件服务 (前端 UI) ---
+@app.get("/", response_class=HTMLResponse, include_in_schema=False)
+@app.get("/index.html", response_class=HTMLResponse, include_in_schema=False)
+async def get_index():
+    """提供 index.html 前端页面"""
+    file_path = SCRIPT_DIR / "index.html" # 【修改】
+    if not file_path.exists(): # 【修改】
+        return HTMLResponse(content=f"<h1>错误：未找到 {file_path.name}</h1>", status_code=500)
+    async with aiofiles.open(file_path, 'r', encoding='utf-8') as f: # 【修改】
+        return HTMLResponse(content=await f.read())
+
+@app.get("/app.js", include_in_schema=False)
+async def get_js():
+    """提供 app.js 前端逻辑"""
+    file_path = SCRIPT_DIR / "app.js" # 【修改】
+    if not file_path.exists(): # 【修改】
+        return JSONResponse(content={"error": f"未找到 {file_path.name}"}, status_code=500)
+    async with aiofiles.open(file_path, 'r', encoding='utf-8') as f: # 【修改】
+        content = await f.read()
+        return HTMLResponse(content=content, media_type="application/javascript")
+
+
+@app.get("/style.css", include_in_schema=False)
+async def get_style_css(): # 【修改】函数名
+    """提供独立的 style.css 文件"""
+    css_path = SCRIPT_DIR / "style.css" # 【修改】
+    if not css_path.exists(): # 【修改】
+        # 提供一个兜底，以防文件丢失
+        return HTMLResponse(content="/* 错误: 未找到 style.css */", media_type="text/css", status_code=404)
+    return FileResponse(css_path)
+
+@app.get("/button.css", include_in_schema=False)
+async def get_button_css(): # 【修改】函数名
+    """提供独立的 button.css 文件"""
+    css_path = SCRIPT_DIR / "button.css" # 【修改】
+    if not css_path.exists(): # 【修改】
+        return HTMLResponse(content="/* 错误: 未找到 button.css */", media_type="text/css", status_code=404)
+    return FileResponse(css_path)
+
+# --- 服务方式：TCP / Unix socket / systemd socket 激活，可选空闲退出 ---
+
+SD_LISTEN_FDS_START = 3     # systemd 传入的第一个套接字固定为文件描述符 3
+IDLE_CHECK_INTERVAL = 5.0   # 检查是否空闲的间隔 (秒)
+
+def _systemd_listen_socket() -> Optional[socket.socket]:
+    """
+    以 systemd socket 激活方式启动时 (LISTEN_PID 为本进程且 LISTEN_FDS >= 1)
+    返回 systemd 传入的监听套接字，否则返回 None。
+    """
+    try:
+        if int(os.environ.get('LISTEN_PID', 0)) != os.getpid():
+            return None
+        count = int(os.environ.get('LISTEN_FDS', 0))
+    except ValueError:
+        return None
+    # 这些变量只对本进程有效，不能被 ssh 等子进程继承
+    for name in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+        os.environ.pop(name, None)
+    if count < 1:
+        return None
+    # 地址族/类型从文件描述符自动识别 (TCP 或 Unix socket 均可)
+    return socket.socket(fileno=SD_LISTEN_FDS_START)
+
+
+class IdleExit:
+    """
+    包装 ASGI 应用：记录进行中的请求数和最后一次请求结束的时间，
+    没有请求且空闲超过 timeout 秒后让服务器正常退出。
+    只在启用空闲退出时包装，平时的请求不经过这一层。
+    """
+    def __init__(self, app, timeout: float):
+        self.app = app
+        self.timeout = timeout
+        self.active = 0
+        self.last_activity = time.monotonic()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        self.active += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.active -= 1
+            self.last_activity = time.monotonic()
+
+    async def watch(self, server):
+        while not server.should_exit:
+            await asyncio.sleep(min(self.timeout, IDLE_CHECK_INTERVAL))
+            if self.active == 0 and time.monotonic() - self.last_activity >= self.timeout:
+                print(f"💤 已空闲 {self.timeout:g} 秒，退出 Web UI")
+                server.should_exit = True
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, uds: Optional[str] = None, idle_timeout: float = 0):
+    """
+    启动 Web 服务器。优先使用 systemd 传入的套接字，其次是 Unix socket (uds)，最后是 TCP host:port。
+    idle_timeout > 0 时空闲这么多秒后退出；配合 socket 激活，下一个请求会由 systemd 重新拉起服务。
+    """
+    import uvicorn
+
+    listen_socket = _systemd_listen_socket()
+    asgi_app = IdleExit(app, idle_timeout) if idle_timeout > 0 else app
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host=host, port=port, uds=uds))
+
+    if listen_socket is not None:
+        print(f"--- 使用 systemd 传入的套接字: {listen_socket.getsockname() or '(未命名)'} ---")
+    elif uds:
+        print(f"--- 服务器运行在 Unix socket {uds} ---")
+    else:
+        print(f"--- 服务器运行在 http://{host}:{port} ---")
+    if idle_timeout > 0:
+        print(f"--- 空闲 {idle_timeout:g} 秒后自动退出 ---")
+
+    async def run():
+        watcher = asyncio.create_task(asgi_app.watch(server)) if idle_timeout > 0 else None
+        try:
+            await server.serve(sockets=[listen_socket] if listen_socket is not None else None)
+        finally:
+            if watcher:
+                watcher.cancel()
+
+    asyncio.run(run())
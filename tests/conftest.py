@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""测试公共设置：让测试直接导入仓库根目录下的模块，并把状态目录指向临时目录 (不读写 ~/.cache 下的真实状态)"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# 各模块在导入时根据 SSHTF_STATE_DIR 计算状态文件路径，必须在导入任何 sshtf_* 模块之前设置
+os.environ['SSHTF_STATE_DIR'] = tempfile.mkdtemp(prefix='sshtf-test-')
+
+
+# --- 测试数据工厂 (各测试文件通过 from conftest import ... 共用) ---
+
+def service(name, remote_port, local_port=0, **extra):
+    """config.json 中的一个服务；extra 为额外字段 (如 idleTimeout)"""
+    return {'serviceName': name, 'remotePort': remote_port, 'localPort': local_port,
+            'autoOpenUrl': False, 'urlTemplate': '', **extra}
+
+
+def tunnel(pid, destination, *forwards, ssh_port=22):
+    """一条已登记的隧道记录，forwards 为 (本地端口, 远程端口)"""
+    return {'pid': pid, 'destination': destination, 'sshPort': ssh_port, 'forwards': list(forwards)}
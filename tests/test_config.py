@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from conftest import service
+from sshtf_config import ConfigError, assign_local_ports, validate_config
+
+
+def host(name, *services, port_range=None):
+    h = {'hostName': name, 'serverIP': '10.0.0.1', 'sshUser': 'root', 'services': list(services)}
+    if port_range:
+        h['localPortRange'] = {'start': port_range[0], 'end': port_range[1]}
+    return h
+
+
+# --- 本地端口分配 ---
+
+def test_assign_local_ports_skips_claimed_and_busy_ports():
+    config = {'hosts': [
+        host('a', service('ssh', 22, 20000), service('http', 80), port_range=(20000, 20005)),
+        host('b', service('ssh', 22), service('http', 80), port_range=(20000, 20005)),
+    ], 'failover': [{'serviceName': 'api', 'remotePort': 8000, 'localPort': 20002, 'hosts': ['a']}]}
+    assign_local_ports(config, busy={20001})
+    ports = [s['localPort'] for h in config['hosts'] for s in h['services']]
+    assert ports == [20000, 20003, 20004, 20005]
+
+
+def test_assign_local_ports_uses_default_range():
+    config = {'hosts': [host('a', service('ssh', 22))]}
+    assign_local_ports(config)
+    assert config['hosts'][0]['services'][0]['localPort'] == 20000
+
+
+def test_assign_local_ports_fails_when_range_is_exhausted():
+    config = {'hosts': [host('a', service('ssh', 22, 20000), service('http', 80), port_range=(20000, 20000))]}
+    with pytest.raises(ConfigError, match='20000-20000'):
+        assign_local_ports(config)
+
+
+# --- 校验 ---
+
+def test_validate_config_accepts_valid_config():
+    config = {'hosts': [host('a', service('ssh', 22, 20000))],
+              'failover': [{'serviceName': 'api', 'remotePort': 8000, 'localPort': 20001, 'hosts': ['a']}]}
+    assert validate_config(config) == []
+
+
+def test_validate_config_reports_field_errors():
+    problems = validate_config({'hosts': [{'hostName': 'a', 'serverIP': '10.0.0.1'}]})
+    assert problems == ['hosts.0.sshUser: Field required']
+
+
+def test_validate_config_reports_duplicates_and_port_conflicts():
+    config = {'hosts': [
+        host('a', service('ssh', 22, 20000), service('ssh', 2222, 20001)),
+        host('a'),
+        host('b', service('http', 80, 20000)),
+    ], 'failover': [{'serviceName': 'api', 'remotePort': 8000, 'localPort': 20001, 'hosts': ['a']}]}
+    problems = validate_config(config)
+    assert "主机 'a' 下重复的服务名: ssh" in problems
+    assert "重复的主机名: a" in problems
+    assert "本地端口 20000 被多个服务占用: a/ssh、b/http" in problems
+    assert "本地端口 20001 被多个服务占用: a/ssh、故障转移 api" in problems
+
+
+def test_validate_config_reports_unknown_failover_hosts():
+    config = {'hosts': [host('a', service('ssh', 22, 20000))],
+              'failover': [{'serviceName': 'api', 'remotePort': 8000, 'localPort': 20001, 'hosts': ['a', 'z']},
+                           {'serviceName': 'empty', 'remotePort': 8000, 'localPort': 20002, 'hosts': []}]}
+    problems = validate_config(config)
+    assert "故障转移服务 'api' 的候选主机不存在: z" in problems
+    assert "故障转移服务 'empty' 没有候选主机" in problems
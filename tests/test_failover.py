@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import sshtf_failover
+from sshtf_failover import _record_active, rank_candidates, start_failover, watch_failover
+
+
+def host(name, ip):
+    return {'hostName': name, 'serverIP': ip, 'sshUser': 'root', 'services': []}
+
+
+API = {'serviceName': 'api', 'remotePort': 8000, 'localPort': 20800, 'hosts': ['a', 'b', 'c', 'gone']}
+CONFIG = {'hosts': [host('a', '10.0.0.1'), host('b', '10.0.0.2'), host('c', '10.0.0.3')], 'failover': [API]}
+
+
+def probe(ok, latency=None):
+    return {'ok': ok, 'latencyMs': latency, 'error': None if ok else 'timed out'}
+
+
+@pytest.fixture
+def world(tmp_path, monkeypatch):
+    """探测结果、哪些主机上启动隧道会失败，以及记录下来的启动和事件"""
+    state = {'probes': {'a': probe(True, 40.0), 'b': probe(True, 10.0), 'c': probe(False)},
+             'broken': set(), 'started': [], 'events': []}
+
+    def fake_probe(hosts, refresh=False):
+        assert refresh
+        return {h['hostName']: state['probes'][h['hostName']] for h in hosts}
+
+    def fake_start_forwards(config, wanted, busy_ports=None, running=None):
+        w = wanted[0]
+        state['started'].append(w['hostName'])
+        if w['hostName'] in state['broken']:
+            return [{**w, 'pid': None, 'status': 'failed', 'error': 'Connection refused'}]
+        return [{**w, 'pid': 100 + len(state['started']), 'status': 'started', 'error': None}]
+
+    monkeypatch.setattr(sshtf_failover, 'probe_hosts_sync', fake_probe)
+    monkeypatch.setattr(sshtf_failover, 'start_forwards', fake_start_forwards)
+    monkeypatch.setattr(sshtf_failover, 'log_event', lambda event, **fields: state['events'].append((event, fields)))
+    monkeypatch.setattr(sshtf_failover, 'FAILOVER_STATE_PATH', tmp_path / 'failover.json')
+    return state
+
+
+def test_rank_candidates_orders_reachable_hosts_by_latency(world):
+    world['probes']['a'] = probe(True, 10.0)
+    ranked = rank_candidates(CONFIG, API)
+    assert [(c['hostName'], c['ok']) for c in ranked] == [('a', True), ('b', True), ('c', False), ('gone', False)]
+    assert ranked[3]['error'] == '配置中不存在该主机'
+
+
+def test_start_failover_tries_the_next_host_when_starting_fails(world):
+    world['broken'] = {'b'}
+    result = start_failover(CONFIG, API, tunnels=[])
+    assert world['started'] == ['b', 'a']
+    assert result['status'] == 'started'
+    assert result['hostName'] == 'a'
+    assert result['localPort'] == 20800
+    assert result['tried'] == [{'hostName': 'b', 'error': 'Connection refused'}]
+
+
+def test_start_failover_prefers_hosts_other_than_the_one_that_dropped(world):
+    assert start_failover(CONFIG, API, exclude=['b'], tunnels=[])['hostName'] == 'a'
+    world['broken'] = {'a'}
+    assert start_failover(CONFIG, API, exclude=['b'], tunnels=[])['hostName'] == 'b'
+
+
+def test_start_failover_reuses_a_running_tunnel(world):
+    running = [{'pid': 7, 'destination': 'root@10.0.0.3', 'sshPort': 22, 'forwards': [(20800, 8000)]}]
+    result = start_failover(CONFIG, API, tunnels=running)
+    assert (result['status'], result['hostName'], result['pid']) == ('running', 'c', 7)
+    assert world['started'] == []
+
+
+def test_start_failover_fails_when_no_host_is_usable(world):
+    world['broken'] = {'a', 'b'}
+    result = start_failover(CONFIG, API, tunnels=[])
+    assert result['status'] == 'failed'
+    assert result['error'] == '没有可用的候选主机'
+    assert [t['hostName'] for t in result['tried']] == ['b', 'a', 'c', 'gone']
+
+
+def test_record_active_logs_a_switch_only_when_the_host_changes(world):
+    state = {}
+    first = {'serviceName': 'api', 'hostName': 'a', 'pid': 1, 'latencyMs': 40.0, 'localPort': 20800}
+    _record_active(state, first)
+    _record_active(state, {**first, 'pid': 2}, reason='exit')  # 同一主机上重新启动
+    assert world['events'] == []
+    assert 'switches' not in state['api']
+
+    _record_active(state, {**first, 'hostName': 'b', 'pid': 3, 'latencyMs': 10.0}, reason='exit')
+    assert state['api']['hostName'] == 'b'
+    assert [(s['fromHost'], s['toHost'], s['reason']) for s in state['api']['switches']] == [('a', 'b', 'exit')]
+    assert world['events'] == [('switch', {'pid': 3, 'serviceName': 'api', 'localPort': 20800, 'fromHost': 'a',
+                                           'toHost': 'b', 'latencyMs': 10.0, 'reason': 'exit'})]
+
+
+def test_watch_failover_switches_hosts_after_the_tunnel_drops(world, monkeypatch):
+    scans = iter([
+        [],  # 第一轮：还没有隧道，启动到延迟最低的 b
+        [],  # 第二轮：b 上的隧道断开了
+    ])
+    monkeypatch.setattr(sshtf_failover, 'scan_tunnels', lambda: next(scans))
+    monkeypatch.setattr(sshtf_failover, 'read_events', lambda limit, pid=None: [])
+    monkeypatch.setattr(sshtf_failover, 'STOP_GRACE', 0)
+    messages = []
+    watch_failover(CONFIG, interval=0, notify=messages.append, rounds=2)
+    assert world['started'] == ['b', 'a']
+    assert sshtf_failover.load_failover_state()['api']['hostName'] == 'a'
+    assert messages[-1].startswith('🔀 api: 已从 b 切换到 a')
+    assert [e for e, _ in world['events']] == ['switch']
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import pytest
+
+import sshtf_core
+from conftest import service, tunnel
+from sshtf_config import validate_config
+from sshtf_core import start_group, stop_group
+
+
+CONFIG = {
+    'hosts': [
+        {'hostName': 'web', 'serverIP': '10.0.0.1', 'sshUser': 'root',
+         'services': [service('http', 80, 20080), service('admin', 8080, 20081)]},
+        {'hostName': 'db', 'serverIP': '10.0.0.2', 'sshUser': 'root', 'sshPort': 2222,
+         'services': [service('pg', 5432, 20432)]},
+    ],
+    'groups': [
+        {'groupName': 'all', 'members': [
+            {'hostName': 'web', 'serviceName': 'http'}, {'hostName': 'web', 'serviceName': 'admin'},
+            {'hostName': 'db', 'serviceName': 'pg'}, {'hostName': 'db', 'serviceName': 'gone'},
+        ]},
+        {'groupName': 'web', 'members': [{'hostName': 'web', 'serviceName': 'http'}]},
+    ],
+}
+
+
+@pytest.fixture
+def launches(monkeypatch):
+    """替换真正启动 ssh 的部分，记录每次启动的 (主机名, 转发列表)"""
+    launched = []
+
+    def fake_launch(host, forwards):
+        launched.append((host['hostName'], list(forwards)))
+        return SimpleNamespace(pid=1000 + len(launched), host=host)
+
+    def fake_wait(process, forwards):
+        status = 'failed' if process.host.get('fail') else 'ready'
+        return {'status': status, 'pid': process.pid, 'elapsedMs': 1, 'exitCode': 255, 'stderr': ['denied']}
+
+    monkeypatch.setattr(sshtf_core, 'launch_tunnel', fake_launch)
+    monkeypatch.setattr(sshtf_core, 'wait_tunnel_ready', fake_wait)
+    monkeypatch.setattr(sshtf_core, 'record_use', lambda *args: None)
+    return launched
+
+
+def by_service(results):
+    return {(r['hostName'], r['serviceName']): r for r in results}
+
+
+def test_start_group_uses_one_process_per_host(launches):
+    results = by_service(start_group(CONFIG, 'all', busy_ports={20081}, running=[]))
+    assert sorted(launches) == [('db', [(20432, 5432)]), ('web', [(20080, 80), (20082, 8080)])]
+    assert results[('web', 'http')]['status'] == 'started'
+    assert results[('web', 'http')]['pid'] == results[('web', 'admin')]['pid']
+    assert results[('web', 'admin')]['localPort'] == 20082  # 首选端口被占用时递增
+    assert results[('db', 'gone')]['status'] == 'missing'
+
+
+def test_start_group_skips_members_that_are_already_running(launches):
+    running = [tunnel(42, 'root@10.0.0.2', (30000, 5432), ssh_port=2222)]
+    results = by_service(start_group(CONFIG, 'all', busy_ports=set(), running=running))
+    assert [host for host, _ in launches] == ['web']
+    assert results[('db', 'pg')] == {'hostName': 'db', 'serviceName': 'pg', 'remotePort': 5432,
+                                     'localPort': 30000, 'pid': 42, 'status': 'running', 'error': None}
+
+
+def test_start_group_reports_failed_hosts(launches):
+    config = {**CONFIG, 'hosts': [{**CONFIG['hosts'][0], 'fail': True}, CONFIG['hosts'][1]]}
+    results = by_service(start_group(config, 'all', busy_ports=set(), running=[]))
+    assert results[('web', 'http')]['status'] == 'failed'
+    assert results[('web', 'admin')]['status'] == 'failed'
+    assert results[('db', 'pg')]['status'] == 'started'
+
+
+def test_start_unknown_group_raises():
+    with pytest.raises(KeyError):
+        start_group(CONFIG, 'nope', busy_ports=set(), running=[])
+
+
+def test_stop_group_stops_processes_serving_any_member(monkeypatch):
+    stopped = []
+    monkeypatch.setattr(sshtf_core, 'stop_tunnels',
+                        lambda tunnels, timeout: stopped.extend(t['pid'] for t in tunnels) or
+                        {'terminated': [t['pid'] for t in tunnels], 'killed': [], 'failed': []})
+    running = [
+        tunnel(1, 'root@10.0.0.1', (20080, 80)),
+        tunnel(2, 'root@10.0.0.1', (20081, 8080)),
+        tunnel(3, 'root@10.0.0.2', (20432, 5432), ssh_port=2222),
+        tunnel(4, 'other@10.0.0.9', (20080, 80)),
+    ]
+    result = stop_group(CONFIG, 'web', tunnels=running)
+    assert stopped == [1]
+    assert result == {'matched': 1, 'terminated': [1], 'killed': [], 'failed': []}
+
+
+def test_validate_config_checks_group_members():
+    config = {'hosts': CONFIG['hosts'],
+              'groups': CONFIG['groups'] + [{'groupName': 'web', 'members': []}]}
+    problems = validate_config(config)
+    assert problems == ["隧道组 'all' 的成员不存在: db/gone", "重复的隧道组名: web"]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import shlex
+
+import pytest
+
+import sshtf_core
+from sshtf_core import jump_control_path, jump_proxy_command, parse_jump_chain
+
+
+def hop(address, port=22, user=None):
+    return {'sshUser': user, 'serverIP': address, 'sshPort': port}
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('bastion', [hop('bastion')]),
+    ('ops@bastion:2222', [hop('bastion', 2222, 'ops')]),
+    ('ssh://ops@bastion:2222', [hop('bastion', 2222, 'ops')]),
+    ('[::1]:2222', [hop('::1', 2222)]),
+    ('ops@[2001:db8::1]:2200', [hop('2001:db8::1', 2200, 'ops')]),
+    ('[fe80::1]', [hop('fe80::1')]),
+    ('2001:db8::1', [hop('2001:db8::1')]),  # 不带方括号的 IPv6 地址不能带端口
+    ('a@first:2201, second ,ops@[::1]:2222', [hop('first', 2201, 'a'), hop('second'), hop('::1', 2222, 'ops')]),
+    ('', []),
+    (None, []),
+])
+def test_parse_jump_chain(spec, expected):
+    assert parse_jump_chain(spec) == expected
+
+
+def test_equivalent_specs_share_one_control_path():
+    assert jump_control_path(parse_jump_chain('ops@[::1]:22')) == \
+        jump_control_path(parse_jump_chain('ssh://ops@[::1]'))
+    assert jump_control_path(parse_jump_chain('ops@[::1]:2222')) != \
+        jump_control_path(parse_jump_chain('ops@[::1]'))
+
+
+def test_proxy_command_brackets_ipv6_hops(tmp_path, monkeypatch):
+    monkeypatch.setattr(sshtf_core, 'CONTROL_DIR', tmp_path)
+    args = shlex.split(jump_proxy_command(parse_jump_chain('a@[2001:db8::1]:2201,ops@[::1]:2222')))
+    assert args[args.index('-p') + 1] == '2222'
+    assert args[args.index('-J') + 1] == 'a@[2001:db8::1]:2201'
+    assert args[-3:] == ['-W', '%h:%p', 'ops@::1']
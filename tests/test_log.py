@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import sshtf_log
+from sshtf_log import read_stderr, trim_stderr
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# 每个写入进程独立导入 sshtf_log，把上限调小以便频繁轮转，并保留足够多的历史文件用于核对
+WRITER = """
+import sys
+import sshtf_log
+sshtf_log.EVENTS_MAX_BYTES = 4096
+sshtf_log.EVENTS_BACKUP_COUNT = 1000
+writer = int(sys.argv[1])
+for n in range(int(sys.argv[2])):
+    sshtf_log.log_event('spawn', writer=writer, n=n, padding='x' * 40)
+"""
+
+
+# --- events.jsonl 轮转 ---
+
+def test_concurrent_writers_rotate_without_losing_events(tmp_path):
+    writers, per_writer = 4, 300
+    env = {'SSHTF_STATE_DIR': str(tmp_path), 'PATH': '/usr/bin:/bin'}
+    procs = [subprocess.Popen([sys.executable, '-c', WRITER, str(w), str(per_writer)], cwd=REPO_DIR, env=env)
+             for w in range(writers)]
+    for proc in procs:
+        assert proc.wait(timeout=60) == 0
+
+    files = sorted(tmp_path.glob('events.jsonl*'))
+    assert len(files) > 2  # 确实发生了多次轮转
+    seen = []
+    for path in files:
+        for line in path.read_text(encoding='utf-8').splitlines():
+            event = json.loads(line)  # 没有被截断或交错的行
+            seen.append((event['writer'], event['n']))
+    assert sorted(seen) == [(w, n) for w in range(writers) for n in range(per_writer)]
+
+
+def test_rotation_keeps_only_backup_count_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(sshtf_log, 'STATE_DIR', tmp_path)
+    monkeypatch.setattr(sshtf_log, 'EVENTS_PATH', tmp_path / 'events.jsonl')
+    monkeypatch.setattr(sshtf_log, 'EVENTS_LOCK_PATH', tmp_path / 'events.lock')
+    monkeypatch.setattr(sshtf_log, 'EVENTS_MAX_BYTES', 200)
+    monkeypatch.setattr(sshtf_log, 'EVENTS_BACKUP_COUNT', 2)
+    for n in range(50):
+        sshtf_log.log_event('exit', pid=n)
+
+    # 最后一次写入可能刚好触发轮转，此时当前文件尚未重新创建
+    names = {p.name for p in tmp_path.glob('events.jsonl*')}
+    assert {'events.jsonl.1', 'events.jsonl.2'} <= names <= {'events.jsonl', 'events.jsonl.1', 'events.jsonl.2'}
+    assert sshtf_log.read_events(limit=1)[0]['pid'] == 49
+
+
+# --- 每个隧道的 stderr ---
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(sshtf_log, 'TUNNEL_LOG_DIR', tmp_path)
+    return tmp_path
+
+
+def numbered_lines(start, count):
+    return b''.join(b'debug1: line %06d\n' % n for n in range(start, start + count))
+
+
+def test_trim_stderr_keeps_the_tail(log_dir):
+    path = log_dir / 't1.log'
+    path.write_bytes(numbered_lines(0, 5000))
+    assert path.stat().st_size > sshtf_log.STDERR_LOG_MAX_BYTES
+
+    trim_stderr('t1')
+    data = path.read_bytes()
+    assert len(data) == sshtf_log.STDERR_KEEP_BYTES
+    assert data.endswith(b'debug1: line 004999\n')
+    assert read_stderr('t1', lines=2) == ['debug1: line 004998', 'debug1: line 004999']
+
+
+def test_trim_stderr_leaves_small_logs_alone(log_dir):
+    path = log_dir / 't1.log'
+    path.write_bytes(numbered_lines(0, 10))
+    trim_stderr('t1')
+    assert path.read_bytes() == numbered_lines(0, 10)
+    trim_stderr('missing')  # 文件不存在时静默忽略
+
+
+def test_appending_writer_continues_after_trim(log_dir):
+    path = log_dir / 't1.log'
+    with open(path, 'ab') as ssh_stderr:  # 与 ssh 子进程一样以 O_APPEND 打开
+        ssh_stderr.write(numbered_lines(0, 5000))
+        ssh_stderr.flush()
+        trim_stderr('t1')
+        ssh_stderr.write(b'Connection closed by remote host\n')
+        ssh_stderr.flush()
+
+    data = path.read_bytes()
+    assert len(data) == sshtf_log.STDERR_KEEP_BYTES + len(b'Connection closed by remote host\n')
+    assert b'\0' not in data  # 没有因截断产生的空洞
+    assert read_stderr('t1', lines=1) == ['Connection closed by remote host']
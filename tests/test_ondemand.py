@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import socket
+import socketserver
+import threading
+
+import pytest
+
+import sshtf_ondemand
+from sshtf_ondemand import OnDemandPort, on_demand_services
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class EchoHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while data := self.request.recv(1024):
+            self.request.sendall(data.upper())
+
+
+@pytest.fixture
+def upstream():
+    """代替 ssh 转发的本地服务：把收到的数据转为大写后返回"""
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), EchoHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def starts(monkeypatch, upstream):
+    """替换隧道的启动：记录每次启动，隧道 "监听" 在 upstream 的端口上"""
+    calls = []
+
+    def fake_start_forwards(config, wanted, busy_ports=None, running=None, record=False):
+        assert running == []  # 不扫描进程表
+        calls.append(wanted)
+        if config.get('fail'):
+            return [{**w, 'pid': None, 'status': 'failed', 'error': 'Permission denied'} for w in wanted]
+        return [{**w, 'localPort': upstream, 'pid': 4242, 'status': 'started', 'error': None} for w in wanted]
+
+    monkeypatch.setattr(sshtf_ondemand, 'prewarm_supported', lambda: False)
+    monkeypatch.setattr(sshtf_ondemand, 'load_reaped', lambda: [])
+    monkeypatch.setattr(sshtf_ondemand, 'start_forwards', fake_start_forwards)
+    return calls
+
+
+def make_config(port, **extra):
+    return {'hosts': [{'hostName': 'web', 'serverIP': '10.0.0.1', 'sshUser': 'root', 'services': [
+        {'serviceName': 'http', 'remotePort': 80, 'localPort': port, 'onDemand': True},
+        {'serviceName': 'ssh', 'remotePort': 22, 'localPort': port + 1},
+    ]}], **extra}
+
+
+async def roundtrip(port: int, payload: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(payload)
+    writer.write_eof()
+    data = await asyncio.wait_for(reader.read(), 5)
+    writer.close()
+    return data
+
+
+def test_on_demand_services_filters_by_flag_and_host():
+    config = make_config(20080)
+    assert [s['serviceName'] for _, s in on_demand_services(config)] == ['http']
+    assert on_demand_services(config, ['db']) == []
+
+
+def test_first_connections_start_one_tunnel_and_are_spliced(starts):
+    config = make_config(free_port())
+    host, service = on_demand_services(config)[0]
+    messages = []
+
+    async def run():
+        port = OnDemandPort(config, host, service, notify=messages.append)
+        assert await port.listen()
+        replies = await asyncio.gather(*(roundtrip(port.port, f'hello {i}'.encode()) for i in range(3)))
+        assert not port.listening  # 端口已让给隧道
+        return replies
+
+    assert asyncio.run(run()) == [b'HELLO 0', b'HELLO 1', b'HELLO 2']
+    assert starts == [[{'hostName': 'web', 'serviceName': 'http', 'remotePort': 80, 'localPort': service['localPort']}]]
+    assert any('已按需启动隧道' in m for m in messages)
+
+
+def test_failed_start_closes_pending_connections(starts):
+    config = make_config(free_port(), fail=True)
+    host, service = on_demand_services(config)[0]
+    messages = []
+
+    async def run():
+        port = OnDemandPort(config, host, service, notify=messages.append)
+        assert await port.listen()
+        return await roundtrip(port.port, b'hello')
+
+    assert asyncio.run(run()) == b''
+    assert messages == ["❌ web/http: 启动隧道失败: Permission denied"]
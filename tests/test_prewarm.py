@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+import sshtf_core
+from sshtf_core import _cancel_mux_forwards, _launch_on_master
+
+fcntl = pytest.importorskip('fcntl')
+
+HOST = {'hostName': 'web', 'serverIP': '10.0.0.1', 'sshUser': 'root'}
+
+
+def masters_lock_is_free() -> bool:
+    with open(sshtf_core.STATE_DIR / 'masters.lock', 'a+b') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return True
+
+
+@pytest.fixture
+def master(tmp_path, monkeypatch):
+    """一个 "存活" 的预热主连接；记录 ssh -O 命令，以及执行时登记表的锁是否空闲"""
+    socket_path = tmp_path / 'cm'
+    socket_path.touch()
+    masters_path = tmp_path / 'masters.json'
+    masters_path.write_text(json.dumps({str(socket_path): {
+        'hostName': 'web', 'destination': 'root@10.0.0.1', 'sshPort': 22, 'pid': 4242,
+        'warmedAt': 0, 'lastUsed': 0, 'forwards': [[20080, 80]],
+    }}))
+    commands = []
+
+    def fake_mux_command(path, entry, command, forwards):
+        commands.append((command, [tuple(f) for f in forwards], masters_lock_is_free()))
+        return True
+
+    monkeypatch.setattr(sshtf_core, 'MASTERS_PATH', masters_path)
+    monkeypatch.setattr(sshtf_core, 'control_path', lambda host: str(socket_path))
+    monkeypatch.setattr(sshtf_core, '_master_alive', lambda path, entry: True)
+    monkeypatch.setattr(sshtf_core, '_mux_command', fake_mux_command)
+    return {'path': str(socket_path), 'registry': masters_path, 'commands': commands}
+
+
+def registered_forwards(master):
+    return json.loads(master['registry'].read_text())[master['path']]['forwards']
+
+
+def test_forward_is_added_outside_the_registry_lock(master):
+    tunnel = _launch_on_master(HOST, [(20081, 8080)])
+    assert tunnel.pid == 4242
+    assert master['commands'] == [('forward', [(20081, 8080)], True)]
+    assert registered_forwards(master) == [[20080, 80], [20081, 8080]]
+
+
+def test_cancel_runs_outside_the_registry_lock(master):
+    assert _cancel_mux_forwards(master['path'], [(20080, 80)])
+    assert master['commands'] == [('cancel', [(20080, 80)], True)]
+    assert registered_forwards(master) == []
+
+
+def test_forward_is_not_recorded_if_the_master_went_away(master, monkeypatch):
+    def master_closed_meanwhile(path, entry, command, forwards):
+        master['registry'].write_text('{}')
+        return True
+
+    monkeypatch.setattr(sshtf_core, '_mux_command', master_closed_meanwhile)
+    assert _launch_on_master(HOST, [(20081, 8080)]) is None
+    assert json.loads(master['registry'].read_text()) == {}
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import sshtf_core
+from conftest import service, tunnel
+from sshtf_core import load_reaped, reap_idle_tunnels, revive_reaped
+
+
+CONFIG = {'hosts': [{'hostName': 'web', 'serverIP': '10.0.0.1', 'sshUser': 'root', 'services': [
+    service('http', 80, 20080, idleTimeout=600),
+    service('admin', 8080, 20081, idleTimeout=60),
+    service('ssh', 22, 20022),
+]}]}
+
+
+def web_tunnel(pid, *forwards):
+    return tunnel(pid, 'root@10.0.0.1', *forwards)
+
+
+@pytest.fixture
+def system(tmp_path, monkeypatch):
+    """登记的隧道、其中有客户端连接的端口，以及被关闭的 PID，都由测试控制"""
+    state = {'tunnels': [], 'active': set(), 'stopped': []}
+    monkeypatch.setattr(sshtf_core, 'IDLE_STATE_PATH', tmp_path / 'idle.json')
+    monkeypatch.setattr(sshtf_core, 'REAPED_PATH', tmp_path / 'reaped.json')
+    monkeypatch.setattr(sshtf_core, '_tracked_tunnels', lambda: state['tunnels'])
+    monkeypatch.setattr(sshtf_core, '_active_local_ports', lambda pid, ports: ports & state['active'])
+    monkeypatch.setattr(sshtf_core, 'stop_tunnels', lambda tunnels: state['stopped'].extend(t['pid'] for t in tunnels))
+    monkeypatch.setattr(sshtf_core, 'log_event', lambda *args, **kwargs: None)
+    return state
+
+
+def test_idle_tunnel_is_reaped_after_its_timeout(system):
+    system['tunnels'] = [web_tunnel(1, (20080, 80))]
+    assert reap_idle_tunnels(CONFIG, now=1000) == []  # 第一次见到时从现在开始计时
+    assert reap_idle_tunnels(CONFIG, now=1599) == []
+    reaped = reap_idle_tunnels(CONFIG, now=1600)
+    assert system['stopped'] == [1]
+    assert reaped == [{'hostName': 'web', 'serviceName': 'http', 'localPort': 20080, 'remotePort': 80,
+                       'reapedAt': 1600, 'idleSeconds': 600}]
+    assert load_reaped() == [{'hostName': 'web', 'serviceName': 'http', 'localPort': 20080, 'remotePort': 80,
+                              'reapedAt': 1600}]
+
+
+def test_client_activity_resets_the_idle_timer(system):
+    system['tunnels'] = [web_tunnel(1, (20080, 80))]
+    reap_idle_tunnels(CONFIG, now=1000)
+    system['active'] = {20080}
+    reap_idle_tunnels(CONFIG, now=1500)
+    system['active'] = set()
+    assert reap_idle_tunnels(CONFIG, now=2000) == []
+    assert len(reap_idle_tunnels(CONFIG, now=2100)) == 1
+
+
+def test_process_is_kept_while_any_forward_is_busy_or_has_no_timeout(system):
+    system['tunnels'] = [web_tunnel(1, (20080, 80), (20081, 8080)), web_tunnel(2, (20081, 8080), (20022, 22))]
+    reap_idle_tunnels(CONFIG, now=0)
+    system['active'] = {20080}
+    assert reap_idle_tunnels(CONFIG, now=700) == []
+    assert system['stopped'] == []
+    system['active'] = set()
+    reaped = reap_idle_tunnels(CONFIG, now=1400)
+    assert system['stopped'] == [1]  # PID 2 中的 ssh 服务没有设置 idleTimeout
+    assert [e['serviceName'] for e in reaped] == ['http', 'admin']
+
+
+def test_revive_reaped_reopens_on_the_previous_port(system, monkeypatch):
+    system['tunnels'] = [web_tunnel(1, (20081, 8080))]
+    reap_idle_tunnels(CONFIG, now=0)
+    reap_idle_tunnels(CONFIG, now=60)
+    calls = []
+
+    def fake_start_forwards(config, wanted, busy_ports=None, running=None, record=False):
+        calls.append(wanted)
+        return [{**w, 'pid': 7, 'status': 'started', 'error': None} for w in wanted]
+
+    monkeypatch.setattr(sshtf_core, 'start_forwards', fake_start_forwards)
+    results = revive_reaped(CONFIG, host_name='web')
+    assert calls == [[{'hostName': 'web', 'serviceName': 'admin', 'remotePort': 8080,
+                       'localPort': 20081, 'previousPort': 20081}]]
+    assert results[0]['status'] == 'started'
+    assert load_reaped() == []
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import sshtf_core
+from conftest import service, tunnel
+from sshtf_core import plan_reconcile, reconcile
+
+
+CONFIG = {'hosts': [
+    {'hostName': 'web', 'serverIP': '10.0.0.1', 'sshUser': 'root',
+     'services': [service('http', 80, 20080), service('admin', 8080, 20081)]},
+    {'hostName': 'db', 'serverIP': '10.0.0.2', 'sshUser': 'root',
+     'services': [service('pg', 5432, 20432)]},
+]}
+
+
+def want(*keys):
+    return [{'hostName': h, 'serviceName': s} for h, s in keys]
+
+
+def pids(tunnels):
+    return [t['pid'] for t in tunnels]
+
+
+def test_starts_missing_forwards_and_keeps_running_ones():
+    running = [tunnel(1, 'root@10.0.0.1', (20080, 80))]
+    plan = plan_reconcile(CONFIG, want(('web', 'http'), ('db', 'pg')), tunnels=running)
+    assert plan['keep'] == want(('web', 'http'))
+    assert plan['start'] == [{'hostName': 'db', 'serviceName': 'pg', 'remotePort': 5432, 'localPort': 20432}]
+    assert plan['stop'] == plan['restart'] == plan['missing'] == []
+
+
+def test_stops_surplus_and_duplicate_tunnels():
+    running = [
+        tunnel(1, 'root@10.0.0.1', (20080, 80)),
+        tunnel(2, 'root@10.0.0.1', (30080, 80)),  # 重复
+        tunnel(3, 'root@10.0.0.2', (20432, 5432)),  # 不再需要
+    ]
+    plan = plan_reconcile(CONFIG, want(('web', 'http')), tunnels=running)
+    assert plan['keep'] == want(('web', 'http'))
+    assert pids(plan['stop']) == [2, 3]
+    assert plan['start'] == []
+
+
+def test_restarts_mixed_process_on_the_same_ports():
+    running = [tunnel(1, 'root@10.0.0.1', (21080, 80), (20081, 8080), (29000, 9000))]
+    plan = plan_reconcile(CONFIG, want(('web', 'http')), tunnels=running)
+    assert pids(plan['restart']) == [1]
+    assert plan['start'] == [
+        {'hostName': 'web', 'serviceName': 'http', 'remotePort': 80, 'localPort': 21080},
+        # 同一进程中的自定义转发也一并重新启动
+        {'hostName': 'web', 'serviceName': None, 'remotePort': 9000, 'localPort': 29000},
+    ]
+    assert plan['keep'] == []
+
+
+def test_leaves_unmanaged_tunnels_alone_and_reports_missing_services():
+    running = [
+        tunnel(1, 'root@10.0.0.1', (29000, 9000)),
+        tunnel(2, 'nobody@10.9.9.9', (20080, 80)),
+    ]
+    plan = plan_reconcile(CONFIG, want(('web', 'htp')), tunnels=running)
+    assert pids(plan['unmanaged']) == [1, 2]
+    assert plan['missing'] == want(('web', 'htp'))
+    assert plan['stop'] == plan['start'] == []
+
+
+def test_empty_desired_set_stops_every_managed_tunnel():
+    running = [tunnel(1, 'root@10.0.0.1', (20080, 80), (20081, 8080)), tunnel(2, 'root@10.0.0.2', (20432, 5432))]
+    plan = plan_reconcile(CONFIG, [], tunnels=running)
+    assert pids(plan['stop']) == [1, 2]
+
+
+@pytest.fixture
+def actions(monkeypatch):
+    """按发生顺序记录 ('stop', PID) / ('start', 本地端口)"""
+    calls = []
+
+    def fake_stop_tunnels(tunnels, timeout=3.0):
+        calls.extend(('stop', pid) for pid in pids(tunnels))
+        return {'terminated': pids(tunnels), 'killed': [], 'failed': []}
+
+    def fake_start_forwards(config, wanted, **kwargs):
+        calls.extend(('start', w['localPort']) for w in wanted)
+        return [{**w, 'pid': 9, 'status': 'started', 'error': None} for w in wanted]
+
+    monkeypatch.setattr(sshtf_core, 'stop_tunnels', fake_stop_tunnels)
+    monkeypatch.setattr(sshtf_core, 'start_forwards', fake_start_forwards)
+    return calls
+
+
+def test_reconcile_dry_run_and_missing_services_change_nothing(actions):
+    running = [tunnel(1, 'root@10.0.0.2', (20432, 5432))]
+    assert 'started' not in reconcile(CONFIG, want(('web', 'http')), dry_run=True, tunnels=running)
+    reconcile(CONFIG, want(('web', 'http'), ('web', 'nope')), tunnels=running)
+    assert actions == []
+
+
+def test_reconcile_applies_the_plan(actions):
+    running = [tunnel(1, 'root@10.0.0.2', (20432, 5432))]
+    result = reconcile(CONFIG, want(('web', 'http')), tunnels=running)
+    assert sorted(actions) == [('start', 20080), ('stop', 1)]
+    assert result['stopped']['terminated'] == [1]
+    assert [r['status'] for r in result['started']] == ['started']
+
+
+def test_reconcile_restarts_on_freed_ports_after_stopping(actions):
+    running = [tunnel(1, 'root@10.0.0.1', (21080, 80), (20081, 8080))]
+    reconcile(CONFIG, want(('web', 'http')), tunnels=running)
+    assert actions == [('stop', 1), ('start', 21080)]
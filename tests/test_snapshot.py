@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import pytest
+
+import sshtf_core
+from conftest import service, tunnel
+from sshtf_core import load_snapshot, restore_snapshot, snapshot_tunnels
+
+
+CONFIG = {'hosts': [
+    {'hostName': 'web', 'serverIP': '10.0.0.1', 'sshUser': 'root',
+     'services': [service('http', 80, 20080), service('admin', 8080, 20081)]},
+    {'hostName': 'db', 'serverIP': '10.0.0.2', 'sshUser': 'root', 'sshPort': 2222,
+     'services': [service('pg', 5432, 20432)]},
+]}
+
+RUNNING = [
+    tunnel(1, 'root@10.0.0.1', (21080, 80), (29000, 9000)),  # 自增过的端口和一个自定义转发
+    tunnel(2, 'root@10.0.0.2', (20432, 5432), ssh_port=2222),
+    tunnel(3, 'root@10.0.0.1', (22080, 80)),  # 同一服务的重复隧道只记录一次
+    tunnel(4, 'nobody@10.9.9.9', (20090, 90)),  # 不在配置中的主机
+]
+
+
+@pytest.fixture
+def launches(tmp_path, monkeypatch):
+    """快照写到临时目录；替换真正启动 ssh 的部分，记录每次启动的 (主机名, 转发列表)"""
+    launched = []
+
+    def fake_launch(host, forwards):
+        launched.append((host['hostName'], sorted(forwards)))
+        return SimpleNamespace(pid=100 + len(launched))
+
+    monkeypatch.setattr(sshtf_core, 'SNAPSHOT_PATH', tmp_path / 'snapshot.json')
+    monkeypatch.setattr(sshtf_core, 'launch_tunnel', fake_launch)
+    monkeypatch.setattr(sshtf_core, 'wait_tunnel_ready',
+                        lambda process, forwards: {'status': 'ready', 'pid': process.pid, 'elapsedMs': 1})
+    return launched
+
+
+def test_snapshot_then_restore_reopens_the_same_forwards(launches):
+    entries = snapshot_tunnels(CONFIG, tunnels=RUNNING)
+    assert entries == [
+        {'hostName': 'web', 'serviceName': 'http', 'localPort': 21080, 'remotePort': 80},
+        {'hostName': 'web', 'serviceName': None, 'localPort': 29000, 'remotePort': 9000},
+        {'hostName': 'db', 'serviceName': 'pg', 'localPort': 20432, 'remotePort': 5432},
+    ]
+    assert load_snapshot()['tunnels'] == entries
+    assert load_snapshot()['savedAt'] is not None
+
+    results = restore_snapshot(CONFIG, busy_ports=set(), running=[])
+    assert sorted(launches) == [('db', [(20432, 5432)]), ('web', [(21080, 80), (29000, 9000)])]
+    assert all(r['status'] == 'started' for r in results)
+    assert all(r['localPort'] == r['previousPort'] for r in results)
+
+
+def test_restore_moves_to_the_next_port_when_the_old_one_is_taken(launches):
+    snapshot_tunnels(CONFIG, tunnels=RUNNING)
+    results = {r['remotePort']: r for r in restore_snapshot(CONFIG, busy_ports={21080}, running=[])}
+    assert results[80]['previousPort'] == 21080
+    assert results[80]['localPort'] == 21081
+
+
+def test_restore_skips_forwards_that_are_still_running(launches):
+    snapshot_tunnels(CONFIG, tunnels=RUNNING)
+    results = {r['remotePort']: r for r in restore_snapshot(CONFIG, busy_ports=set(), running=RUNNING[1:2])}
+    assert results[5432]['status'] == 'running'
+    assert [host for host, _ in launches] == ['web']
+
+
+def test_empty_snapshot_keeps_the_previous_one(launches):
+    entries = snapshot_tunnels(CONFIG, tunnels=RUNNING)
+    assert snapshot_tunnels(CONFIG, tunnels=[]) == []  # 例如 "关闭全部" 之后再次保存
+    assert load_snapshot()['tunnels'] == entries
+
+
+def test_missing_snapshot_restores_nothing(launches):
+    assert load_snapshot() == {'savedAt': None, 'tunnels': []}
+    assert restore_snapshot(CONFIG, busy_ports=set(), running=[]) == []
+    assert launches == []
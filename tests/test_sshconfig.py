@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import getpass
+import json
+
+from sshtf_sshconfig import import_ssh_config, merge_ssh_hosts, parse_ssh_config
+
+
+def parse(path):
+    return {h['hostName']: h for h in asyncio.run(parse_ssh_config(path))}
+
+
+def test_first_match_wins_with_wildcards(tmp_path):
+    (tmp_path / 'config').write_text(
+        "Host web\n"
+        "    HostName 10.0.0.1\n"
+        "Host w*\n"
+        "    HostName 10.9.9.9\n"
+        "    User deploy\n"
+        "    Port 2222\n"
+        "Host *\n"
+        "    User root\n"
+        "    ProxyJump bastion\n"
+        "Host bastion\n"
+        "    HostName 10.0.0.254\n"
+    )
+    hosts = parse(tmp_path / 'config')
+    assert set(hosts) == {'web', 'bastion'}
+    assert hosts['web']['serverIP'] == '10.0.0.1'
+    assert hosts['web']['sshUser'] == 'deploy'
+    assert hosts['web']['sshPort'] == 2222
+    assert hosts['web']['proxyJump'] == 'bastion'
+    # 跳板机自身也命中 "Host *"，但不能跳转到自己
+    assert hosts['bastion']['sshUser'] == 'root'
+    assert hosts['bastion']['proxyJump'] is None
+
+
+def test_negated_pattern(tmp_path):
+    (tmp_path / 'config').write_text(
+        "Host db cache\n"
+        "Host * !db\n"
+        "    User app\n"
+        "Host *\n"
+        "    User admin\n"
+    )
+    hosts = parse(tmp_path / 'config')
+    assert hosts['cache']['sshUser'] == 'app'
+    assert hosts['db']['sshUser'] == 'admin'
+
+
+def test_include_relative_glob_and_inherited_conditions(tmp_path):
+    (tmp_path / 'conf.d').mkdir()
+    (tmp_path / 'conf.d' / 'a.conf').write_text("Host alpha\n    HostName 10.1.0.1\n")
+    (tmp_path / 'conf.d' / 'b.conf').write_text("Host beta\n    HostName 10.1.0.2\n    Port 2200\n")
+    (tmp_path / 'inner.conf').write_text("Host hidden\n    HostName 10.2.0.1\n")
+    (tmp_path / 'config').write_text(
+        "Include conf.d/*.conf\n"
+        "Host other\n"
+        "    Include inner.conf\n"
+        "Host *\n"
+        "    User shared\n"
+    )
+    hosts = parse(tmp_path / 'config')
+    # Include 在 "Host other" 块内：其中的 hidden 只有在同时匹配 other 时才生效，ssh 无法使用
+    assert set(hosts) == {'alpha', 'beta', 'other'}
+    assert hosts['alpha']['serverIP'] == '10.1.0.1'
+    assert hosts['beta']['sshPort'] == 2200
+    assert hosts['beta']['sshUser'] == 'shared'
+
+
+def test_include_cycles_are_skipped(tmp_path, capsys):
+    (tmp_path / 'config').write_text("Include config\nInclude config other\nHost loop\n    HostName 10.3.0.1\n")
+    (tmp_path / 'other').write_text("Include config\nHost other\n    HostName 10.3.0.2\n")
+    hosts = parse(tmp_path / 'config')
+    assert hosts['loop']['serverIP'] == '10.3.0.1'
+    assert hosts['other']['serverIP'] == '10.3.0.2'
+    warnings = capsys.readouterr().out.splitlines()
+    assert len(warnings) == 3
+    assert all('循环' in line for line in warnings)
+
+
+def test_default_user_without_login_name(tmp_path, monkeypatch):
+    def no_login_name():
+        raise OSError('No username set in the environment')
+
+    monkeypatch.setattr(getpass, 'getuser', no_login_name)
+    (tmp_path / 'config').write_text("Host box\n    HostName 10.5.0.1\n")
+    assert parse(tmp_path / 'config')['box']['sshUser'] == ''
+
+
+def test_host_alias_keeps_case_and_matches_case_insensitively(tmp_path):
+    (tmp_path / 'config').write_text(
+        "Host MyBox\n"
+        "    HostName 10.4.0.1\n"
+        "Host mybox\n"
+        "    Port 2022\n"
+        "Host MY*\n"
+        "    User upper\n"
+        "    HostName ignored\n"
+    )
+    hosts = parse(tmp_path / 'config')
+    assert list(hosts) == ['MyBox']
+    assert hosts['MyBox']['serverIP'] == '10.4.0.1'
+    assert hosts['MyBox']['sshPort'] == 2022
+    assert hosts['MyBox']['sshUser'] == 'upper'
+
+
+def test_reimport_does_not_duplicate_mixed_case_host(tmp_path):
+    ssh_config = tmp_path / 'ssh_config'
+    ssh_config.write_text("Host MyBox\n    HostName 10.4.0.1\n    User me\n")
+    config_path = tmp_path / 'config.json'
+
+    assert import_ssh_config(str(ssh_config), config_path=config_path)
+    assert import_ssh_config(str(ssh_config), config_path=config_path)
+    config = json.loads(config_path.read_text(encoding='utf-8'))
+    assert [h['hostName'] for h in config['hosts']] == ['MyBox']
+    assert config['version'] == 1
+
+
+def test_merge_update_keeps_services():
+    config = {'hosts': [{'hostName': 'web', 'serverIP': '10.0.0.1', 'sshUser': 'old',
+                         'services': [{'serviceName': 'http', 'remotePort': 80, 'localPort': 8080}]}]}
+    parsed = [{'hostName': 'web', 'serverIP': '10.0.0.2', 'sshUser': 'old', 'sshPort': 22,
+               'proxyJump': None, 'identityFile': None, 'services': []}]
+    assert merge_ssh_hosts(config, parsed, 'skip') == (0, 0, 1)
+    assert config['hosts'][0]['serverIP'] == '10.0.0.1'
+    assert merge_ssh_hosts(config, parsed, 'update') == (0, 1, 0)
+    assert config['hosts'][0]['serverIP'] == '10.0.0.2'
+    assert config['hosts'][0]['services'][0]['serviceName'] == 'http'
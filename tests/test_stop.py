@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+import time
+
+import psutil
+import pytest
+
+import sshtf_core
+from sshtf_core import stop_tunnels
+
+# 子进程启动后打印一行，测试据此确认信号处理已经设置好
+SLEEPER = "import signal, time; {setup}; print('ready', flush=True); time.sleep(60)"
+
+
+@pytest.fixture
+def events(monkeypatch):
+    logged = []
+    monkeypatch.setattr(sshtf_core, 'log_event', lambda kind, **fields: logged.append((kind, fields)))
+    return logged
+
+
+@pytest.fixture
+def spawn():
+    """启动一个模拟 ssh 的子进程，返回与 _tracked_tunnels 相同结构的隧道记录"""
+    children = []
+
+    def start(ignore_term=False):
+        setup = 'signal.signal(signal.SIGTERM, signal.SIG_IGN)' if ignore_term else 'pass'
+        child = subprocess.Popen([sys.executable, '-c', SLEEPER.format(setup=setup)],
+                                 stdout=subprocess.PIPE, text=True)
+        children.append(child)
+        assert child.stdout.readline().strip() == 'ready'
+        return {'pid': child.pid, 'proc': psutil.Process(child.pid), 'forwards': [(20080, 80)]}
+
+    yield start
+    for child in children:
+        child.kill()
+        child.wait()
+        child.stdout.close()
+
+
+def test_sigterm_first_then_sigkill_for_stragglers(spawn, events):
+    polite = spawn()
+    stubborn = spawn(ignore_term=True)
+    started = time.monotonic()
+    result = stop_tunnels([polite, stubborn], timeout=0.5)
+    assert result == {'terminated': [polite['pid']], 'killed': [stubborn['pid']], 'failed': []}
+    assert time.monotonic() - started < 3
+    assert not stubborn['proc'].is_running()
+    assert sorted(fields['outcome'] for _, fields in events) == ['killed', 'terminated']
+
+
+def test_all_tunnels_share_one_grace_period(spawn, events):
+    stubborn = [spawn(ignore_term=True) for _ in range(3)]
+    started = time.monotonic()
+    result = stop_tunnels(stubborn, timeout=0.5)
+    # 统一等待一次，而不是每个进程各等 timeout 秒
+    assert time.monotonic() - started < 1.5
+    assert sorted(result['killed']) == sorted(t['pid'] for t in stubborn)
+
+
+def test_already_exited_process_counts_as_terminated(spawn, events):
+    tunnel = spawn()
+    tunnel['proc'].kill()
+    tunnel['proc'].wait(timeout=5)
+    assert stop_tunnels([tunnel], timeout=0.5) == {'terminated': [tunnel['pid']], 'killed': [], 'failed': []}
+
+
+def test_prewarmed_forwards_are_cancelled_instead_of_killed(monkeypatch, events):
+    cancelled = []
+
+    def fake_cancel(control_path, forwards):
+        cancelled.append((control_path, forwards))
+        return True
+
+    monkeypatch.setattr(sshtf_core, '_cancel_mux_forwards', fake_cancel)
+    tunnel = {'pid': 4242, 'controlPath': '/tmp/cm-web', 'forwards': [(20080, 80)]}
+    assert stop_tunnels([tunnel]) == {'terminated': [4242], 'killed': [], 'failed': []}
+    assert cancelled == [('/tmp/cm-web', [(20080, 80)])]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+from sshtf_core import transport_args
+from sshtf_transport import bench_args, measure_transport
+
+HOST = {'hostName': 'web', 'serverIP': '10.0.0.1', 'sshUser': 'root'}
+
+FAKE_SSH = '''#!{python}
+import os, sys
+if os.environ.get('FAKE_SSH_FAIL'):
+    sys.stderr.write("debug1: connecting\\nUnable to negotiate with 10.0.0.1 port 22: no matching cipher found\\n")
+    sys.exit(255)
+sys.stderr.write("banner line\\n" * 100000)  # 远大于管道缓冲区
+sys.stderr.flush()
+while data := os.read(0, 65536):
+    os.write(1, data)
+'''
+
+
+@pytest.fixture
+def fake_ssh(tmp_path, monkeypatch):
+    """PATH 中的 ssh 换成一个本地回显程序 (代替远程的 cat)"""
+    if os.name == 'nt':
+        pytest.skip('需要可执行的脚本')
+    script = tmp_path / 'ssh'
+    script.write_text(FAKE_SSH.format(python=sys.executable))
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+
+def test_transport_args():
+    assert transport_args({'cipher': 'aes128-gcm@openssh.com', 'compression': True}) == \
+        ['-c', 'aes128-gcm@openssh.com', '-C']
+    assert transport_args({'compression': False}) == ['-o', 'Compression=no']
+    assert transport_args({}) == []
+
+
+def test_bench_args_runs_cat_without_the_master_connection():
+    args = bench_args(HOST, {'cipher': 'chacha20-poly1305@openssh.com'}, timeout=5)
+    assert args[:2] == ['ssh', '-o']
+    assert 'ControlPath=none' in args
+    assert args[-2:] == ['root@10.0.0.1', 'cat']
+
+
+def test_verbose_stderr_does_not_stall_the_measurement(fake_ssh):
+    result = measure_transport(HOST, {'cipher': None}, b'y' * (1024 * 1024), rounds=3, timeout=10)
+    assert result['ok'], result['error']
+    assert result['latencyMs'] is not None
+    assert result['throughputMBps'] > 0
+
+
+def test_ssh_errors_are_reported_from_stderr(fake_ssh, monkeypatch):
+    monkeypatch.setenv('FAKE_SSH_FAIL', '1')
+    result = measure_transport(HOST, {'cipher': 'none'}, b'y', rounds=1, timeout=10)
+    assert not result['ok']
+    assert result['error'] == 'Unable to negotiate with 10.0.0.1 port 22: no matching cipher found'
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import sshtf_web
+from conftest import service
+
+
+def new_host(name, *services):
+    return {'hostName': name, 'serverIP': '10.0.1.1', 'sshUser': 'root',
+            'services': [service(s, 22, p) for s, p in services]}
+
+
+@pytest.fixture
+def config_path(tmp_path, monkeypatch):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({
+        'version': 3,
+        'hosts': [
+            {'hostName': 'web', 'serverIP': '10.0.0.1', 'sshUser': 'root',
+             'services': [service('http', 80, 20080)]},
+            {'hostName': 'db', 'serverIP': '10.0.0.2', 'sshUser': 'root', 'services': []},
+        ],
+        'failover': [{'serviceName': 'api', 'remotePort': 8000, 'localPort': 20800, 'hosts': ['web', 'db']}],
+    }), encoding='utf-8')
+    monkeypatch.setattr(sshtf_web, 'CONFIG_PATH', path)
+    monkeypatch.setattr(sshtf_web, '_config_cache', None)
+    monkeypatch.setattr(sshtf_web, '_config_cache_stat', None)
+    monkeypatch.setattr(sshtf_web, '_config_response_cache', None)
+    monkeypatch.setattr(sshtf_web, 'listening_ports', lambda: set())
+    return path
+
+
+@pytest.fixture
+def client(config_path):
+    return TestClient(sshtf_web.app)
+
+
+def saved(config_path):
+    return json.loads(config_path.read_text(encoding='utf-8'))
+
+
+# --- 批量操作 ---
+
+def test_batch_hosts_applies_all_operations(client, config_path):
+    r = client.post('/api/hosts/batch', json=[
+        {'op': 'create', 'hostName': 'cache', 'host': new_host('cache', ('redis', 0))},
+        {'op': 'delete', 'hostName': 'db'},
+    ])
+    assert r.status_code == 200, r.text
+    assert r.json()['applied'] is True
+    config = saved(config_path)
+    assert [h['hostName'] for h in config['hosts']] == ['web', 'cache']
+    assert config['hosts'][1]['services'][0]['localPort'] == 20000  # localPort 为 0 时自动分配
+    assert config['version'] == 4
+
+
+def test_batch_hosts_rolls_back_when_one_operation_fails(client, config_path):
+    before = config_path.read_text(encoding='utf-8')
+    r = client.post('/api/hosts/batch', json=[
+        {'op': 'create', 'hostName': 'cache', 'host': new_host('cache')},
+        {'op': 'delete', 'hostName': 'missing'},
+        {'op': 'delete', 'hostName': 'db'},
+    ])
+    assert r.status_code == 400
+    body = r.json()
+    assert body['applied'] is False
+    assert [item['ok'] for item in body['results']] == [True, False, True]
+    assert config_path.read_text(encoding='utf-8') == before
+
+
+def test_batch_hosts_rejects_port_conflicts_within_the_batch(client, config_path):
+    before = config_path.read_text(encoding='utf-8')
+    r = client.post('/api/hosts/batch', json=[
+        {'op': 'create', 'hostName': 'a', 'host': new_host('a', ('ssh', 20300))},
+        {'op': 'create', 'hostName': 'b', 'host': new_host('b', ('ssh', 20300))},
+        {'op': 'create', 'hostName': 'c', 'host': new_host('c', ('ssh', 20800))},
+    ])
+    assert r.status_code == 400
+    results = r.json()['results']
+    assert [item['ok'] for item in results] == [False, False, False]
+    assert '故障转移服务' in results[2]['detail']
+    assert config_path.read_text(encoding='utf-8') == before
+
+
+def test_batch_host_create_with_mismatched_name_is_rejected(client, config_path):
+    r = client.post('/api/hosts/batch', json=[
+        {'op': 'create', 'hostName': 'q', 'host': new_host('qq')},
+    ])
+    assert r.status_code == 400
+    assert "不一致" in r.json()['results'][0]['detail']
+    assert [h['hostName'] for h in saved(config_path)['hosts']] == ['web', 'db']
+
+
+def test_batch_services_rolls_back(client, config_path):
+    r = client.post('/api/services/batch', json=[
+        {'op': 'create', 'hostName': 'db', 'service': service('pg', 5432)},
+        {'op': 'update', 'hostName': 'web', 'serviceName': 'nope',
+         'service': service('nope', 1)},
+    ])
+    assert r.status_code == 400
+    assert [item['ok'] for item in r.json()['results']] == [True, False]
+    assert saved(config_path)['hosts'][1]['services'] == []
+
+
+# --- ETag / If-Match ---
+
+def test_get_config_returns_etag_and_honours_if_none_match(client):
+    r = client.get('/api/config')
+    assert r.status_code == 200
+    assert r.headers['ETag'] == '"3"'
+    r = client.get('/api/config', headers={'If-None-Match': 'W/"3"'})
+    assert r.status_code == 304
+
+
+def test_stale_if_match_is_rejected_with_412(client, config_path):
+    before = config_path.read_text(encoding='utf-8')
+    r = client.post('/api/hosts', json=new_host('cache'), headers={'If-Match': '"2"'})
+    assert r.status_code == 412
+    assert config_path.read_text(encoding='utf-8') == before
+
+    r = client.post('/api/hosts/batch', json=[{'op': 'delete', 'hostName': 'db'}], headers={'If-Match': '"2"'})
+    assert r.status_code == 412
+    assert config_path.read_text(encoding='utf-8') == before
+
+
+def test_matching_if_match_saves_and_returns_new_etag(client, config_path):
+    r = client.post('/api/hosts', json=new_host('cache'), headers={'If-Match': '"3"'})
+    assert r.status_code == 200, r.text
+    assert r.headers['ETag'] == '"4"'
+    # 旧的 ETag 已失效
+    r = client.delete('/api/hosts/cache', headers={'If-Match': '"3"'})
+    assert r.status_code == 412
+    r = client.delete('/api/hosts/cache', headers={'If-Match': '*'})
+    assert r.status_code == 200
+    assert saved(config_path)['version'] == 5
+
+
+def test_put_config_uses_body_version_as_if_match(client, config_path):
+    config = client.get('/api/config').json()
+    config['version'] = 1
+    assert client.put('/api/config', json=config).status_code == 412
+    config['version'] = 3
+    r = client.put('/api/config', json=config)
+    assert r.status_code == 200, r.text
+    assert saved(config_path)['version'] == 4
+
+
+def test_external_edit_changes_the_etag(client, config_path):
+    assert client.get('/api/config').headers['ETag'] == '"3"'
+    config = saved(config_path)
+    config['version'] = 7
+    config_path.write_text(json.dumps(config) + '\n', encoding='utf-8')  # 大小不同，缓存一定失效
+    assert client.get('/api/config').headers['ETag'] == '"7"'
+    assert client.post('/api/hosts', json=new_host('cache'), headers={'If-Match': '"3"'}).status_code == 412
+
+
+
+# --- 配置响应缓存与 gzip ---
+
+def big_config(client):
+    """往配置里加入足够多的主机，使 GET /api/config 的响应超过 gzip 阈值"""
+    for i in range(10):
+        r = client.post('/api/hosts', json=new_host(f'host-{i:02d}', ('ssh', 0), ('http', 0)))
+        assert r.status_code == 200, r.text
+    assert len(client.get('/api/config', headers={'Accept-Encoding': 'identity'}).content) \
+        >= sshtf_web.CONFIG_GZIP_MIN_SIZE
+
+
+def test_cached_config_response_is_replaced_after_a_save(client):
+    first = client.get('/api/config')
+    assert [h['hostName'] for h in first.json()['hosts']] == ['web', 'db']
+    assert client.post('/api/hosts', json=new_host('cache')).status_code == 200
+
+    r = client.get('/api/config')
+    assert r.headers['ETag'] == '"4"'
+    assert [h['hostName'] for h in r.json()['hosts']] == ['web', 'db', 'cache']
+    # 保存之前的 ETag 不再命中 304
+    assert client.get('/api/config', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+    assert client.get('/api/config', headers={'If-None-Match': '"4"'}).status_code == 304
+
+
+def test_small_config_is_not_gzipped(client):
+    r = client.get('/api/config', headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert 'Content-Encoding' not in r.headers
+    assert r.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_large_config_is_gzipped_once_per_version(client, monkeypatch):
+    big_config(client)
+    compressed = []
+    real_compress = sshtf_web.gzip.compress
+
+    def counting_compress(data, **kwargs):
+        compressed.append(data)
+        return real_compress(data, **kwargs)
+
+    monkeypatch.setattr(sshtf_web.gzip, 'compress', counting_compress)
+
+    plain = client.get('/api/config', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    for _ in range(3):
+        r = client.get('/api/config', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert r.json() == plain.json()  # 客户端自动解压
+    assert len(compressed) == 1
+
+    # 新版本需要重新压缩
+    client.delete('/api/hosts/host-00')
+    r = client.get('/api/config', headers={'Accept-Encoding': 'gzip'})
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert 'host-00' not in [h['hostName'] for h in r.json()['hosts']]
+    assert len(compressed) == 2
+
+
+# --- 本地端口冲突与自动分配 ---
+
+def test_new_port_conflicts_are_rejected_with_409(client, config_path):
+    r = client.post('/api/hosts/db/services', json=service('pg', 5432, 20080))
+    assert r.status_code == 409
+    assert "'web/http'" in r.json()['detail']
+    r = client.post('/api/hosts/db/services', json=service('pg', 5432, 20800))
+    assert r.status_code == 409
+    assert "故障转移服务 'api'" in r.json()['detail']
+    assert saved(config_path)['hosts'][1]['services'] == []
+
+
+def test_local_port_zero_skips_claimed_and_listening_ports(client, config_path, monkeypatch):
+    monkeypatch.setattr(sshtf_web, 'listening_ports', lambda: {20000, 20001})
+    assert client.get('/api/hosts/db/next-port').json() == {'localPort': 20002}
+    r = client.post('/api/hosts/db/services', json=service('pg', 5432))
+    assert r.status_code == 200, r.text
+    assert saved(config_path)['hosts'][1]['services'][0]['localPort'] == 20002
+
+
+def test_existing_conflicts_are_listed_but_do_not_block_other_edits(client, config_path):
+    config = saved(config_path)
+    config['hosts'][1]['services'] = [service('pg', 5432, 20080)]
+    config_path.write_text(json.dumps(config), encoding='utf-8')
+
+    conflicts = client.get('/api/ports/conflicts').json()
+    assert conflicts == [{'localPort': 20080, 'services': [{'hostName': 'web', 'serviceName': 'http'},
+                                                           {'hostName': 'db', 'serviceName': 'pg'}]}]
+    r = client.post('/api/hosts', json=new_host('cache', ('redis', 0)))
+    assert r.status_code == 200, r.text
+
+
+# --- 隧道组 ---
+
+def test_group_members_must_exist(client, config_path):
+    r = client.post('/api/groups', json={'groupName': 'g', 'members': [{'hostName': 'web', 'serviceName': 'ftp'}]})
+    assert r.status_code == 404
+    r = client.post('/api/groups', json={'groupName': 'g', 'members': [{'hostName': 'web', 'serviceName': 'http'}] * 2})
+    assert r.status_code == 400
+    assert 'groups' not in saved(config_path)
+
+
+def test_deleting_a_service_removes_it_from_groups(client, config_path):
+    r = client.post('/api/groups', json={'groupName': 'g', 'members': [{'hostName': 'web', 'serviceName': 'http'}]})
+    assert r.status_code == 200, r.text
+    assert client.delete('/api/hosts/web/services/http').status_code == 200
+    assert saved(config_path)['groups'] == [{'groupName': 'g', 'members': []}]
+
+
+# --- 跨进程的配置锁 ---
+
+def test_cancelled_write_does_not_keep_the_config_lock(config_path):
+    fcntl = pytest.importorskip('fcntl')
+    lock_path = config_path.with_name(config_path.name + '.lock')
+
+    async def run():
+        with open(lock_path, 'a+b') as held:
+            fcntl.flock(held, fcntl.LOCK_EX)  # 模拟正在写入的其他进程
+            task = asyncio.create_task(sshtf_web.save_config(sshtf_web.Config(hosts=[])))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        await asyncio.sleep(0.1)  # 等待线程拿到锁后释放
+        with open(lock_path, 'a+b') as probe:
+            fcntl.flock(probe, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return await sshtf_web.save_config(sshtf_web.Config(hosts=[]))
+
+    assert asyncio.run(run()) == 4